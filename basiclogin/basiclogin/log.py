@@ -0,0 +1,103 @@
+"""
+Logging pipeline.
+
+Request threads only put records on a queue (``QueuedStreamHandler``); a
+listener thread writes them out, so a slow stdout never holds up a request.
+Records are rendered as text or as one JSON object per line (``LOG_FORMAT``),
+including any structured fields passed as ``extra={'data': {...}}``.
+
+Request bodies can hold names and phone numbers, so they are only logged at
+DEBUG and only for a sample of requests (``LOG_REQUEST_BODY_SAMPLE_RATE``);
+see ``log_request_body``.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+
+class QueuedStreamHandler(QueueHandler):
+    """
+    Queue records on the calling thread and write them to ``stream`` (stderr by
+    default) from a listener thread.
+
+    The listener is started on first use in each process, so a worker forked
+    from a process that already logged gets a listener of its own.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # A queue inherited across a fork may have lost its reader mid-record
+            self.queue = queue.SimpleQueue()
+            self.listener = QueueListener(self.queue, self.target)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Write out everything still queued and stop the listener."""
+        with self._start_lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+
+class TextFormatter(logging.Formatter):
+    """The usual text format, followed by the record's structured fields as key=value pairs."""
+
+    def format(self, record):
+        line = super().format(record)
+        data = getattr(record, 'data', None)
+        if data:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in data.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the record's structured fields at the top level."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'data', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def log_request_body(logger, label, data):
+    """
+    Log ``data`` at DEBUG for a sample of requests.
+
+    Nothing is rendered unless DEBUG is enabled for ``logger`` and the request
+    falls in the ``LOG_REQUEST_BODY_SAMPLE_RATE`` sample.
+    """
+    rate = settings.LOG_REQUEST_BODY_SAMPLE_RATE
+    if rate and logger.isEnabledFor(logging.DEBUG) and random.random() < rate:
+        logger.debug("%s request body", label, extra={'data': {'body': data}})
@@ -42,6 +42,9 @@ INSTALLED_APPS = [
     'corsheaders',
     'rest_framework',
     'users',
+    'webhook',
+    'metrics',
+    'benchmarks',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -51,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'metrics.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -145,3 +149,129 @@ APPEND_SLASH = False
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Outbound WhatsApp message queue, drained by `manage.py run_outbound_worker`
+OUTBOUND_WORKER_THREADS = int(os.environ.get('OUTBOUND_WORKER_THREADS', '4'))
+OUTBOUND_BATCH_SIZE = int(os.environ.get('OUTBOUND_BATCH_SIZE', '50'))
+OUTBOUND_POLL_INTERVAL = float(os.environ.get('OUTBOUND_POLL_INTERVAL', '1'))
+OUTBOUND_MAX_ATTEMPTS = int(os.environ.get('OUTBOUND_MAX_ATTEMPTS', '5'))
+# Retry delay in seconds, doubled after every failed attempt up to the maximum
+OUTBOUND_RETRY_BACKOFF = float(os.environ.get('OUTBOUND_RETRY_BACKOFF', '30'))
+OUTBOUND_RETRY_BACKOFF_MAX = float(os.environ.get('OUTBOUND_RETRY_BACKOFF_MAX', '3600'))
+# Messages claimed longer than this are assumed abandoned by a dead worker
+OUTBOUND_CLAIM_TIMEOUT = int(os.environ.get('OUTBOUND_CLAIM_TIMEOUT', '300'))
+
+# WhatsApp gateway client
+WHAPI_TOKEN = os.environ.get('WHAPI_TOKEN', '')
+GATEWAY_URL = os.environ.get('GATEWAY_URL', 'https://gate.whapi.cloud')
+# http (GATEWAY_URL), memory (keep messages, send nothing), simulated (an
+# in-process gateway as below) or replay (play back GATEWAY_RECORDING)
+GATEWAY_TRANSPORT = os.environ.get('GATEWAY_TRANSPORT', 'http')
+# The simulated gateway: seconds per send, share of 500s and sends per second
+# before it answers 429 (0 = never)
+GATEWAY_SIMULATED_LATENCY = float(os.environ.get('GATEWAY_SIMULATED_LATENCY', '0.1'))
+GATEWAY_SIMULATED_ERROR_RATE = float(os.environ.get('GATEWAY_SIMULATED_ERROR_RATE', '0'))
+GATEWAY_SIMULATED_RATE_LIMIT = float(os.environ.get('GATEWAY_SIMULATED_RATE_LIMIT', '0'))
+# JSON lines file every gateway exchange is appended to, or the one replayed
+GATEWAY_RECORDING = os.environ.get('GATEWAY_RECORDING', '')
+# Seconds to wait for a connection and for the gateway's response
+GATEWAY_CONNECT_TIMEOUT = float(os.environ.get('GATEWAY_CONNECT_TIMEOUT', '3.05'))
+GATEWAY_READ_TIMEOUT = float(os.environ.get('GATEWAY_READ_TIMEOUT', '10'))
+# Keep-alive connections held per process; one per sender thread is enough
+GATEWAY_POOL_SIZE = int(os.environ.get('GATEWAY_POOL_SIZE', str(OUTBOUND_WORKER_THREADS)))
+# Token buckets in front of the gateway, in messages per second per process;
+# a rate of 0 turns the limit off
+GATEWAY_RATE_LIMIT = float(os.environ.get('GATEWAY_RATE_LIMIT', '10'))
+GATEWAY_RATE_BURST = int(os.environ.get('GATEWAY_RATE_BURST', '20'))
+GATEWAY_RECIPIENT_RATE_LIMIT = float(os.environ.get('GATEWAY_RECIPIENT_RATE_LIMIT', '0.2'))
+GATEWAY_RECIPIENT_RATE_BURST = int(os.environ.get('GATEWAY_RECIPIENT_RATE_BURST', '5'))
+# Pending messages to one recipient queued within this many seconds of each
+# other are sent as a single digest; 0 sends every message on its own
+OUTBOUND_COALESCE_WINDOW = float(os.environ.get('OUTBOUND_COALESCE_WINDOW', '60'))
+
+# Reminder scheduler (`manage.py run_reminder_scheduler`)
+REMINDER_WINDOWS = [int(hours) for hours in os.environ.get('REMINDER_WINDOWS', '24,6,2,1').split(',')]
+REMINDER_SCHEDULER_INTERVAL = float(os.environ.get('REMINDER_SCHEDULER_INTERVAL', '60'))
+
+# Webhook ingestion: gateway message IDs seen recently are acknowledged without
+# touching the database. The unique ingestion log catches anything older.
+INBOUND_DEDUP_TTL = float(os.environ.get('INBOUND_DEDUP_TTL', '3600'))
+INBOUND_DEDUP_MAX_SIZE = int(os.environ.get('INBOUND_DEDUP_MAX_SIZE', '10000'))
+# Days the ingestion log keeps a message ID, pruned by the reminder scheduler;
+# 0 keeps every row
+INBOUND_LOG_RETENTION_DAYS = float(os.environ.get('INBOUND_LOG_RETENTION_DAYS', '7'))
+
+# Per-process cache of contacts (name -> phone number, phone number -> user)
+CONTACT_DIRECTORY_SIZE = int(os.environ.get('CONTACT_DIRECTORY_SIZE', '10000'))
+# Seconds before an entry is re-read, bounding staleness across processes
+CONTACT_DIRECTORY_TTL = float(os.environ.get('CONTACT_DIRECTORY_TTL', '300'))
+
+# Cache: locmem (per process, the default), file (shared by the processes on
+# one host) or redis (any Redis-protocol server, shared by every host)
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'faff'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://localhost:6379/0'),
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION') or CACHE_BACKENDS[CACHE_BACKEND][1],
+    }
+}
+# Seconds a rendered task list is kept; changes invalidate it sooner
+TASK_LIST_CACHE_TIMEOUT = int(os.environ.get('TASK_LIST_CACHE_TIMEOUT', '300'))
+
+# Longest text message the gateway accepts; longer replies are split
+WHATSAPP_MESSAGE_LIMIT = int(os.environ.get('WHATSAPP_MESSAGE_LIMIT', '4096'))
+# Tasks shown per page of LIST and TASKS FOR
+LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', '10'))
+
+# Reminder jobs started from the API (`POST /api/tasks/send-reminders/`)
+REMINDER_JOB_CHUNK_SIZE = int(os.environ.get('REMINDER_JOB_CHUNK_SIZE', '500'))
+# A running job without a heartbeat for this many seconds is resumed elsewhere
+REMINDER_JOB_STALE_AFTER = int(os.environ.get('REMINDER_JOB_STALE_AFTER', '120'))
+
+# Logging: records are queued on the request thread and written to stderr by
+# a listener thread (see basiclogin/log.py), as text or JSON lines
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+# Share of requests whose bodies are logged, when LOG_LEVEL is DEBUG
+LOG_REQUEST_BODY_SAMPLE_RATE = float(os.environ.get('LOG_REQUEST_BODY_SAMPLE_RATE', '0'))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {
+            '()': 'basiclogin.log.TextFormatter',
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+        'json': {
+            '()': 'basiclogin.log.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'queue': {
+            'class': 'basiclogin.log.QueuedStreamHandler',
+            'formatter': LOG_FORMAT,
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        'django': {
+            'handlers': ['queue'],
+            'level': os.environ.get('DJANGO_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        # Per-request metrics (query, gateway and latency totals), one line
+        # per request; also served from `GET /metrics/`
+        'metrics': {
+            'level': os.environ.get('METRICS_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
@@ -0,0 +1,72 @@
+import io
+import json
+import logging
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from .log import QueuedStreamHandler, JsonFormatter, TextFormatter, log_request_body
+
+
+class RecordingStream(io.StringIO):
+    """Remembers which threads wrote to it."""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = set()
+
+    def write(self, text):
+        self.threads.add(threading.current_thread().name)
+        return super().write(text)
+
+
+class LoggingPipelineTests(SimpleTestCase):
+
+    def make_logger(self, handler):
+        logger = logging.getLogger(f'test.{self.id()}')
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def test_records_are_written_off_the_calling_thread(self):
+        stream = RecordingStream()
+        handler = QueuedStreamHandler(stream)
+        handler.setFormatter(TextFormatter('%(levelname)s %(message)s'))
+        logger = self.make_logger(handler)
+
+        logger.info("Task %s done", 7, extra={'data': {'user': 3}})
+        handler.stop()
+
+        self.assertEqual(stream.getvalue(), "INFO Task 7 done user=3\n")
+        self.assertNotIn(threading.current_thread().name, stream.threads)
+
+    def test_json_lines_carry_structured_fields(self):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        logger = self.make_logger(handler)
+
+        logger.warning("Slow request", extra={'data': {'latency': 1.5}})
+        handler.stop()
+
+        line = json.loads(stream.getvalue())
+        self.assertEqual(line['message'], "Slow request")
+        self.assertEqual(line['level'], "WARNING")
+        self.assertEqual(line['latency'], 1.5)
+
+    def test_request_bodies_are_only_logged_when_sampled(self):
+        logger = logging.getLogger('test.request_bodies')
+        logger.setLevel(logging.DEBUG)
+
+        with override_settings(LOG_REQUEST_BODY_SAMPLE_RATE=0), self.assertNoLogs(logger):
+            log_request_body(logger, "Login", {"name": "Asha"})
+
+        with override_settings(LOG_REQUEST_BODY_SAMPLE_RATE=1), self.assertLogs(logger, 'DEBUG') as logs:
+            log_request_body(logger, "Login", {"name": "Asha"})
+        self.assertEqual(logs.records[0].data, {'body': {"name": "Asha"}})
+
+        logger.setLevel(logging.INFO)
+        with override_settings(LOG_REQUEST_BODY_SAMPLE_RATE=1), self.assertNoLogs(logger):
+            log_request_body(logger, "Login", {"name": "Asha"})
@@ -21,5 +21,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('users.urls')),
     path('webhooks/messages', include('webhook.urls')),
+    path('metrics/', include('metrics.urls')),
 ]
 
@@ -0,0 +1,104 @@
+"""
+Seeded data for the benchmarks.
+
+The same seed and size always produce the same users, tasks and
+assignments, so query counts and timings can be compared between runs.
+"""
+import datetime
+import random
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from users.models import DEFAULT_WORKSPACE_ID, User, Task, Workspace
+
+
+# Tasks generated for each named size; there is one user per ten tasks
+SIZES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1M': 1_000_000,
+}
+
+BATCH_SIZE = 5_000
+
+
+def phone_number(index):
+    return f"91{7_000_000_000 + index}"
+
+
+def user_name(index):
+    return f"User {index:07d}"
+
+
+def seeded_uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def seed_data(task_count, seed=0, now=None, workspaces=1):
+    """
+    Insert ``task_count`` in-progress tasks and ``task_count // 10`` users.
+
+    Each task has one to three assignees; every assignee but the first has
+    finished it half of the time. Deadlines fall between a week ago and two weeks ahead, so
+    about one task in twenty is due within a day.
+
+    With several ``workspaces``, user ``i`` is in workspace ``i % workspaces``
+    and each task is created and assigned within one workspace. A single
+    workspace is the default one, and gives the same data as before
+    workspaces existed.
+
+    Returns:
+        int: Number of users created.
+    """
+    rng = random.Random(seed)
+    now = now or timezone.now()
+    user_count = max(task_count // 10, 50)
+
+    with transaction.atomic():
+        if workspaces == 1:
+            workspace_ids = [DEFAULT_WORKSPACE_ID]
+        else:
+            workspace_ids = [workspace.id for workspace in Workspace.objects.bulk_create([
+                Workspace(id=seeded_uuid(rng), name=f"Team {i}") for i in range(workspaces)
+            ])]
+
+        users = []
+        for start in range(0, user_count, BATCH_SIZE):
+            users.extend(User.objects.bulk_create([
+                User(
+                    id=seeded_uuid(rng),
+                    name=user_name(i),
+                    phone_number=phone_number(i),
+                    workspace_id=workspace_ids[i % workspaces],
+                )
+                for i in range(start, min(start + BATCH_SIZE, user_count))
+            ]))
+        user_ids = [user.id for user in users]
+        members = [user_ids[team::workspaces] for team in range(workspaces)]
+
+        for start in range(0, task_count, BATCH_SIZE):
+            tasks = []
+            assigned = []
+            completed = []
+            for i in range(start, min(start + BATCH_SIZE, task_count)):
+                team = rng.randrange(workspaces) if workspaces > 1 else 0
+                assignees = rng.sample(members[team], rng.randint(1, 3))
+                finished = [user_id for user_id in assignees[1:] if rng.random() < 0.5]
+                task = Task(
+                    id=seeded_uuid(rng),
+                    workspace_id=workspace_ids[team],
+                    description=f"Task {i}",
+                    created_by_id=rng.choice(members[team]),
+                    deadline=now + datetime.timedelta(minutes=rng.randint(-7 * 24 * 60, 14 * 24 * 60)),
+                    assigned_count=len(assignees),
+                    completed_count=len(finished),
+                )
+                tasks.append(task)
+                assigned.extend(Task.assigned_to.through(task_id=task.id, user_id=user_id) for user_id in assignees)
+                completed.extend(Task.completed_by.through(task_id=task.id, user_id=user_id) for user_id in finished)
+            Task.objects.bulk_create(tasks)
+            Task.assigned_to.through.objects.bulk_create(assigned)
+            Task.completed_by.through.objects.bulk_create(completed)
+    return user_count
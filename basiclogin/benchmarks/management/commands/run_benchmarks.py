@@ -0,0 +1,163 @@
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from benchmarks.data import SIZES, seed_data
+from benchmarks.report import BASELINE_PATH, compare, format_table, load_baseline, save_baseline
+from benchmarks.scenarios import SCENARIOS, run_scenarios
+from webhook.transports import Replayer, SimulatedGateway
+
+
+class Command(BaseCommand):
+    help = 'Run the benchmark scenarios against seeded data in a throwaway database and compare with the baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size',
+            choices=list(SIZES),
+            default='1k',
+            help='Number of tasks to seed'
+        )
+        parser.add_argument(
+            '--scenario',
+            action='append',
+            choices=list(SCENARIOS),
+            dest='scenarios',
+            help='Scenario to run; repeat for several (defaults to all)'
+        )
+        parser.add_argument(
+            '--workspaces',
+            type=int,
+            default=1,
+            help='Spread the seeded users and tasks over this many workspaces'
+        )
+        parser.add_argument(
+            '--ops',
+            type=int,
+            default=200,
+            help='Requests per request scenario'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Seed for the data and the scenarios'
+        )
+        parser.add_argument(
+            '--baseline',
+            default=str(BASELINE_PATH),
+            help='Baseline file to compare with'
+        )
+        parser.add_argument(
+            '--update-baseline',
+            action='store_true',
+            help='Store these results as the baseline for this size instead of comparing'
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.5,
+            help='How much worse throughput and p99 may get, as a fraction of the baseline'
+        )
+        parser.add_argument(
+            '--queries-only',
+            action='store_true',
+            help='Only compare query counts, e.g. on a machine slower than the one that made the baseline'
+        )
+        parser.add_argument(
+            '--output',
+            help='Also write the results to this JSON file'
+        )
+        parser.add_argument(
+            '--gateway-latency',
+            type=float,
+            default=0.0,
+            help='Seconds the stand-in gateway takes per send in the delivery scenario'
+        )
+        parser.add_argument(
+            '--gateway-error-rate',
+            type=float,
+            default=0.0,
+            help="Share of the delivery scenario's sends the stand-in answers with a 500"
+        )
+        parser.add_argument(
+            '--gateway-rate-limit',
+            type=float,
+            default=0.0,
+            help='Sends per second before the stand-in answers 429 (0 = never)'
+        )
+        parser.add_argument(
+            '--gateway-replay',
+            metavar='RECORDING',
+            help='Have the stand-in replay this gateway recording instead of simulating'
+        )
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        size = options['size']
+
+        # Seeded rows go into a throwaway test database, never the real one
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite':
+            # The delivery scenario writes from several threads, which an
+            # in-memory SQLite database can't take
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'faff-benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        if options['verbosity'] < 2:
+            logging.disable(logging.INFO)
+        try:
+            started = time.perf_counter()
+            seed_data(SIZES[size], seed=options['seed'], workspaces=options['workspaces'])
+            self.stdout.write(f"Seeded {SIZES[size]} tasks in {time.perf_counter() - started:.1f}s")
+
+            results = run_scenarios(
+                names, random.Random(options['seed']), options['ops'], self.gateway(options), options['workspaces'],
+            )
+        finally:
+            logging.disable(logging.NOTSET)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        summaries = {name: result.summary() for name, result in results.items()}
+        self.stdout.write(format_table(summaries))
+        # Data spread over several workspaces is different data, with its own baseline
+        key = size if options['workspaces'] == 1 else f"{size}/{options['workspaces']} workspaces"
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({key: summaries}, f, indent=2)
+
+        baseline = load_baseline(options['baseline'])
+        if options['update_baseline']:
+            baseline[key] = {**baseline.get(key, {}), **summaries}
+            save_baseline(baseline, options['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline for {key} updated"))
+            return
+
+        if key not in baseline:
+            self.stdout.write(self.style.WARNING(f"No baseline for {key}; run with --update-baseline to store one"))
+            return
+        regressions = compare(
+            summaries, baseline[key], tolerance=options['tolerance'], timing=not options['queries_only'],
+        )
+        if regressions:
+            raise CommandError("Regressions against the baseline:\n" + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions against the {key} baseline"))
+
+    def gateway(self, options):
+        """The delivery scenario's stand-in behaviour; the baseline assumes the default."""
+        if options['gateway_replay']:
+            return Replayer(options['gateway_replay'])
+        return SimulatedGateway(
+            latency=options['gateway_latency'],
+            error_rate=options['gateway_error_rate'],
+            rate_limit=options['gateway_rate_limit'],
+            seed=options['seed'],
+        )
@@ -0,0 +1,68 @@
+"""
+Benchmark reports and baseline comparison.
+
+The baseline (``benchmarks/baseline.json``) holds the summary of every
+scenario per data size. Query counts are deterministic for a given seed, so
+any increase is a regression. Throughput and p99 latency depend on the
+machine, so they only fail when they are worse by more than a tolerance, and
+can be left out of the comparison altogether.
+"""
+import json
+from pathlib import Path
+
+
+BASELINE_PATH = Path(__file__).with_name('baseline.json')
+
+COLUMNS = ['scenario', 'count', 'unit', 'throughput', 'p50_ms', 'p99_ms', 'queries_per_op', 'max_queries']
+
+
+def format_table(summaries):
+    """Render scenario summaries as a fixed-width text table."""
+    rows = [COLUMNS] + [
+        [name, *(str(summary[column]) for column in COLUMNS[1:])]
+        for name, summary in summaries.items()
+    ]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(COLUMNS))]
+    return '\n'.join('  '.join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def load_baseline(path=BASELINE_PATH):
+    path = Path(path)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def save_baseline(baseline, path=BASELINE_PATH):
+    Path(path).write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+
+
+def compare(summaries, baseline, tolerance=0.5, timing=True):
+    """
+    Compare scenario summaries with their baseline.
+
+    Args:
+        summaries (dict): Scenario name -> summary, for one data size.
+        baseline (dict): The baseline summaries for the same size.
+        tolerance (float): How much worse throughput and p99 may get, as a
+            fraction of the baseline.
+        timing (bool): Whether to compare throughput and p99 at all.
+
+    Returns:
+        list: A description of every regression; empty if there are none.
+    """
+    regressions = []
+    for name, summary in summaries.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for column in ('queries_per_op', 'max_queries'):
+            if summary[column] > expected[column]:
+                regressions.append(f"{name}: {column} rose from {expected[column]} to {summary[column]}")
+        if not timing:
+            continue
+        if summary['throughput'] < expected['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput fell from {expected['throughput']} to {summary['throughput']} {summary['unit']}/s"
+            )
+        if summary['p99_ms'] > expected['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 rose from {expected['p99_ms']} ms to {summary['p99_ms']} ms")
+    return regressions
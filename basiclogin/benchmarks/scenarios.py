@@ -0,0 +1,280 @@
+"""
+Benchmark scenarios.
+
+Each scenario runs a number of operations against seeded data and returns a
+``Result`` with the time and queries of every operation. Requests go through
+Django's test client, so the whole stack (middleware, views, ORM) is measured
+without the network.
+
+The parse scenario times the command parser on its own. The delivery scenario
+sends through the real gateway client to a ``FakeGateway`` on localhost, which
+answers at once unless given a simulated or replayed gateway to behave like.
+"""
+import json
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import cached_property
+from itertools import count
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+
+from users.directory import contact_directory
+from users.jobs import create_reminder_job, claim_job, run_chunk
+from users.models import User, Task, ReminderJob
+from webhook.commands import CommandSyntaxError, commands as webhook_commands
+from webhook.fake_gateway import FakeGateway
+from webhook.gateway import GatewayClient, set_client
+from webhook.models import OutboundMessage
+from webhook.queue import OutboundWorker
+from webhook.ratelimit import RateLimiter
+from .data import seeded_uuid, user_name, phone_number
+
+
+@dataclass
+class Result:
+    name: str
+    # What ``count`` counts, e.g. requests or messages
+    unit: str
+    count: int = 0
+    elapsed: float = 0.0
+    # Seconds and queries for each timed operation
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+
+    def percentile(self, q):
+        """Nearest-rank percentile of the operation latencies, in seconds."""
+        ordered = sorted(self.latencies)
+        return ordered[max(math.ceil(q * len(ordered)) - 1, 0)] if ordered else 0.0
+
+    def summary(self):
+        return {
+            'unit': self.unit,
+            'count': self.count,
+            'throughput': round(self.count / self.elapsed, 1) if self.elapsed else 0.0,
+            'p50_ms': round(self.percentile(0.5) * 1000, 2),
+            'p99_ms': round(self.percentile(0.99) * 1000, 2),
+            'queries_per_op': round(statistics.mean(self.queries), 2) if self.queries else 0.0,
+            'max_queries': max(self.queries, default=0),
+        }
+
+
+class QueryCounter:
+    """Execute wrapper counting the queries run on this thread's connection."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Timer:
+    """Times operations and counts their queries into a ``Result``."""
+
+    def __init__(self, result):
+        self.result = result
+
+    def __call__(self, operation, *args, count=1):
+        queries = QueryCounter()
+        with connection.execute_wrapper(queries):
+            started = time.perf_counter()
+            value = operation(*args)
+            elapsed = time.perf_counter() - started
+        self.result.latencies.append(elapsed)
+        self.result.queries.append(queries.count)
+        self.result.elapsed += elapsed
+        self.result.count += count(value) if callable(count) else count
+        return value
+
+
+@dataclass
+class BenchmarkContext:
+    rng: object
+    ops: int
+    # Responder for the delivery scenario's stand-in gateway (see webhook.transports)
+    gateway: object = None
+    # Workspaces the data was seeded with; user i is in workspace i % workspaces
+    workspaces: int = 1
+    client: Client = field(default_factory=Client)
+    message_ids: count = field(default_factory=count)
+
+    @cached_property
+    def user_count(self):
+        return User.objects.count()
+
+    def random_users(self, k, colleague=0):
+        """Names of ``k`` random users in the same workspace as user ``colleague``."""
+        team = range(colleague % self.workspaces, self.user_count, self.workspaces)
+        return [user_name(i) for i in self.rng.sample(team, k)]
+
+    def random_phone(self):
+        return phone_number(self.rng.randrange(self.user_count))
+
+    def post_message(self, sender, body):
+        payload = {"messages": [{"id": f"bench-{next(self.message_ids)}", "from": sender, "text": {"body": body}}]}
+        response = self.client.post('/webhooks/messages', json.dumps(payload), content_type='application/json')
+        outcome = response.json()
+        if response.status_code != 200 or outcome.get('status') != 'success':
+            raise RuntimeError(f"Webhook failed for {body!r}: {outcome}")
+        return outcome
+
+    def get(self, path):
+        response = self.client.get(path)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+        return response
+
+
+def reset_caches():
+    cache.clear()
+    contact_directory.clear()
+
+
+def parse_all(texts):
+    for text in texts:
+        try:
+            webhook_commands.parse(text)
+        except CommandSyntaxError:
+            pass
+
+
+def command_parse(context, batch_size=100):
+    """The command parser alone, over batches of commands, chatter and malformed messages."""
+    result = Result('parse', 'messages')
+    timer = Timer(result)
+    for i in range(context.ops):
+        first, second = context.random_users(2)
+        batch = [
+            f"TASK, [{first}|{second}], 2030-01-01 10:00, Benchmark task {i}",
+            f"task,[{first}],  call back {i}",
+            f"Tasks for {second}",
+            f"DONE {seeded_uuid(context.rng)}",
+            f"LIST {i % 5 + 1}",
+            "LIST overdue",
+            f"TASK [{first}] missing comma",
+            "DONE",
+            "Listen, are we meeting today?",
+            "hello there",
+        ] * (batch_size // 10)
+        timer(parse_all, batch, count=len(batch))
+    return result
+
+
+def task_fanout(context):
+    """TASK messages assigning five people each."""
+    result = Result('task_fanout', 'requests')
+    timer = Timer(result)
+    senders = [context.rng.randrange(context.user_count) for _ in range(context.ops)]
+    for i, sender in enumerate(senders):
+        people = '|'.join(context.random_users(5, sender))
+        timer(context.post_message, phone_number(sender), f"TASK, [{people}], 2030-01-01 10:00, Benchmark task {i}")
+    return result
+
+
+def done_storm(context):
+    """DONE messages from assignees, one per task, back to back."""
+    result = Result('done_storm', 'requests')
+    timer = Timer(result)
+    # Seeded tasks first, in a fixed order; tasks from earlier scenarios have random IDs
+    tasks = (
+        Task.objects.filter(status='in_progress', completed_count__lt=1)
+        .order_by('created_at', 'id')
+        .prefetch_related('assigned_to')[:context.ops]
+    )
+    completions = [(str(task.id), task.assigned_to.all()[0].phone_number) for task in tasks]
+    for task_id, phone in completions:
+        timer(context.post_message, phone, f"DONE {task_id}")
+    return result
+
+
+def task_list(context):
+    """LIST, its later pages and the overdue filter, with the cache warming up as it goes."""
+    result = Result('list', 'requests')
+    timer = Timer(result)
+    commands = ['LIST', 'LIST 2', 'LIST 3', 'LIST overdue', 'LIST today']
+    sender = context.random_phone()
+    for i in range(context.ops):
+        timer(context.post_message, sender, commands[i % len(commands)])
+    return result
+
+
+def user_tasks(context):
+    """GET /api/user-tasks/<phone_number>/ for random users."""
+    result = Result('user_tasks', 'requests')
+    timer = Timer(result)
+    phones = [context.random_phone() for _ in range(context.ops)]
+    for phone in phones:
+        timer(context.get, f'/api/user-tasks/{phone}/')
+    return result
+
+
+def reminders(context, chunk_size=10):
+    """A reminder job for the next 24 hours, timed chunk by chunk."""
+    result = Result('reminders', 'tasks')
+    timer = Timer(result)
+    job = create_reminder_job(24)
+    claim_job(job.id, 'benchmark')
+    job = ReminderJob.objects.get(id=job.id)
+    while timer(run_chunk, job, 'benchmark', chunk_size, count=lambda handled: handled):
+        pass
+    return result
+
+
+def delivery(context):
+    """Drain the outbound queue through the gateway client to a local stand-in, batch by batch."""
+    result = Result('delivery', 'messages')
+    timer = Timer(result)
+    worker = OutboundWorker()
+
+    def sent():
+        return OutboundMessage.objects.filter(status=OutboundMessage.STATUS_SENT).count()
+
+    with FakeGateway(context.gateway) as gateway, override_settings(GATEWAY_TRANSPORT='http'):
+        client = GatewayClient(limiter=RateLimiter(0, 0, 0, 0), base_url=gateway.url)
+        previous = set_client(client)
+        try:
+            with ThreadPoolExecutor(max_workers=worker.threads) as executor:
+                before = sent()
+                while timer(worker.run_once, executor, count=0)[0]:
+                    pass
+                result.count = sent() - before
+        finally:
+            set_client(previous)
+            client.close()
+    return result
+
+
+# Run in this order: reminders queue the messages delivery sends
+SCENARIOS = {
+    'task_fanout': task_fanout,
+    'done_storm': done_storm,
+    'list': task_list,
+    'user_tasks': user_tasks,
+    'reminders': reminders,
+    'delivery': delivery,
+    # Last, so its random draws leave the other scenarios' inputs unchanged
+    'parse': command_parse,
+}
+
+
+def run_scenarios(names, rng, ops, gateway=None, workspaces=1):
+    """
+    Run the named scenarios in ``SCENARIOS`` order, with ``gateway`` as the
+    delivery scenario's responder, against data seeded with ``workspaces``.
+
+    Returns:
+        dict: Scenario name -> Result
+    """
+    context = BenchmarkContext(rng=rng, ops=ops, gateway=gateway, workspaces=workspaces)
+    results = {}
+    for name, scenario in SCENARIOS.items():
+        if name in names:
+            reset_caches()
+            results[name] = scenario(context)
+    return results
@@ -0,0 +1,105 @@
+import random
+
+from django.test import TestCase
+
+from users.models import User, Task, ReminderJob
+from webhook.fake_gateway import FakeGateway
+from webhook.gateway import GatewayClient, MessageDeliveryError
+from webhook.ratelimit import RateLimiter
+from webhook.transports import SimulatedGateway
+from .data import seed_data
+from .report import compare
+from .scenarios import run_scenarios
+
+
+class SeedDataTests(TestCase):
+
+    def test_same_seed_gives_same_data(self):
+        seed_data(100, seed=7)
+        first = sorted(Task.objects.values_list('id', 'description', 'assigned_count'))
+        Task.objects.all().delete()
+        User.objects.all().delete()
+
+        seed_data(100, seed=7)
+
+        self.assertEqual(sorted(Task.objects.values_list('id', 'description', 'assigned_count')), first)
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(Task.assigned_to.through.objects.count(), sum(row[2] for row in first))
+
+
+class ScenarioTests(TestCase):
+
+    def test_request_scenarios_report_every_operation(self):
+        seed_data(200)
+
+        results = run_scenarios(['task_fanout', 'done_storm', 'list', 'user_tasks', 'reminders'], random.Random(0), 5)
+
+        for name in ['task_fanout', 'done_storm', 'list', 'user_tasks']:
+            summary = results[name].summary()
+            self.assertEqual(summary['count'], 5, name)
+            self.assertGreater(summary['throughput'], 0, name)
+            self.assertGreater(summary['queries_per_op'], 0, name)
+        self.assertEqual(results['reminders'].count, ReminderJob.objects.get().tasks_scanned)
+
+    def test_parse_scenario_parses_every_message_without_queries(self):
+        seed_data(100)
+
+        summary = run_scenarios(['parse'], random.Random(0), 3)['parse'].summary()
+
+        self.assertEqual((summary['count'], summary['unit']), (300, 'messages'))
+        self.assertEqual(summary['max_queries'], 0)
+
+
+class WorkspaceScalingTests(TestCase):
+
+    def test_list_queries_do_not_grow_with_the_number_of_workspaces(self):
+        queries = {}
+        for workspaces in (1, 10):
+            Task.objects.all().delete()
+            User.objects.all().delete()
+            seed_data(300, workspaces=workspaces)
+            results = run_scenarios(['task_fanout', 'list'], random.Random(0), 5, workspaces=workspaces)
+            queries[workspaces] = {name: result.summary()['max_queries'] for name, result in results.items()}
+
+        self.assertEqual(queries[1], queries[10])
+
+
+class FakeGatewayTests(TestCase):
+
+    def test_gateway_client_sends_to_the_stand_in(self):
+        simulated = SimulatedGateway(error_rate=0.5, seed=1)
+        with FakeGateway(simulated) as gateway:
+            client = GatewayClient(limiter=RateLimiter(0, 0, 0, 0), base_url=gateway.url)
+            delivered = 0
+            for i in range(20):
+                try:
+                    client.send_text("919800000001", f"Message {i}")
+                    delivered += 1
+                except MessageDeliveryError:
+                    pass
+            client.close()
+
+        self.assertEqual(len(simulated.messages), delivered)
+        self.assertEqual(simulated.failures, 20 - delivered)
+        self.assertTrue(0 < delivered < 20)
+
+
+class CompareTests(TestCase):
+
+    baseline = {'list': {
+        'unit': 'requests', 'throughput': 100.0, 'p99_ms': 20.0, 'queries_per_op': 6.0, 'max_queries': 8,
+    }}
+
+    def summary(self, **changes):
+        return {'list': {**self.baseline['list'], **changes}}
+
+    def test_more_queries_is_a_regression(self):
+        self.assertEqual(len(compare(self.summary(queries_per_op=6.5), self.baseline, timing=False)), 1)
+
+    def test_timing_within_tolerance_passes(self):
+        self.assertEqual(compare(self.summary(throughput=80.0, p99_ms=25.0), self.baseline, tolerance=0.3), [])
+
+    def test_slower_run_is_a_regression_unless_timing_is_ignored(self):
+        slower = self.summary(throughput=50.0, p99_ms=40.0)
+        self.assertEqual(len(compare(slower, self.baseline, tolerance=0.3)), 2)
+        self.assertEqual(compare(slower, self.baseline, tolerance=0.3, timing=False), [])
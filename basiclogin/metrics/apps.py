@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class MetricsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'metrics'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .collector import instrument_connection
+
+        connection_created.connect(instrument_connection)
@@ -0,0 +1,177 @@
+"""
+Per-request metrics.
+
+``RequestMetricsMiddleware`` starts a ``RequestMetrics`` for each request and
+keeps it in a context variable, which follows the request into the threads
+``sync_to_async`` runs it on. Code anywhere in the request adds to it:
+
+- every database connection gets an execute wrapper (``record_query``) that
+  counts and times queries,
+- the gateway clients call ``record_gateway_call`` for each send,
+- the webhook calls ``tag_command`` with each command it runs.
+
+When the request ends its totals are logged and added to the histograms in
+``registry``, which ``GET /metrics/`` serves.
+"""
+import contextvars
+import threading
+import time
+
+
+current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.gateway_calls = 0
+        self.gateway_time = 0.0
+        self.commands = set()
+        self._lock = threading.Lock()
+
+    def add_query(self, elapsed):
+        with self._lock:
+            self.queries += 1
+            self.query_time += elapsed
+
+    def add_gateway_call(self, elapsed):
+        with self._lock:
+            self.gateway_calls += 1
+            self.gateway_time += elapsed
+
+    @property
+    def command(self):
+        """The commands run, joined in name order, or '' for none."""
+        return '+'.join(sorted(self.commands))
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(time.perf_counter() - started)
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """``connection_created`` receiver adding ``record_query`` to new connections."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_gateway_call(elapsed):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.add_gateway_call(elapsed)
+
+
+def tag_command(name):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.commands.add(name)
+
+
+# Bucket upper bounds, in seconds for times
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Counts of observed values per bucket, plus their sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the ``q`` quantile, None past the last bucket."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self):
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip([*map(str, self.buckets), '+Inf'], self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {
+            'count': self.total,
+            'sum': round(self.sum, 6),
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'buckets': buckets,
+        }
+
+
+class MetricsRegistry:
+    """Histograms of request metrics, keyed by URL name and webhook command."""
+
+    FIELDS = {
+        'latency': LATENCY_BUCKETS,
+        'query_count': COUNT_BUCKETS,
+        'query_time': LATENCY_BUCKETS,
+        'gateway_calls': COUNT_BUCKETS,
+        'gateway_time': LATENCY_BUCKETS,
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, url_name, command, values):
+        with self._lock:
+            series = self._series.get((url_name, command))
+            if series is None:
+                series = self._series[(url_name, command)] = {
+                    field: Histogram(buckets) for field, buckets in self.FIELDS.items()
+                }
+            for field, value in values.items():
+                series[field].observe(value)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'requests': [
+                    {
+                        'url_name': url_name,
+                        'command': command,
+                        **{field: histogram.as_dict() for field, histogram in series.items()},
+                    }
+                    for (url_name, command), series in sorted(self._series.items())
+                ],
+            }
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,67 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .collector import RequestMetrics, current, registry
+
+
+logger = logging.getLogger('metrics.requests')
+
+
+class RequestMetricsMiddleware:
+    """
+    Record query, gateway and latency totals for every request, log them as
+    structured fields and add them to the in-process histograms.
+
+    Works under both WSGI and ASGI; list it first in ``MIDDLEWARE`` so the
+    latency covers the other middleware too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        self.finish(request, response, metrics)
+        return response
+
+    def finish(self, request, response, metrics):
+        match = request.resolver_match
+        url_name = (match.view_name if match else None) or 'unmatched'
+        values = {
+            'latency': metrics.elapsed(),
+            'query_count': metrics.queries,
+            'query_time': metrics.query_time,
+            'gateway_calls': metrics.gateway_calls,
+            'gateway_time': metrics.gateway_time,
+        }
+        registry.observe(url_name, metrics.command, values)
+        logger.info("%s %s %s", request.method, request.path, response.status_code, extra={'data': {
+            'url_name': url_name,
+            'command': metrics.command,
+            'status': response.status_code,
+            **{name: round(value, 6) if isinstance(value, float) else value for name, value in values.items()},
+        }})
@@ -0,0 +1,74 @@
+import json
+
+from django.test import TestCase
+
+from users.models import User
+from webhook.gateway import DeliveryStats
+from webhook.ingest import recent_messages
+from .collector import Histogram, RequestMetrics, current, registry
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        recent_messages.clear()
+        User.objects.create(name="Asha", phone_number="919800000001")
+
+    def series(self, url_name, command=''):
+        metrics = self.client.get('/metrics/').json()
+        return next(
+            entry for entry in metrics['requests']
+            if entry['url_name'] == url_name and entry['command'] == command
+        )
+
+    def test_request_is_logged_and_counted(self):
+        with self.assertLogs('metrics.requests', level='INFO') as logs:
+            self.client.get('/api/users/')
+
+        line = logs.records[0].data
+        self.assertEqual(line['url_name'], 'get-all-users')
+        self.assertEqual(line['status'], 200)
+        self.assertGreaterEqual(line['query_count'], 1)
+
+        series = self.series('get-all-users')
+        self.assertEqual(series['latency']['count'], 1)
+        self.assertEqual(series['query_count']['sum'], line['query_count'])
+        self.assertEqual(series['latency']['buckets']['+Inf'], 1)
+
+    def test_async_webhook_is_tagged_with_its_commands(self):
+        payload = {"messages": [
+            {"id": "m1", "from": "919800000001", "text": {"body": "LIST"}},
+            {"id": "m2", "from": "919800000001", "text": {"body": "TASK, [Asha], Write report"}},
+        ]}
+        self.client.post('/webhooks/messages', json.dumps(payload), content_type='application/json')
+
+        series = self.series('whatsapp_webhook', 'LIST+TASK')
+        self.assertEqual(series['latency']['count'], 1)
+        # Queries made in sync_to_async threads still count against the request
+        self.assertGreater(series['query_count']['sum'], 0)
+
+    def test_gateway_calls_count_against_the_current_request(self):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            DeliveryStats().record(0.2, 200)
+        finally:
+            current.reset(token)
+        DeliveryStats().record(0.2, 200)
+
+        self.assertEqual(metrics.gateway_calls, 1)
+        self.assertAlmostEqual(metrics.gateway_time, 0.2)
+
+
+class HistogramTests(TestCase):
+
+    def test_buckets_and_quantiles(self):
+        histogram = Histogram((1, 5, 10))
+        for value in [0, 1, 2, 3, 4, 6, 7, 8, 9, 50]:
+            histogram.observe(value)
+
+        data = histogram.as_dict()
+        self.assertEqual(data['buckets'], {'1': 2, '5': 5, '10': 9, '+Inf': 10})
+        self.assertEqual(data['p50'], 5)
+        self.assertIsNone(data['p99'])
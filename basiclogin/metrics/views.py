@@ -0,0 +1,10 @@
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .collector import registry
+
+
+@require_GET
+def get_metrics(request):
+    """Request histograms for this process, per URL name and webhook command"""
+    return JsonResponse(registry.as_dict())
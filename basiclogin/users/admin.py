@@ -1,7 +1,9 @@
 from django.contrib import admin
-from .models import User, Task
+from .models import User, Task, ReminderJob, Workspace
 
 # Register your models here.
+admin.site.register(Workspace)
 admin.site.register(User)
 admin.site.register(Task)
 
+admin.site.register(ReminderJob)
@@ -0,0 +1,142 @@
+"""
+Cached task lists.
+
+Rendered task lists are stored in the configured cache (see ``CACHES``) under
+keys built from version tokens:
+
+- ``workspace:<id>`` changes whenever a task in that workspace changes (its
+  full LIST),
+- ``user:<id>`` changes whenever a task assigned to that user changes,
+- ``users:<workspace id>`` changes whenever a user of that workspace is saved
+  or deleted, since lists embed names and numbers.
+
+Every token belongs to one workspace, so a busy team never invalidates
+another team's lists.
+
+Invalidating writes a fresh token after the transaction commits; entries under
+old tokens are never read again and simply expire. Tokens are random, so a
+version key evicted from the cache can't bring back stale entries.
+"""
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Task
+
+
+VERSION_KEY = 'task-lists:version:{}'
+
+
+def workspace_scope(workspace_id):
+    return f'workspace:{workspace_id}'
+
+
+def users_scope(workspace_id):
+    return f'users:{workspace_id}'
+
+
+def user_scope(user_id):
+    return f'user:{user_id}'
+
+
+class CacheStats:
+    """Hit and miss counters for this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = {}
+            self.misses = {}
+
+    def record(self, name, hit):
+        with self._lock:
+            counts = self.hits if hit else self.misses
+            counts[name] = counts.get(name, 0) + 1
+
+    def as_dict(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            misses = sum(self.misses.values())
+            return {
+                'backend': settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+                'hits': hits,
+                'misses': misses,
+                'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None,
+                'by_list': {
+                    name: {'hits': self.hits.get(name, 0), 'misses': self.misses.get(name, 0)}
+                    for name in sorted(set(self.hits) | set(self.misses))
+                },
+            }
+
+
+stats = CacheStats()
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+def current_version(scopes):
+    """Return the combined version token for ``scopes``, creating missing ones."""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: _new_token() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return '-'.join(versions[key] for key in keys)
+
+
+def cached_task_list(name, workspace_id, scopes, render):
+    """
+    Return the cached value of ``render()`` for the current versions of
+    ``scopes``, rendering and storing it on a miss.
+
+    Args:
+        name (str): Identifies the list, e.g. ``user:<id>``.
+        workspace_id (UUID): Workspace whose users the list shows.
+        scopes (list): Version scopes the list depends on, besides the
+            workspace's ``users``.
+        render (callable): Builds the value; it must be picklable.
+    """
+    key = f'task-lists:{name}:{current_version([users_scope(workspace_id), *scopes])}'
+    value = cache.get(key)
+    list_name = name.split(':', 1)[0]
+    if value is not None:
+        stats.record(list_name, hit=True)
+        return value
+    stats.record(list_name, hit=False)
+    value = render()
+    cache.set(key, value, settings.TASK_LIST_CACHE_TIMEOUT)
+    return value
+
+
+def invalidate(scopes):
+    """Give ``scopes`` new versions once the current transaction commits."""
+    keys = [VERSION_KEY.format(scope) for scope in scopes]
+    transaction.on_commit(lambda: cache.set_many({key: _new_token() for key in keys}, None))
+
+
+def invalidate_users(workspace_ids, user_ids):
+    """Invalidate the full lists of the given workspaces and the lists of the given users."""
+    invalidate([
+        *(workspace_scope(workspace_id) for workspace_id in set(workspace_ids)),
+        *(user_scope(user_id) for user_id in set(user_ids)),
+    ])
+
+
+def invalidate_tasks(task_ids, user_ids=(), workspace_ids=None):
+    """
+    Invalidate the lists that show any of ``task_ids``. Their workspaces are
+    read from the database unless the caller knows them.
+    """
+    if workspace_ids is None:
+        workspace_ids = Task.objects.filter(id__in=task_ids).values_list('workspace_id', flat=True)
+    assignees = Task.assigned_to.through.objects.filter(task_id__in=task_ids).values_list('user_id', flat=True)
+    invalidate_users(list(workspace_ids), [*assignees, *user_ids])
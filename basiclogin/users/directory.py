@@ -0,0 +1,164 @@
+"""
+Per-process contact directory.
+
+Names and phone numbers rarely change, yet every TASK command, DONE and login
+looked them up again. The directory keeps two bounded LRU maps, (workspace,
+name) -> phone number and phone number -> User, filled from the database on a
+miss. Names are only looked up within a workspace, since two teams may each
+have a John; phone numbers are unique across all of them.
+
+Saving or deleting a User through the ORM evicts its entries (see
+``users.signals``). Code that writes users in bulk, skipping those signals,
+calls ``contact_directory.forget_phones``. Entries also expire after
+``CONTACT_DIRECTORY_TTL`` seconds, which bounds how long another process's
+change can go unseen.
+
+A phone number without a user is not remembered: someone who registers
+through another process must be recognised by this one straight away.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import DEFAULT_WORKSPACE_ID, User, normalize_phone_number
+
+
+# Cached answer for a name that has no user
+MISSING = object()
+
+
+class LRUCache:
+    """A thread-safe mapping that keeps the ``max_size`` most recently used keys."""
+
+    def __init__(self, max_size, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def pop_values(self, value):
+        """Remove every key currently mapped to ``value``."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0] == value]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ContactDirectory:
+
+    def __init__(self, max_size, ttl=None):
+        self.phones_by_name = LRUCache(max_size, ttl)
+        self.users_by_phone = LRUCache(max_size, ttl)
+
+    def phones_for(self, names, workspace_id=DEFAULT_WORKSPACE_ID):
+        """
+        Look up phone numbers by name within a workspace, reading only
+        uncached names from the database in one query.
+
+        Returns:
+            dict: Name -> phone number, for the names that belong to a user.
+        """
+        found = {}
+        missing = set()
+        for name in {name.strip() for name in names}:
+            phone = self.phones_by_name.get((workspace_id, name))
+            if phone is None:
+                missing.add(name)
+            elif phone is not MISSING:
+                found[name] = phone
+
+        if missing:
+            loaded = dict(
+                User.objects.filter(workspace_id=workspace_id, name__in=missing).values_list('name', 'phone_number')
+            )
+            for name in missing:
+                self.phones_by_name.set((workspace_id, name), loaded.get(name, MISSING))
+            found.update(loaded)
+        return found
+
+    def users_for(self, phone_numbers):
+        """
+        Look up users by phone number, in any format.
+
+        Returns:
+            dict: Canonical phone number -> User, for registered numbers.
+        """
+        found = {}
+        missing = set()
+        for phone in {normalize_phone_number(phone) for phone in phone_numbers} - {''}:
+            user = self.users_by_phone.get(phone)
+            if user is None:
+                missing.add(phone)
+            else:
+                found[phone] = user
+
+        if missing:
+            loaded = {user.phone_number: user for user in User.objects.filter(phone_number__in=missing)}
+            for phone, user in loaded.items():
+                self.users_by_phone.set(phone, user)
+            found.update(loaded)
+        return found
+
+    def user_for(self, phone_number):
+        """Return the user with this phone number, or None."""
+        phone = normalize_phone_number(phone_number)
+        return self.users_for([phone]).get(phone)
+
+    def forget(self, user):
+        """Evict everything cached about ``user``, including an old name or number."""
+        self.users_by_phone.pop(user.phone_number)
+        self.users_by_phone.pop_values(user)
+        self.phones_by_name.pop((user.workspace_id, user.name))
+        self.phones_by_name.pop_values(user.phone_number)
+
+    def forget_phones(self, phone_numbers):
+        """Evict phone numbers whose users were written without signals."""
+        for phone in phone_numbers:
+            self.users_by_phone.pop(phone)
+
+    def clear(self):
+        self.phones_by_name.clear()
+        self.users_by_phone.clear()
+
+    def stats(self):
+        return {
+            'names': len(self.phones_by_name),
+            'phones': len(self.users_by_phone),
+            'hits': self.phones_by_name.hits + self.users_by_phone.hits,
+            'misses': self.phones_by_name.misses + self.users_by_phone.misses,
+        }
+
+
+contact_directory = ContactDirectory(settings.CONTACT_DIRECTORY_SIZE, settings.CONTACT_DIRECTORY_TTL)
@@ -0,0 +1,222 @@
+"""
+Background reminder jobs.
+
+``POST /api/tasks/send-reminders/`` used to build and queue every reminder
+inside the request. It now records a ``ReminderJob`` and returns its ID; a
+background thread works through the due tasks in chunks ordered by
+(deadline, id). Each chunk's reminders are queued in the same transaction that
+moves the job's checkpoint past the chunk, so a job that dies is resumed from
+its last committed chunk without sending anything twice.
+
+Jobs whose process died (their heartbeat went stale) or that never started
+are picked up by ``resume_stale_jobs``, which the reminder scheduler calls on
+every tick.
+"""
+import datetime
+import logging
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import ReminderJob, Task
+from .utils import with_reminder_relations, reminder_messages_for
+from webhook.models import OutboundMessage
+from webhook.queue import enqueue_messages
+
+
+logger = logging.getLogger(__name__)
+
+
+def job_tag(job_id):
+    """Tag stored on the outbound messages a job queues."""
+    return f"reminder-job:{job_id}"
+
+
+def create_reminder_job(hours_before, now=None):
+    """Record a reminder job for tasks due within ``hours_before`` hours of now."""
+    now = now or timezone.now()
+    return ReminderJob.objects.create(
+        hours_before=hours_before,
+        window_start=now,
+        window_end=now + datetime.timedelta(hours=hours_before),
+    )
+
+
+def start_reminder_job(hours_before):
+    """
+    Create a reminder job and run it on a background thread once the
+    creating transaction commits.
+
+    Returns:
+        ReminderJob: The new job, still pending.
+    """
+    job = create_reminder_job(hours_before)
+    transaction.on_commit(lambda: threading.Thread(
+        target=run_in_thread, args=(job.id,), name=f"reminder-job-{job.id}", daemon=True,
+    ).start())
+    return job
+
+
+def run_in_thread(job_id):
+    try:
+        run_reminder_job(job_id)
+    except Exception:
+        logger.exception("Reminder job %s failed", job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id, worker_id, now=None):
+    """
+    Take ownership of a job that is pending or whose owner stopped heartbeating.
+
+    Returns:
+        bool: True if this worker now owns the job.
+    """
+    now = now or timezone.now()
+    stale = now - datetime.timedelta(seconds=settings.REMINDER_JOB_STALE_AFTER)
+    return bool(ReminderJob.objects.filter(
+        Q(status=ReminderJob.STATUS_PENDING)
+        | Q(status=ReminderJob.STATUS_RUNNING, heartbeat_at__lt=stale),
+        id=job_id,
+    ).update(status=ReminderJob.STATUS_RUNNING, claimed_by=worker_id, heartbeat_at=now))
+
+
+def due_tasks(job):
+    """The job's remaining tasks, in checkpoint order."""
+    tasks = Task.objects.filter(
+        status='in_progress',
+        deadline__gt=job.window_start,
+        deadline__lte=job.window_end,
+    )
+    if job.checkpoint_deadline is not None:
+        tasks = tasks.filter(
+            Q(deadline__gt=job.checkpoint_deadline)
+            | Q(deadline=job.checkpoint_deadline, id__gt=job.checkpoint_task_id)
+        )
+    return tasks.order_by('deadline', 'id')
+
+
+def run_chunk(job, worker_id, chunk_size):
+    """
+    Queue the reminders for the next chunk of tasks and advance the checkpoint.
+
+    Returns:
+        int: Tasks handled, 0 once the job has no tasks left.
+    """
+    with transaction.atomic():
+        # Lose the race cleanly if another worker took the job over
+        if not ReminderJob.objects.select_for_update().filter(id=job.id, claimed_by=worker_id).exists():
+            raise RuntimeError(f"Reminder job {job.id} was taken over by another worker")
+
+        tasks = list(with_reminder_relations(due_tasks(job))[:chunk_size])
+        if not tasks:
+            return 0
+
+        messages = [
+            (user.phone_number, message)
+            for task in tasks
+            for user, message in reminder_messages_for(task)
+        ]
+        enqueue_messages(messages, tag=job_tag(job.id))
+
+        last = tasks[-1]
+        job.checkpoint_deadline = last.deadline
+        job.checkpoint_task_id = last.id
+        job.tasks_scanned += len(tasks)
+        job.messages_queued += len(messages)
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=[
+            'checkpoint_deadline', 'checkpoint_task_id', 'tasks_scanned', 'messages_queued', 'heartbeat_at',
+        ])
+    return len(tasks)
+
+
+def run_reminder_job(job_id, worker_id=None, chunk_size=None):
+    """
+    Run a job from its checkpoint to the end.
+
+    Returns:
+        ReminderJob: The job as it finished, or None if another worker owns it.
+    """
+    worker_id = worker_id or uuid.uuid4().hex[:12]
+    chunk_size = chunk_size or settings.REMINDER_JOB_CHUNK_SIZE
+    if not claim_job(job_id, worker_id):
+        return None
+
+    job = ReminderJob.objects.get(id=job_id)
+    try:
+        while run_chunk(job, worker_id, chunk_size):
+            pass
+    except Exception as e:
+        ReminderJob.objects.filter(id=job_id, claimed_by=worker_id).update(
+            status=ReminderJob.STATUS_FAILED, last_error=str(e), finished_at=timezone.now(),
+        )
+        raise
+
+    ReminderJob.objects.filter(id=job_id, claimed_by=worker_id).update(
+        status=ReminderJob.STATUS_COMPLETED, finished_at=timezone.now(),
+    )
+    job.refresh_from_db()
+    logger.info("Reminder job %s queued %s reminders for %s tasks", job_id, job.messages_queued, job.tasks_scanned)
+    return job
+
+
+def resume_stale_jobs(now=None):
+    """
+    Run every job that was never started or whose process died.
+
+    Returns:
+        int: Number of jobs resumed.
+    """
+    now = now or timezone.now()
+    stale = now - datetime.timedelta(seconds=settings.REMINDER_JOB_STALE_AFTER)
+    job_ids = list(ReminderJob.objects.filter(
+        Q(status=ReminderJob.STATUS_PENDING, created_at__lt=stale)
+        | Q(status=ReminderJob.STATUS_RUNNING, heartbeat_at__lt=stale)
+    ).values_list('id', flat=True))
+
+    resumed = 0
+    for job_id in job_ids:
+        logger.info("Resuming reminder job %s", job_id)
+        try:
+            if run_reminder_job(job_id):
+                resumed += 1
+        except Exception:
+            logger.exception("Reminder job %s failed", job_id)
+    return resumed
+
+
+def job_status(job):
+    """
+    Progress of a job, including how its queued messages have fared so far.
+
+    Returns:
+        dict: Job fields plus sent, failed and pending message counts.
+    """
+    deliveries = dict(
+        OutboundMessage.objects
+        .filter(tag=job_tag(job.id))
+        .order_by()
+        .values_list('status')
+        .annotate(count=Count('id'))
+    )
+    return {
+        "job_id": str(job.id),
+        "status": job.status,
+        "hours_before": job.hours_before,
+        "tasks_scanned": job.tasks_scanned,
+        "messages_queued": job.messages_queued,
+        "messages_sent": deliveries.get(OutboundMessage.STATUS_SENT, 0),
+        "messages_failed": deliveries.get(OutboundMessage.STATUS_DEAD, 0),
+        "messages_pending": (
+            deliveries.get(OutboundMessage.STATUS_PENDING, 0) + deliveries.get(OutboundMessage.STATUS_SENDING, 0)
+        ),
+        "error": job.last_error,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
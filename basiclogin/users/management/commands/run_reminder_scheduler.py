@@ -0,0 +1,69 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from users.jobs import resume_stale_jobs
+from users.scheduler import ReminderScheduler
+from webhook.ingest import prune_inbound_messages
+
+
+class Command(BaseCommand):
+    help = 'Continuously send task reminders for every reminder window'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=settings.REMINDER_SCHEDULER_INTERVAL,
+            help='Seconds between scheduler ticks'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run a single tick and exit'
+        )
+
+    def handle(self, *args, **options):
+        scheduler = ReminderScheduler()
+        windows = ', '.join(f"{hours}h" for hours in scheduler.windows)
+        self.stdout.write(f"Reminder scheduler started for windows: {windows}")
+
+        while True:
+            try:
+                reminder_count, task_count = scheduler.tick()
+                if reminder_count:
+                    self.stdout.write(f"Queued {reminder_count} reminders for {task_count} tasks")
+            except Exception as e:
+                # Keep the scheduler alive; the next tick retries from the same point
+                self.stderr.write(f"Reminder tick failed: {str(e)}")
+            finally:
+                close_old_connections()
+
+            # Finish reminder jobs started from the API whose process died
+            try:
+                resumed = resume_stale_jobs()
+                if resumed:
+                    self.stdout.write(f"Resumed {resumed} reminder jobs")
+            except Exception as e:
+                self.stderr.write(f"Resuming reminder jobs failed: {str(e)}")
+            finally:
+                close_old_connections()
+
+            # Drop webhook message IDs the gateway will no longer redeliver
+            try:
+                pruned = prune_inbound_messages()
+                if pruned:
+                    self.stdout.write(f"Pruned {pruned} inbound messages")
+            except Exception as e:
+                self.stderr.write(f"Pruning inbound messages failed: {str(e)}")
+            finally:
+                close_old_connections()
+
+            if options['once']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                self.stdout.write("Reminder scheduler stopped")
+                return
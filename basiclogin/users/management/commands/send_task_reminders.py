@@ -21,4 +21,4 @@ class Command(BaseCommand):
         # Use the utility function to send reminders
         reminder_count, task_count = send_task_reminders(hours_before=hours_before)
         
-        self.stdout.write(self.style.SUCCESS(f"Successfully sent {reminder_count} reminders for {task_count} tasks"))
+        self.stdout.write(self.style.SUCCESS(f"Successfully queued {reminder_count} reminders for {task_count} tasks"))
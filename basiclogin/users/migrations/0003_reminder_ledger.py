@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_task_completed_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='deadline',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='SentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_hours', models.PositiveSmallIntegerField()),
+                ('sent_at', models.DateTimeField(auto_now_add=True)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='received_reminders', to='users.user')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sent_reminders', to='users.task')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('task', 'recipient', 'window_hours'), name='unique_sent_reminder')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:20
+
+import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+# Date-only deadlines are due at the end of their day
+DEADLINE_TIME = datetime.time(23, 59)
+
+
+def backfill_deadline_at(apps, schema_editor):
+    Task = apps.get_model('users', 'Task')
+    tz = timezone.get_default_timezone()
+    tasks = list(Task.objects.exclude(deadline=None).only('id', 'deadline'))
+    for task in tasks:
+        task.deadline_at = timezone.make_aware(datetime.datetime.combine(task.deadline, DEADLINE_TIME), tz)
+    Task.objects.bulk_update(tasks, ['deadline_at'], batch_size=500)
+
+
+def restore_deadline_date(apps, schema_editor):
+    Task = apps.get_model('users', 'Task')
+    tz = timezone.get_default_timezone()
+    tasks = list(Task.objects.exclude(deadline_at=None).only('id', 'deadline_at'))
+    for task in tasks:
+        task.deadline = timezone.localtime(task.deadline_at, tz).date()
+    Task.objects.bulk_update(tasks, ['deadline'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_reminder_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='deadline_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_deadline_at, restore_deadline_date),
+        migrations.RemoveField(
+            model_name='task',
+            name='deadline',
+        ),
+        migrations.RenameField(
+            model_name='task',
+            old_name='deadline_at',
+            new_name='deadline',
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'deadline'], name='task_status_deadline_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:42
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def normalize_phone_number(phone_number):
+    return ''.join(ch for ch in (phone_number or '') if ch.isdigit())
+
+
+def merge_into(apps, keeper, duplicates):
+    """Move every task, assignment, completion and reminder of ``duplicates`` to ``keeper``."""
+    Task = apps.get_model('users', 'Task')
+    SentReminder = apps.get_model('users', 'SentReminder')
+    duplicate_ids = [user.id for user in duplicates]
+
+    Task.objects.filter(created_by_id__in=duplicate_ids).update(created_by_id=keeper.id)
+
+    for through in (Task.assigned_to.through, Task.completed_by.through):
+        kept_tasks = set(through.objects.filter(user_id=keeper.id).values_list('task_id', flat=True))
+        moved_tasks = set(through.objects.filter(user_id__in=duplicate_ids).values_list('task_id', flat=True))
+        through.objects.bulk_create([
+            through(task_id=task_id, user_id=keeper.id) for task_id in moved_tasks - kept_tasks
+        ])
+        through.objects.filter(user_id__in=duplicate_ids).delete()
+
+    kept_reminders = set(
+        SentReminder.objects.filter(recipient_id=keeper.id).values_list('task_id', 'window_hours')
+    )
+    for reminder in SentReminder.objects.filter(recipient_id__in=duplicate_ids):
+        if (reminder.task_id, reminder.window_hours) in kept_reminders:
+            reminder.delete()
+        else:
+            kept_reminders.add((reminder.task_id, reminder.window_hours))
+            reminder.recipient_id = keeper.id
+            reminder.save(update_fields=['recipient'])
+
+
+def normalize_and_merge_users(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+
+    by_number = defaultdict(list)
+    for user in User.objects.all():
+        by_number[normalize_phone_number(user.phone_number)].append(user)
+
+    for phone_number, users in by_number.items():
+        # Keep a user with a name if there is one, so registered users win over
+        # the nameless ones the webhook creates
+        users.sort(key=lambda user: (not user.name, str(user.id)))
+        keeper, duplicates = users[0], users[1:]
+        if duplicates:
+            merge_into(apps, keeper, duplicates)
+            User.objects.filter(id__in=[user.id for user in duplicates]).delete()
+        if keeper.phone_number != phone_number:
+            User.objects.filter(id=keeper.id).update(phone_number=phone_number)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_task_deadline_datetime'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_and_merge_users, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='name',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='phone_number',
+            field=models.CharField(max_length=15, unique=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_counters(apps, schema_editor):
+    Task = apps.get_model('users', 'Task')
+    tasks = list(Task.objects.annotate(
+        assigned_total=Count('assigned_to', distinct=True),
+        completed_total=Count('completed_by', distinct=True),
+    ))
+    for task in tasks:
+        task.assigned_count = task.assigned_total
+        task.completed_count = task.completed_total
+    Task.objects.bulk_update(tasks, ['assigned_count', 'completed_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_unique_phone_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='assigned_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='completed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:25
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+DEFAULT_WORKSPACE_ID = uuid.UUID('00000000-0000-0000-0000-000000000001')
+
+
+def create_default_workspace(apps, schema_editor):
+    """Existing users and tasks move into the default workspace."""
+    Workspace = apps.get_model('users', 'Workspace')
+    Workspace.objects.get_or_create(id=DEFAULT_WORKSPACE_ID, defaults={'name': 'Default'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0007_reminderjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Workspace',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(create_default_workspace, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='name',
+            field=models.CharField(max_length=100),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='workspace',
+            field=models.ForeignKey(default=DEFAULT_WORKSPACE_ID, on_delete=django.db.models.deletion.PROTECT, related_name='tasks', to='users.workspace'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='workspace',
+            field=models.ForeignKey(default=DEFAULT_WORKSPACE_ID, on_delete=django.db.models.deletion.PROTECT, related_name='users', to='users.workspace'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['workspace', 'deadline', 'created_at'], name='task_workspace_deadline_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['workspace', 'created_at'], name='task_workspace_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['workspace', 'name'], name='user_workspace_name_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:10
+
+import datetime
+
+from django.db import migrations
+from django.db.models import Count
+
+
+def spread_tied_created_at(apps, schema_editor):
+    """
+    Give tasks that share a ``created_at`` distinct values.
+
+    0003 backfilled every existing task with the same timestamp, and a cursor
+    page that lands inside such a run falls back to an offset scan. Each run
+    is spread a microsecond apart, in primary key order.
+    """
+    Task = apps.get_model('users', 'Task')
+    tied = (
+        Task.objects.values('created_at')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .values_list('created_at', flat=True)
+    )
+    for created_at in list(tied):
+        tasks = list(Task.objects.filter(created_at=created_at).order_by('id'))
+        for offset, task in enumerate(tasks):
+            task.created_at = created_at + datetime.timedelta(microseconds=offset)
+        Task.objects.bulk_update(tasks, ['created_at'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0008_workspace'),
+    ]
+
+    operations = [
+        migrations.RunPython(spread_tied_created_at, migrations.RunPython.noop),
+    ]
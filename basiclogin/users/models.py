@@ -1,14 +1,68 @@
 from django.db import models
+import re
 import uuid
 
+NON_DIGITS = re.compile(r'\D')
+
+# Created by migration 0008; users and tasks not placed in a team belong to it
+DEFAULT_WORKSPACE_ID = uuid.UUID('00000000-0000-0000-0000-000000000001')
+
+
+def normalize_phone_number(phone_number):
+    """
+    Return the canonical form of a phone number: its digits only.
+
+    "+91 98765-43210" and "919876543210" both become "919876543210", which is
+    also the form the WhatsApp gateway uses for senders and recipients.
+    """
+    if not phone_number:
+        return ''
+    return NON_DIGITS.sub('', str(phone_number))
+
+
+class Workspace(models.Model):
+    """A team. Its members only see, assign and look each other up within it."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.name
+
+
 class User(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Phone numbers are the WhatsApp identity, so a user is in one workspace
+    workspace = models.ForeignKey(
+        Workspace, on_delete=models.PROTECT, related_name='users', default=DEFAULT_WORKSPACE_ID,
+    )
     name = models.CharField(max_length=100)
-    phone_number = models.CharField(max_length=15)
+    phone_number = models.CharField(max_length=15, unique=True)
+
+    def save(self, *args, **kwargs):
+        self.phone_number = normalize_phone_number(self.phone_number)
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.phone_number})"
 
+    class Meta:
+        indexes = [
+            # Name lookups (TASK, TASKS FOR) never leave the sender's workspace
+            models.Index(fields=['workspace', 'name'], name='user_workspace_name_idx'),
+        ]
+
+class TaskQuerySet(models.QuerySet):
+    def with_people(self):
+        """
+        Load each task's creator, assignees and completers along with it.
+
+        TaskSerializer reads all three, so list endpoints use this to serialize
+        any number of tasks in three queries instead of 1 + 3N.
+        """
+        return self.select_related('created_by').prefetch_related('assigned_to', 'completed_by')
+
+
 class Task(models.Model):
     STATUS_CHOICES = [
         ('in_progress', 'In Progress'),
@@ -25,17 +79,95 @@ class Task(models.Model):
             return None
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # The creator's workspace, copied so task lists read only their team's rows
+    workspace = models.ForeignKey(
+        Workspace, on_delete=models.PROTECT, related_name='tasks', default=DEFAULT_WORKSPACE_ID,
+    )
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_by', default=get_default_user)
     assigned_to = models.ManyToManyField(User, related_name='assigned_to', blank=True)
     completed_by = models.ManyToManyField(User, related_name='completed_tasks', blank=True)
     
     # Task Details
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
-    deadline = models.DateField(null=True, blank=True)
+    deadline = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    # Denormalized sizes of assigned_to and completed_by, kept in sync by
+    # users.signals and updated atomically when a task is completed
+    assigned_count = models.PositiveIntegerField(default=0)
+    completed_count = models.PositiveIntegerField(default=0)
+
+    objects = TaskQuerySet.as_manager()
     
     def is_completed_by_all(self):
         """Check if all assigned users have completed the task"""
-        return self.assigned_to.count() > 0 and self.completed_by.count() == self.assigned_to.count()
+        return self.assigned_count > 0 and self.completed_count >= self.assigned_count
 
     def __str__(self):
         return f"{self.description} (Status: {self.status})"
+
+    class Meta:
+        indexes = [
+            # Reminder windows scan in-progress tasks by deadline range
+            models.Index(fields=['status', 'deadline'], name='task_status_deadline_idx'),
+            # LIST pages (soonest deadline first) and its filters, per workspace
+            models.Index(fields=['workspace', 'deadline', 'created_at'], name='task_workspace_deadline_idx'),
+            # GET /api/tasks/?workspace=, newest first
+            models.Index(fields=['workspace', 'created_at'], name='task_workspace_created_idx'),
+        ]
+
+
+class SentReminder(models.Model):
+    """Ledger entry recording that a reminder window was handled for a recipient"""
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='sent_reminders')
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_reminders')
+    window_hours = models.PositiveSmallIntegerField()
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'recipient', 'window_hours'], name='unique_sent_reminder'),
+        ]
+
+    def __str__(self):
+        return f"{self.window_hours}h reminder for {self.task_id} to {self.recipient_id}"
+
+
+class ReminderJob(models.Model):
+    """A manually triggered reminder run, processed in the background in checkpointed chunks"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    hours_before = models.PositiveIntegerField()
+    # The reminder window is fixed when the job is created, so a resumed job
+    # picks the same tasks
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+
+    # Last task handled, in (deadline, id) order
+    checkpoint_deadline = models.DateTimeField(null=True, blank=True)
+    checkpoint_task_id = models.UUIDField(null=True, blank=True)
+    tasks_scanned = models.PositiveIntegerField(default=0)
+    messages_queued = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    # Set by the process running the job; a stale heartbeat means it died
+    claimed_by = models.CharField(max_length=64, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Reminder job {self.id} ({self.status})"
@@ -0,0 +1,104 @@
+"""
+Long-running reminder scheduler.
+
+Replaces running ``send_task_reminders`` once per window from cron. Every tick
+handles all reminder windows in one pass and records what it sent in the
+``SentReminder`` ledger, keyed by (task, recipient, window), so overlapping
+windows and restarts never send the same reminder twice.
+"""
+import datetime
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Task, SentReminder
+from .utils import with_reminder_relations, reminder_messages_for
+from webhook.queue import enqueue_messages
+
+
+def deadline_between(start, end):
+    """Build a filter for tasks due after ``start`` and no later than ``end``."""
+    return Q(deadline__gt=start, deadline__lte=end)
+
+
+class ReminderScheduler:
+    """Sends each reminder window once per task and recipient."""
+
+    def __init__(self, windows=None):
+        # Tightest window first, so a task is reminded for the window it is in now
+        self.windows = sorted(windows or settings.REMINDER_WINDOWS)
+        self.last_tick = None
+
+    def current_window(self, task, now):
+        """Return the tightest window the task's deadline falls in, or None."""
+        remaining = task.deadline - now
+        if remaining <= datetime.timedelta(0):
+            return None
+        for hours in self.windows:
+            if remaining <= datetime.timedelta(hours=hours):
+                return hours
+        return None
+
+    def due_filter(self, now):
+        """
+        Build the filter for tasks that may need a reminder this tick.
+
+        On the first tick every task inside the widest window is read. After
+        that only tasks that entered a window since the last tick, or were
+        created since then, are read; the (status, deadline) index turns each
+        window into a range scan.
+        """
+        horizon = now + datetime.timedelta(hours=self.windows[-1])
+        if self.last_tick is None:
+            return deadline_between(now, horizon)
+
+        entered = [
+            deadline_between(self.last_tick + datetime.timedelta(hours=hours), now + datetime.timedelta(hours=hours))
+            for hours in self.windows
+        ]
+        created = Q(created_at__gt=self.last_tick) & deadline_between(now, horizon)
+        return reduce(or_, entered, created)
+
+    def tick(self, now=None):
+        """
+        Queue every reminder that is due and not yet in the ledger.
+
+        Returns:
+            tuple: (reminder_count, task_count) - Reminders queued and tasks read
+        """
+        now = now or timezone.now()
+        tasks = list(with_reminder_relations(
+            Task.objects.filter(status='in_progress').filter(self.due_filter(now))
+        ))
+        if not tasks:
+            self.last_tick = now
+            return 0, 0
+
+        already_sent = set(
+            SentReminder.objects
+            .filter(task__in=tasks)
+            .values_list('task_id', 'recipient_id', 'window_hours')
+        )
+
+        messages = []
+        ledger = []
+        for task in tasks:
+            window = self.current_window(task, now)
+            if window is None:
+                continue
+            for user, message in reminder_messages_for(task):
+                if (task.id, user.id, window) in already_sent:
+                    continue
+                messages.append((user.phone_number, message))
+                ledger.append(SentReminder(task=task, recipient=user, window_hours=window))
+
+        with transaction.atomic():
+            SentReminder.objects.bulk_create(ledger, ignore_conflicts=True)
+            enqueue_messages(messages)
+        # Only advance once everything is queued, so a failed tick is retried
+        self.last_tick = now
+        return len(messages), len(tasks)
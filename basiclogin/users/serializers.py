@@ -1,10 +1,28 @@
 from rest_framework import serializers
-from .models import User, Task
+from .models import User, Task, Workspace, normalize_phone_number
+
+class WorkspaceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Workspace
+        fields = ['id', 'name']
 
 class UserSerializer(serializers.ModelSerializer):
+    def validate_phone_number(self, value):
+        phone_number = normalize_phone_number(value)
+        if not phone_number:
+            raise serializers.ValidationError("Enter a phone number with at least one digit.")
+        return phone_number
+
     class Meta:
         model = User
-        fields = ['name', 'phone_number']
+        fields = ['name', 'phone_number', 'workspace']
+        # register_user answers duplicate phone numbers itself, so skip the
+        # automatic uniqueness check; users join the default workspace unless
+        # one is given
+        extra_kwargs = {
+            'phone_number': {'validators': []},
+            'workspace': {'write_only': True, 'required': False},
+        }
 
 class TaskSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
@@ -13,18 +31,18 @@ class TaskSerializer(serializers.ModelSerializer):
     assigned_to_phones = serializers.ListField(child=serializers.CharField(), write_only=True, required=False)
 
     def create(self, validated_data):
-        created_by_phone = validated_data.pop('created_by_phone')
-        assigned_to_phones = validated_data.pop('assigned_to_phones', [])
+        created_by_phone = normalize_phone_number(validated_data.pop('created_by_phone'))
+        assigned_to_phones = [normalize_phone_number(phone) for phone in validated_data.pop('assigned_to_phones', [])]
 
         # Find the user who created the task
         created_by = User.objects.get(phone_number=created_by_phone)
         
-        # Create the task
-        task = Task.objects.create(created_by=created_by, **validated_data)
+        # Create the task in the creator's workspace
+        task = Task.objects.create(created_by=created_by, workspace_id=created_by.workspace_id, **validated_data)
 
         # Add assigned users
         if assigned_to_phones:
-            assigned_users = User.objects.filter(phone_number__in=assigned_to_phones)
+            assigned_users = User.objects.filter(workspace_id=created_by.workspace_id, phone_number__in=assigned_to_phones)
             task.assigned_to.set(assigned_users)
 
         return task
@@ -32,9 +50,10 @@ class TaskSerializer(serializers.ModelSerializer):
     class Meta:
         model = Task
         fields = [
-            'id', 'description', 'created_by', 'created_by_phone', 
+            'id', 'workspace', 'description', 'created_by', 'created_by_phone',
             'assigned_to', 'assigned_to_phones', 'completed_by', 'status', 'deadline'
         ]
+        read_only_fields = ['workspace']
 
 class WhatsAppTaskInputSerializer(serializers.Serializer):
     message = serializers.CharField()
@@ -0,0 +1,265 @@
+import logging
+from dataclasses import dataclass, field
+
+from django.db import transaction
+from django.db.models import F
+
+from . import cache
+from .directory import contact_directory
+from .models import DEFAULT_WORKSPACE_ID, User, Task, normalize_phone_number
+from .serializers import TaskSerializer
+from .utils import parse_deadline
+
+
+logger = logging.getLogger(__name__)
+
+
+class TaskCompletionError(Exception):
+    """Raised when a task cannot be marked as completed by a user."""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+@dataclass
+class TaskCompletionResult:
+    """Outcome of a user marking a task as completed."""
+
+    status: str
+    completed_count: int = 0
+    total_assigned: int = 0
+    remaining_users: list = field(default_factory=list)
+    notifications_sent: int = 0
+
+    @property
+    def deleted(self):
+        return self.status == 'deleted'
+
+
+def record_task_completion(task_id, phone_number, user=None):
+    """
+    Mark a task as completed by a user and delete it once every assignee is done.
+
+    The whole update runs in one transaction holding a row lock on the task,
+    so concurrent completions are applied one at a time and exactly one of
+    them sees the last assignee finish. That call queues a completion notice
+    for all assignees and the creator, and deletes the task.
+
+    Args:
+        task_id (str or UUID): ID of the task being completed.
+        phone_number (str): Phone number of the user completing it.
+        user (User): The completing user, if the caller already loaded it.
+
+    Returns:
+        TaskCompletionResult: The task's completion state after this call.
+
+    Raises:
+        TaskCompletionError: If the task or user does not exist, or the user is
+            not assigned to the task.
+    """
+    with transaction.atomic():
+        try:
+            task = Task.objects.select_for_update().get(id=task_id)
+        except Task.DoesNotExist:
+            logger.info("Task %s not found", task_id)
+            raise TaskCompletionError("Task not found", 404)
+
+        if user is None:
+            user = contact_directory.user_for(phone_number)
+            if user is None:
+                raise TaskCompletionError("User not found", 404)
+
+        # Check if user is assigned to this task
+        if not Task.assigned_to.through.objects.filter(task_id=task.id, user_id=user.id).exists():
+            logger.info("User %s is not assigned to task %s", user.id, task_id)
+            raise TaskCompletionError("User is not assigned to this task", 403)
+
+        # Add user to completed_by if not already there. Writing the through row
+        # directly skips the m2m signals, so the counter and the cached task
+        # lists are updated here.
+        _, added = Task.completed_by.through.objects.get_or_create(task_id=task.id, user_id=user.id)
+        if added:
+            Task.objects.filter(id=task.id).update(completed_count=F('completed_count') + 1)
+            task.completed_count += 1
+            cache.invalidate_tasks([task.id], workspace_ids=[task.workspace_id])
+            logger.debug("Added user %s to completed_by of task %s", user.id, task_id)
+        else:
+            logger.debug("User %s already marked task %s as completed", user.id, task_id)
+
+        if not task.is_completed_by_all():
+            remaining_users = list(
+                task.assigned_to.exclude(id__in=Task.completed_by.through.objects.filter(task_id=task.id).values('user_id'))
+            )
+            logger.info(
+                "Task %s completion recorded. %s/%s users completed.", task_id, task.completed_count, task.assigned_count,
+            )
+            return TaskCompletionResult(
+                status='in_progress',
+                completed_count=task.completed_count,
+                total_assigned=task.assigned_count,
+                remaining_users=remaining_users,
+            )
+
+        logger.info("All users have completed task %s. Sending notifications and deleting task.", task_id)
+
+        # Get all users involved in the task
+        all_users = list(task.assigned_to.all())
+        creator = task.created_by
+
+        # Add creator to notification list if not already in assigned users
+        if creator not in all_users:
+            all_users.append(creator)
+
+        # Import the outbound queue
+        from webhook.queue import enqueue_messages
+
+        # Prepare completion message
+        completion_message = f"🎉 Task Completed! 🎉\n"
+        completion_message += f"Description: {task.description}\n"
+        completion_message += f"All assigned users have completed this task.\n"
+        completion_message += f"The task has been removed from the system.\n"
+        completion_message += f"Thank you for your collaboration!"
+
+        # Queue the message for all users; it is only delivered if the
+        # deletion below commits
+        enqueue_messages(
+            (user.phone_number, completion_message) for user in all_users if user.phone_number
+        )
+        logger.debug("Queued completion notifications for %s users", len(all_users))
+
+        # Delete the task
+        task.delete()
+
+    return TaskCompletionResult(
+        status='deleted',
+        completed_count=task.completed_count,
+        total_assigned=task.assigned_count,
+        notifications_sent=len(all_users),
+    )
+
+
+def assigned_task_list(user_id, workspace_id=DEFAULT_WORKSPACE_ID):
+    """Serialized tasks assigned to a user of ``workspace_id``, from the cache when it is current."""
+    return cache.cached_task_list(
+        f'user:{user_id}',
+        workspace_id,
+        [cache.user_scope(user_id)],
+        lambda: list(TaskSerializer(Task.objects.filter(assigned_to__id=user_id).with_people(), many=True).data),
+    )
+
+
+def all_task_list(workspace_id=DEFAULT_WORKSPACE_ID):
+    """Every task in a workspace, serialized, from the cache when it is current."""
+    return cache.cached_task_list(
+        f'all:{workspace_id}',
+        workspace_id,
+        [cache.workspace_scope(workspace_id)],
+        lambda: list(TaskSerializer(Task.objects.filter(workspace_id=workspace_id).with_people(), many=True).data),
+    )
+
+
+class TaskImportError(Exception):
+    """Raised when a task in a bulk import is invalid."""
+
+    def __init__(self, message, row):
+        super().__init__(f"Task {row}: {message}")
+        self.message = message
+        self.row = row
+
+
+@dataclass
+class NewTask:
+    """A task to be created by ``create_tasks``."""
+
+    description: str
+    created_by: str
+    assigned_to: list = field(default_factory=list)
+    deadline: object = None
+
+
+def create_tasks(new_tasks, workspace_id=DEFAULT_WORKSPACE_ID):
+    """
+    Create many tasks at once.
+
+    Every phone number referenced, creator or assignee, is upserted with one
+    insert that ignores existing users and read back with one query. Tasks and
+    their assignment rows are then inserted in bulk, so the number of queries
+    does not grow with the number of tasks. Assigned counters are filled in up
+    front because bulk inserts skip the m2m signals.
+
+    Args:
+        new_tasks (iterable of NewTask): Phone numbers may be in any format;
+            deadlines are parsed with ``parse_deadline``.
+        workspace_id (UUID): Workspace the tasks, and any new users, go in.
+
+    Returns:
+        list: One dict per task with its id, description, deadline, creator's
+        phone number and assignees' phone numbers.
+
+    Raises:
+        TaskImportError: If a task has no creator, an unreadable deadline or
+            a person from another workspace. Nothing is created in that case.
+    """
+    rows = []
+    for row, new_task in enumerate(new_tasks, start=1):
+        creator = normalize_phone_number(new_task.created_by)
+        if not creator:
+            raise TaskImportError("creator phone number is required", row)
+        deadline = parse_deadline(new_task.deadline)
+        if new_task.deadline and deadline is None:
+            raise TaskImportError(f"invalid deadline {new_task.deadline!r}", row)
+        assignees = list(dict.fromkeys(
+            phone for phone in map(normalize_phone_number, new_task.assigned_to) if phone
+        ))
+        rows.append((new_task.description or '', creator, assignees, deadline))
+    if not rows:
+        return []
+
+    numbers = {creator for _, creator, _, _ in rows}
+    numbers.update(phone for _, _, assignees, _ in rows for phone in assignees)
+
+    with transaction.atomic():
+        User.objects.bulk_create(
+            [User(phone_number=phone, workspace_id=workspace_id) for phone in numbers], ignore_conflicts=True,
+        )
+        contact_directory.forget_phones(numbers)
+        users = User.objects.filter(phone_number__in=numbers).values_list('phone_number', 'id', 'workspace_id')
+        user_ids = {}
+        for phone, user_id, user_workspace_id in users:
+            if user_workspace_id != workspace_id:
+                row = next(row for row, (_, creator, assignees, _) in enumerate(rows, start=1)
+                           if phone == creator or phone in assignees)
+                raise TaskImportError(f"{phone} belongs to another workspace", row)
+            user_ids[phone] = user_id
+
+        tasks = Task.objects.bulk_create([
+            Task(
+                description=description,
+                workspace_id=workspace_id,
+                created_by_id=user_ids[creator],
+                deadline=deadline,
+                assigned_count=len(assignees),
+            )
+            for description, creator, assignees, deadline in rows
+        ])
+        Task.assigned_to.through.objects.bulk_create([
+            Task.assigned_to.through(task_id=task.id, user_id=user_ids[phone])
+            for task, (_, _, assignees, _) in zip(tasks, rows)
+            for phone in assignees
+        ])
+        cache.invalidate_users(
+            [workspace_id], (user_ids[phone] for _, _, assignees, _ in rows for phone in assignees),
+        )
+
+    return [
+        {
+            'id': str(task.id),
+            'description': description,
+            'deadline': deadline.isoformat() if deadline else None,
+            'created_by': creator,
+            'assigned_to': assignees,
+        }
+        for task, (description, creator, assignees, deadline) in zip(tasks, rows)
+    ]
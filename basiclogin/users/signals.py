@@ -0,0 +1,114 @@
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import cache
+from .directory import contact_directory
+from .models import User, Task
+
+
+def _through_count(through):
+    """Subquery counting a task's rows in an M2M through table."""
+    return Coalesce(
+        Subquery(
+            through.objects
+            .filter(task_id=OuterRef('pk'))
+            .values('task_id')
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    )
+
+
+def refresh_task_counters(task_ids):
+    """Recompute assigned_count and completed_count for the given tasks in one update."""
+    Task.objects.filter(pk__in=task_ids).update(
+        assigned_count=_through_count(Task.assigned_to.through),
+        completed_count=_through_count(Task.completed_by.through),
+    )
+
+
+@receiver(m2m_changed, sender=Task.assigned_to.through)
+@receiver(m2m_changed, sender=Task.completed_by.through)
+def keep_task_counters_in_sync(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Update the stored counters whenever assignees or completers change
+    through the related managers (serializers, TaskService, admin).
+    """
+    if reverse:
+        # Changed from the user's side; pk_set holds task ids
+        if action == 'pre_clear':
+            instance._cleared_task_ids = list(
+                sender.objects.filter(user_id=instance.pk).values_list('task_id', flat=True)
+            )
+            return
+        if action == 'post_clear':
+            task_ids = getattr(instance, '_cleared_task_ids', [])
+        elif action in ('post_add', 'post_remove'):
+            task_ids = pk_set
+        else:
+            return
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        task_ids = [instance.pk]
+    else:
+        return
+
+    refresh_task_counters(task_ids)
+    if not reverse:
+        instance.refresh_from_db(fields=['assigned_count', 'completed_count'])
+
+
+@receiver(pre_delete, sender=User)
+def remember_counted_tasks(sender, instance, **kwargs):
+    """
+    Note the tasks a user is assigned to or completed before they are deleted;
+    the cascade removes those rows without sending m2m_changed.
+    """
+    instance._counted_task_ids = {
+        *Task.assigned_to.through.objects.filter(user_id=instance.pk).values_list('task_id', flat=True),
+        *Task.completed_by.through.objects.filter(user_id=instance.pk).values_list('task_id', flat=True),
+    }
+
+
+@receiver(post_delete, sender=User)
+def refresh_counters_after_user_delete(sender, instance, **kwargs):
+    task_ids = getattr(instance, '_counted_task_ids', None)
+    if task_ids:
+        refresh_task_counters(task_ids)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_contact(sender, instance, **kwargs):
+    """Drop a changed or deleted user from the contact directory."""
+    contact_directory.forget(instance)
+
+
+@receiver(m2m_changed, sender=Task.assigned_to.through)
+@receiver(m2m_changed, sender=Task.completed_by.through)
+def invalidate_changed_task_lists(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate cached task lists when assignees or completers change."""
+    # Removed rows are still there before the change; invalidation itself
+    # waits for the commit
+    if action not in ('post_add', 'pre_remove', 'pre_clear'):
+        return
+    if reverse:
+        task_ids = pk_set if pk_set is not None else sender.objects.filter(user_id=instance.pk).values_list('task_id', flat=True)
+        cache.invalidate_tasks(list(task_ids), [instance.pk])
+    else:
+        cache.invalidate_tasks([instance.pk], pk_set or (), [instance.workspace_id])
+
+
+@receiver(post_save, sender=Task)
+@receiver(pre_delete, sender=Task)
+def invalidate_task(sender, instance, **kwargs):
+    cache.invalidate_tasks([instance.pk], workspace_ids=[instance.workspace_id])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    """Task lists show names and numbers, so a user change invalidates every list in their workspace."""
+    cache.invalidate([cache.users_scope(instance.workspace_id)])
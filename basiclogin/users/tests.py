@@ -1,3 +1,783 @@
-from django.test import TestCase
+import datetime
+import importlib
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import warnings
+from unittest import skipUnless
 
-# Create your tests here.
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .cache import stats as cache_stats
+from .directory import ContactDirectory, contact_directory
+from .jobs import create_reminder_job, run_reminder_job, resume_stale_jobs, job_tag
+from .models import User, Task, SentReminder, ReminderJob, Workspace
+from .scheduler import ReminderScheduler
+from .services import record_task_completion, TaskCompletionError, create_tasks, NewTask, TaskImportError
+from .utils import build_task_reminders, parse_deadline, format_deadline
+from webhook.models import OutboundMessage
+from webhook.services import TaskService
+
+
+phone_numbers = (f"9100{i:06d}" for i in itertools.count())
+
+
+def create_due_tasks(count, deadline, assignees_per_task=2):
+    """Bulk-create ``count`` in-progress tasks, each with its own creator and assignees."""
+    users = User.objects.bulk_create([
+        User(name=f"User {i}", phone_number=next(phone_numbers))
+        for i in range(count * (assignees_per_task + 1))
+    ])
+    tasks = Task.objects.bulk_create([
+        Task(
+            description=f"Task {i}",
+            created_by=users[i * (assignees_per_task + 1)],
+            deadline=deadline,
+            assigned_count=assignees_per_task,
+            completed_count=1,
+        )
+        for i in range(count)
+    ])
+
+    assigned = []
+    completed = []
+    for i, task in enumerate(tasks):
+        offset = i * (assignees_per_task + 1) + 1
+        for user in users[offset:offset + assignees_per_task]:
+            assigned.append(Task.assigned_to.through(task_id=task.id, user_id=user.id))
+        # The first assignee of every task has already finished it
+        completed.append(Task.completed_by.through(task_id=task.id, user_id=users[offset].id))
+    Task.assigned_to.through.objects.bulk_create(assigned)
+    Task.completed_by.through.objects.bulk_create(completed)
+    return tasks
+
+
+class QueryCountAssertionsMixin:
+    """Assertions for catching N+1 queries in list endpoints."""
+
+    def assertQueryCountIndependentOfSize(self, populate, fetch, sizes=(1, 5, 25)):
+        """
+        Fail if ``fetch`` runs more queries as the data set grows.
+
+        ``populate(n)`` adds ``n`` more rows, then ``fetch()`` is run once per
+        size and the number of queries it made is recorded.
+        """
+        counts = []
+        for size in sizes:
+            populate(size)
+            with CaptureQueriesContext(connection) as queries:
+                fetch()
+            counts.append(len(queries))
+        self.assertEqual(
+            len(set(counts)), 1,
+            f"Query count depends on result size: {dict(zip(sizes, counts))}",
+        )
+
+
+class ReminderQueryCountBenchmark(TestCase):
+    """The reminder job must not issue more queries as the number of due tasks grows."""
+
+    def build_reminders(self, task_count):
+        now = timezone.now()
+        Task.objects.all().delete()
+        create_due_tasks(task_count, deadline=now + datetime.timedelta(hours=23))
+
+        with CaptureQueriesContext(connection) as queries:
+            messages, processed = build_task_reminders(hours_before=24, now=now)
+
+        self.assertEqual(processed, task_count)
+        # One reminder for the creator and one for the assignee who hasn't finished
+        self.assertEqual(len(messages), task_count * 2)
+        return len(queries)
+
+    def test_query_count_is_flat_from_10_to_10000_tasks(self):
+        small = self.build_reminders(10)
+        large = self.build_reminders(10000)
+
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 3)
+
+    def test_creator_message_lists_remaining_assignees(self):
+        now = timezone.now()
+        task = create_due_tasks(1, deadline=now + datetime.timedelta(hours=23))[0]
+
+        messages, _ = build_task_reminders(hours_before=24, now=now)
+
+        creator_message = dict(messages)[task.created_by.phone_number]
+        self.assertIn("Still waiting for: User 2", creator_message)
+
+
+class ReminderSchedulerTests(TestCase):
+
+    def setUp(self):
+        self.due = timezone.now() + datetime.timedelta(days=3)
+        self.task = create_due_tasks(1, deadline=self.due)[0]
+
+    def test_each_window_is_sent_once_per_recipient(self):
+        scheduler = ReminderScheduler(windows=[24, 6, 2, 1])
+
+        # Ticks every 30 minutes over the last day before the deadline
+        sent = []
+        for half_hours in range(48, 0, -1):
+            count, _ = scheduler.tick(now=self.due - datetime.timedelta(minutes=30 * half_hours))
+            sent.append(count)
+
+        # Creator and the remaining assignee, once per window
+        self.assertEqual(sum(sent), 8)
+        self.assertEqual(SentReminder.objects.count(), 8)
+        self.assertEqual(
+            set(SentReminder.objects.values_list('window_hours', flat=True)),
+            {24, 6, 2, 1},
+        )
+
+    def test_restarted_scheduler_does_not_resend(self):
+        now = self.due - datetime.timedelta(hours=5)
+        ReminderScheduler(windows=[24, 6]).tick(now=now)
+        ReminderScheduler(windows=[24, 6]).tick(now=now + datetime.timedelta(minutes=1))
+
+        self.assertEqual(OutboundMessage.objects.count(), 2)
+
+
+class ReminderJobTests(TestCase):
+
+    def setUp(self):
+        self.now = timezone.now()
+        # Every task shares a deadline, so the checkpoint has to break ties on ID
+        self.tasks = sorted(
+            create_due_tasks(12, deadline=self.now + datetime.timedelta(hours=23)), key=lambda task: task.id,
+        )
+
+    def test_endpoint_returns_job_id_without_sending(self):
+        response = self.client.post(
+            '/api/tasks/send-reminders/', data=json.dumps({'hours': 24}), content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 202)
+        job = ReminderJob.objects.get(id=response.json()['job_id'])
+        self.assertEqual(job.status, ReminderJob.STATUS_PENDING)
+        self.assertEqual(OutboundMessage.objects.count(), 0)
+
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual(status['status'], ReminderJob.STATUS_PENDING)
+
+    def test_job_queues_every_reminder_in_chunks(self):
+        job = create_reminder_job(24, now=self.now)
+
+        job = run_reminder_job(job.id, chunk_size=5)
+
+        self.assertEqual(job.status, ReminderJob.STATUS_COMPLETED)
+        self.assertEqual(job.tasks_scanned, 12)
+        self.assertEqual(job.messages_queued, 24)
+        self.assertEqual(OutboundMessage.objects.filter(tag=job_tag(job.id)).count(), 24)
+
+    def test_stale_job_resumes_from_its_checkpoint(self):
+        job = create_reminder_job(24, now=self.now)
+        # A worker died after committing the first five tasks
+        checkpoint = self.tasks[4]
+        ReminderJob.objects.filter(id=job.id).update(
+            status=ReminderJob.STATUS_RUNNING,
+            claimed_by='dead-worker',
+            heartbeat_at=self.now - datetime.timedelta(hours=1),
+            checkpoint_deadline=checkpoint.deadline,
+            checkpoint_task_id=checkpoint.id,
+            tasks_scanned=5,
+            messages_queued=10,
+        )
+
+        self.assertEqual(resume_stale_jobs(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReminderJob.STATUS_COMPLETED)
+        self.assertEqual(job.tasks_scanned, 12)
+        # Only the seven remaining tasks were queued on resume
+        self.assertEqual(OutboundMessage.objects.filter(tag=job_tag(job.id)).count(), 14)
+
+    def test_running_job_is_not_taken_over(self):
+        job = create_reminder_job(24, now=self.now)
+        ReminderJob.objects.filter(id=job.id).update(
+            status=ReminderJob.STATUS_RUNNING, claimed_by='live-worker', heartbeat_at=timezone.now(),
+        )
+
+        self.assertEqual(resume_stale_jobs(), 0)
+        self.assertIsNone(run_reminder_job(job.id))
+        self.assertEqual(OutboundMessage.objects.count(), 0)
+
+    def test_status_reports_delivery_outcomes(self):
+        job = run_reminder_job(create_reminder_job(24, now=self.now).id)
+        messages = OutboundMessage.objects.filter(tag=job_tag(job.id))
+        OutboundMessage.objects.filter(id__in=list(messages.values_list('id', flat=True)[:20])).update(
+            status=OutboundMessage.STATUS_SENT,
+        )
+        OutboundMessage.objects.filter(id__in=list(
+            messages.filter(status=OutboundMessage.STATUS_PENDING).values_list('id', flat=True)[:3]
+        )).update(status=OutboundMessage.STATUS_DEAD)
+
+        response = self.client.get(f'/api/tasks/send-reminders/{job.id}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], ReminderJob.STATUS_COMPLETED)
+        self.assertEqual(response.json()['messages_sent'], 20)
+        self.assertEqual(response.json()['messages_failed'], 3)
+        self.assertEqual(response.json()['messages_pending'], 1)
+
+    def test_unknown_job_is_404(self):
+        response = self.client.get('/api/tasks/send-reminders/00000000-0000-0000-0000-000000000000/')
+        self.assertEqual(response.status_code, 404)
+
+
+class DeadlineTests(TestCase):
+
+    def test_reminder_window_excludes_later_tasks_on_the_same_day(self):
+        now = timezone.now()
+        soon = create_due_tasks(1, deadline=now + datetime.timedelta(minutes=50))[0]
+        create_due_tasks(1, deadline=now + datetime.timedelta(hours=3))
+
+        messages, task_count = build_task_reminders(hours_before=1, now=now)
+
+        self.assertEqual(task_count, 1)
+        self.assertIn(soon.created_by.phone_number, dict(messages))
+
+    def test_parse_deadline_accepts_an_optional_time(self):
+        with timezone.override('Asia/Kolkata'):
+            with_time = parse_deadline('2025-06-30 17:30')
+            date_only = parse_deadline('2025-06-30')
+
+            self.assertEqual(format_deadline(with_time), '2025-06-30 17:30')
+            self.assertEqual(format_deadline(date_only), '2025-06-30 23:59')
+        self.assertIsNone(parse_deadline(''))
+
+    def test_parse_deadline_returns_none_for_unreadable_values(self):
+        for value in ['2025-02-30', '2025-06-30 25:00', 'tomorrow', 20250630, ['2025-06-30']]:
+            self.assertIsNone(parse_deadline(value), value)
+
+
+class TaskListQueryCountTests(QueryCountAssertionsMixin, TestCase):
+
+    def setUp(self):
+        self.member = User.objects.create(name="Member", phone_number="9200000001")
+
+    def add_tasks(self, count):
+        tasks = create_due_tasks(count, deadline=timezone.now() + datetime.timedelta(days=1))
+        Task.assigned_to.through.objects.bulk_create([
+            Task.assigned_to.through(task_id=task.id, user_id=self.member.id) for task in tasks
+        ])
+        # Measure rendering, not the cached copies
+        cache.clear()
+        contact_directory.clear()
+
+    def test_all_tasks_endpoint(self):
+        def fetch():
+            response = self.client.get('/api/tasks/')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountIndependentOfSize(self.add_tasks, fetch)
+
+    def test_user_tasks_endpoint(self):
+        def fetch():
+            response = self.client.get(f'/api/user-tasks/{self.member.phone_number}/')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertQueryCountIndependentOfSize(self.add_tasks, fetch)
+
+    def test_task_service_listings(self):
+        self.assertQueryCountIndependentOfSize(self.add_tasks, TaskService.list_tasks)
+        self.assertQueryCountIndependentOfSize(
+            self.add_tasks, lambda: TaskService.get_tasks_for_person(self.member.id)
+        )
+
+
+class TaskListPaginationTests(TestCase):
+
+    def setUp(self):
+        create_due_tasks(7, deadline=timezone.now() + datetime.timedelta(days=1))
+
+    def test_cursor_pages_cover_every_task_once(self):
+        seen = []
+        url = '/api/tasks/?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(task['id'] for task in page['results'])
+            url = page['next']
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(set(seen), {str(pk) for pk in Task.objects.values_list('id', flat=True)})
+
+    def test_cursor_pages_cover_tasks_created_at_the_same_moment(self):
+        Task.objects.update(created_at=timezone.now())
+        seen = []
+        url = '/api/tasks/?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(task['id'] for task in page['results'])
+            url = page['next']
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+
+    def test_migration_spreads_tied_created_at(self):
+        spread = importlib.import_module('users.migrations.0009_distinct_task_created_at').spread_tied_created_at
+        backfilled = timezone.now()
+        Task.objects.update(created_at=backfilled)
+
+        spread(django_apps, None)
+
+        created = sorted(Task.objects.values_list('created_at', flat=True))
+        self.assertEqual(len(set(created)), 7)
+        self.assertEqual(created[0], backfilled)
+
+    def test_stream_returns_the_full_array(self):
+        response = self.client.get('/api/tasks/?stream=1')
+
+        self.assertTrue(response.streaming)
+        tasks = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(tasks), 7)
+        self.assertEqual(len(tasks[0]['assigned_to']), 2)
+
+    async def test_stream_is_read_asynchronously_under_asgi(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get('/api/tasks/?stream=1')
+            content = b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(len(json.loads(content)), 7)
+        self.assertFalse(
+            [warning for warning in caught if 'must consume synchronous iterators' in str(warning.message)]
+        )
+
+    def test_unpaginated_response_is_unchanged(self):
+        response = self.client.get('/api/users/')
+
+        self.assertIsInstance(response.json(), list)
+
+
+class TaskCompletionTests(TestCase):
+
+    def setUp(self):
+        self.creator = User.objects.create(name="Creator", phone_number="9300000001")
+        self.first = User.objects.create(name="First", phone_number="9300000002")
+        self.second = User.objects.create(name="Second", phone_number="9300000003")
+        self.task = Task.objects.create(description="Ship it", created_by=self.creator)
+        self.task.assigned_to.set([self.first, self.second])
+
+    def test_assignment_keeps_counter_in_sync(self):
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.assigned_count, 2)
+
+        self.second.assigned_to.remove(self.task)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.assigned_count, 1)
+
+    def test_last_completer_deletes_task_exactly_once(self):
+        first = record_task_completion(self.task.id, "+93 0000 0002")
+        repeat = record_task_completion(self.task.id, self.first.phone_number)
+        last = record_task_completion(self.task.id, self.second.phone_number)
+
+        self.assertEqual((first.status, first.completed_count, first.total_assigned), ('in_progress', 1, 2))
+        self.assertEqual([user.name for user in first.remaining_users], ["Second"])
+        self.assertEqual(repeat.completed_count, 1)
+        self.assertTrue(last.deleted)
+        self.assertEqual(last.notifications_sent, 3)
+        self.assertFalse(Task.objects.filter(id=self.task.id).exists())
+        self.assertEqual(OutboundMessage.objects.count(), 3)
+
+        with self.assertRaises(TaskCompletionError) as error:
+            record_task_completion(self.task.id, self.second.phone_number)
+        self.assertEqual(error.exception.status_code, 404)
+
+    def test_deleting_an_assignee_updates_the_counters(self):
+        self.second.delete()
+
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.assigned_count, 1)
+        # The remaining assignee is now the last one
+        self.assertTrue(record_task_completion(self.task.id, self.first.phone_number).deleted)
+        self.assertFalse(Task.objects.filter(id=self.task.id).exists())
+
+    def test_deleting_a_completer_updates_the_counters(self):
+        record_task_completion(self.task.id, self.first.phone_number)
+
+        self.first.delete()
+
+        self.task.refresh_from_db()
+        self.assertEqual((self.task.assigned_count, self.task.completed_count), (1, 0))
+
+    def test_complete_task_endpoint(self):
+        url = f'/api/tasks/{self.task.id}/complete/'
+        response = self.client.post(url, json.dumps({"phone_number": self.first.phone_number}), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['remaining_users'], [{'name': 'Second', 'phone_number': '9300000003'}])
+        self.assertEqual(self.client.post(url, {"phone_number": "9300000009"}).status_code, 404)
+
+    def test_unassigned_user_is_rejected(self):
+        with self.assertRaises(TaskCompletionError) as error:
+            record_task_completion(self.task.id, self.creator.phone_number)
+        self.assertEqual(error.exception.status_code, 403)
+
+
+class TaskImportTests(QueryCountAssertionsMixin, TestCase):
+
+    def setUp(self):
+        self.creator = User.objects.create(name="Creator", phone_number="9400000001")
+
+    def new_tasks(self, count):
+        return [
+            NewTask(f"Imported {i}", "+94 0000 0001", [next(phone_numbers), next(phone_numbers)], "2030-01-01")
+            for i in range(count)
+        ]
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        batches = {}
+        self.assertQueryCountIndependentOfSize(
+            lambda size: batches.__setitem__('next', self.new_tasks(size)),
+            lambda: create_tasks(batches['next']),
+            sizes=(1, 50),
+        )
+
+    def test_tasks_users_and_counters_are_created(self):
+        existing = User.objects.create(name="Existing", phone_number="9400000002")
+
+        created = create_tasks([
+            NewTask("First", self.creator.phone_number, ["9400000002", "9400000003", "9400000003"]),
+            NewTask("Second", "9400000004", ["9400000002"], "2030-01-01 09:30"),
+        ])
+
+        self.assertEqual(created[0]['assigned_to'], ["9400000002", "9400000003"])
+        first = Task.objects.get(id=created[0]['id'])
+        self.assertEqual(first.assigned_count, 2)
+        self.assertEqual(set(first.assigned_to.all()), {existing, User.objects.get(phone_number="9400000003")})
+        self.assertEqual(Task.objects.get(id=created[1]['id']).created_by.phone_number, "9400000004")
+        self.assertEqual(existing.assigned_to.count(), 2)
+
+    def test_csv_import(self):
+        body = (
+            "description,created_by_phone,assigned_to_phones,deadline\n"
+            "Pay rent,9400000001,9400000002|9400000003,2030-01-01\n"
+            "Buy milk,9400000001,,\n"
+        )
+        response = self.client.post('/api/tasks/import/', body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertEqual(Task.objects.filter(created_by=self.creator).count(), 2)
+
+    def test_impossible_or_numeric_deadline_is_rejected(self):
+        for deadline in ["2025-02-30", 20250630]:
+            response = self.client.post('/api/tasks/import/', json.dumps([
+                {"description": "Fine", "created_by_phone": "9200000001"},
+                {"description": "Bad deadline", "created_by_phone": "9200000001", "deadline": deadline},
+            ]), content_type='application/json')
+
+            self.assertEqual(response.status_code, 400, deadline)
+            self.assertEqual(response.json()["row"], 2)
+        self.assertFalse(Task.objects.exists())
+
+    def test_fields_of_the_wrong_type_are_rejected(self):
+        fine = {"description": "Fine", "created_by_phone": "9400000001"}
+        for malformed in [
+            {"description": 5},
+            {"created_by_phone": 9400000009},
+            {"assigned_to_phones": [9400000002]},
+            {"assigned_to_phones": {"phone": "9400000002"}},
+            {"deadline": ["2030-01-01"]},
+        ]:
+            response = self.client.post(
+                '/api/tasks/import/', json.dumps([fine, {**fine, **malformed}]), content_type='application/json',
+            )
+
+            self.assertEqual(response.status_code, 400, malformed)
+            self.assertEqual(response.json()["row"], 2, malformed)
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_invalid_row_creates_nothing(self):
+        response = self.client.post('/api/tasks/import/', json.dumps({"tasks": [
+            {"description": "Fine", "created_by_phone": "9400000001"},
+            {"description": "Broken", "created_by_phone": "9400000001", "deadline": "next week"},
+        ]}), content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['row'], 2)
+        self.assertFalse(Task.objects.exists())
+
+
+class ContactDirectoryTests(TestCase):
+
+    def setUp(self):
+        contact_directory.clear()
+        self.alice = User.objects.create(name="Alice", phone_number="9500000001")
+
+    def test_repeat_lookups_do_not_query(self):
+        contact_directory.phones_for(["Alice", "Nobody"])
+        contact_directory.user_for("+95 0000 0001")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(contact_directory.phones_for([" Alice", "Nobody"]), {"Alice": "9500000001"})
+            self.assertEqual(contact_directory.user_for("9500000001"), self.alice)
+
+    def test_saving_a_user_evicts_stale_entries(self):
+        contact_directory.phones_for(["Alice", "Alicia", "Bob"])
+        contact_directory.user_for("9500000002")
+
+        self.alice.name = "Alicia"
+        self.alice.save()
+        bob = User.objects.create(name="Bob", phone_number="9500000002")
+
+        self.assertEqual(contact_directory.phones_for(["Alice", "Alicia", "Bob"]), {"Alicia": "9500000001", "Bob": "9500000002"})
+        self.assertEqual(contact_directory.user_for("9500000002"), bob)
+
+        bob.delete()
+        self.assertIsNone(contact_directory.user_for("9500000002"))
+
+    def test_number_registered_after_a_missed_lookup_is_found(self):
+        self.assertIsNone(contact_directory.user_for("9500000002"))
+        # Registered through another process, whose signals never reach this directory
+        User.objects.bulk_create([User(name="Bob", phone_number="9500000002")])
+
+        self.assertEqual(contact_directory.user_for("9500000002").name, "Bob")
+        self.assertEqual(self.client.get('/api/user-tasks/9500000002/').status_code, 200)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        directory = ContactDirectory(max_size=2)
+        directory.phones_for(["Alice"])
+        directory.phones_for(["Bob"])
+        directory.phones_for(["Alice"])
+        directory.phones_for(["Carol"])
+
+        self.assertEqual(len(directory.phones_by_name), 2)
+        with self.assertNumQueries(0):
+            directory.phones_for(["Alice", "Carol"])
+        with self.assertNumQueries(1):
+            directory.phones_for(["Bob"])
+
+
+class PhoneNumberTests(TestCase):
+
+    def setUp(self):
+        contact_directory.clear()
+
+    def register(self, name, phone_number):
+        return self.client.post('/api/register/', {"name": name, "phone_number": phone_number})
+
+    def test_registration_stores_the_digits_only(self):
+        self.assertEqual(self.register("Alice", "+91 98000-00001").status_code, 201)
+
+        self.assertEqual(User.objects.get().phone_number, "919800000001")
+
+    def test_numbers_are_unique_once_normalized(self):
+        self.register("Alice", "+91 98000 00001")
+
+        self.assertEqual(self.register("Alice", "919800000001").json()["message"], "User already exists")
+        self.assertEqual(self.register("Bob", "91-9800-000001").status_code, 409)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_number_without_digits_is_rejected(self):
+        response = self.register("Alice", "+ (-)")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("phone_number", response.json())
+        self.assertFalse(User.objects.exists())
+
+    def test_migration_merges_users_with_the_same_number(self):
+        merge = importlib.import_module('users.migrations.0005_unique_phone_number').normalize_and_merge_users
+        # Saved before numbers were normalized; the nameless one by the webhook
+        registered, nameless = User.objects.bulk_create([
+            User(name="Alice", phone_number="+91 98000 00001"), User(name="", phone_number="919800000001"),
+        ])
+        shared = Task.objects.create(description="Shared", created_by=nameless)
+        shared.assigned_to.set([registered, nameless])
+        own = Task.objects.create(description="Own", created_by=registered)
+        own.assigned_to.set([nameless])
+        own.completed_by.set([nameless])
+        SentReminder.objects.create(task=shared, recipient=registered, window_hours=24)
+        SentReminder.objects.create(task=shared, recipient=nameless, window_hours=24)
+        SentReminder.objects.create(task=own, recipient=nameless, window_hours=24)
+
+        # The models still have everything the data migration touches
+        merge(django_apps, None)
+
+        alice = User.objects.get()
+        self.assertEqual((alice.id, alice.phone_number), (registered.id, "919800000001"))
+        self.assertEqual(Task.objects.filter(created_by=alice).count(), 2)
+        self.assertEqual(list(shared.assigned_to.all()), [alice])
+        self.assertEqual(list(own.assigned_to.all()), [alice])
+        self.assertEqual(list(own.completed_by.all()), [alice])
+        self.assertEqual(
+            sorted(SentReminder.objects.values_list('task__description', 'recipient_id')),
+            [("Own", alice.id), ("Shared", alice.id)],
+        )
+
+
+class WorkspaceTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        contact_directory.clear()
+        self.red = Workspace.objects.create(name="Red")
+        self.blue = Workspace.objects.create(name="Blue")
+        self.red_alice = User.objects.create(name="Alice", phone_number="9700000001", workspace=self.red)
+        self.blue_alice = User.objects.create(name="Alice", phone_number="9700000002", workspace=self.blue)
+
+    def test_names_are_looked_up_within_a_workspace(self):
+        self.assertEqual(contact_directory.phones_for(["Alice"], self.red.id), {"Alice": "9700000001"})
+        self.assertEqual(contact_directory.phones_for(["Alice"], self.blue.id), {"Alice": "9700000002"})
+        self.assertEqual(contact_directory.phones_for(["Alice"]), {})
+
+    def test_task_endpoint_filters_by_workspace(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_tasks([NewTask("Red task", "9700000001", ["9700000001"])], self.red.id)
+            create_tasks([NewTask("Blue task", "9700000002", [])], self.blue.id)
+
+        response = self.client.get(f'/api/tasks/?workspace={self.red.id}&page_size=10')
+        self.assertEqual([task['description'] for task in response.json()['results']], ["Red task"])
+        self.assertEqual(response.json()['results'][0]['workspace'], str(self.red.id))
+        self.assertEqual(self.client.get('/api/tasks/?workspace=red').status_code, 400)
+
+    def test_lists_without_a_workspace_only_show_the_default_one(self):
+        User.objects.create(name="Carol", phone_number="9700000003")
+        with self.captureOnCommitCallbacks(execute=True):
+            create_tasks([NewTask("Red task", "9700000001", [])], self.red.id)
+            create_tasks([NewTask("Default task", "9700000003", [])])
+
+        for query in ('', '?page_size=10', '?stream=1'):
+            users = self.client.get(f'/api/users/{query}')
+            tasks = self.client.get(f'/api/tasks/{query}')
+            if query == '?stream=1':
+                users, tasks = (json.loads(b''.join(response.streaming_content)) for response in (users, tasks))
+            else:
+                users, tasks = (response.json() for response in (users, tasks))
+                if query:
+                    users, tasks = users['results'], tasks['results']
+            self.assertEqual([user['name'] for user in users], ["Carol"], query)
+            self.assertEqual([task['description'] for task in tasks], ["Default task"], query)
+
+    def test_import_rejects_people_from_another_workspace(self):
+        with self.assertRaises(TaskImportError) as caught:
+            create_tasks([
+                NewTask("Fine", "9700000001", ["9700000003"]),
+                NewTask("Crossing over", "9700000001", ["9700000002"]),
+            ], self.red.id)
+
+        self.assertEqual(caught.exception.row, 2)
+        self.assertFalse(Task.objects.exists())
+        self.assertFalse(User.objects.filter(phone_number="9700000003").exists())
+
+    def test_changes_in_another_workspace_keep_the_list_cached(self):
+        TaskService.list_tasks(self.red.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            create_tasks([NewTask("Blue task", "9700000002", ["9700000002"])], self.blue.id)
+            self.blue_alice.name = "Alicia"
+            self.blue_alice.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(TaskService.list_tasks(self.red.id), [])
+        self.assertEqual(len(TaskService.list_tasks(self.blue.id)), 1)
+
+    def test_register_into_a_workspace(self):
+        response = self.client.post('/api/register/', {
+            "name": "Bob", "phone_number": "9700000009", "workspace": str(self.blue.id),
+        })
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(User.objects.get(phone_number="9700000009").workspace, self.blue)
+        self.assertIn({"id": str(self.blue.id), "name": "Blue"}, self.client.get('/api/workspaces/').json())
+
+
+class TaskListCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset()
+        self.creator = User.objects.create(name="Creator", phone_number="9600000001")
+        self.member = User.objects.create(name="Member", phone_number="9600000002")
+        self.other = User.objects.create(name="Other", phone_number="9600000003")
+        self.url = f'/api/user-tasks/{self.member.phone_number}/'
+
+    def add_task(self, description, *assignees):
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(description=description, created_by=self.creator)
+            task.assigned_to.set(assignees)
+        return task
+
+    def fetch(self):
+        return [task['description'] for task in self.client.get(self.url).json()]
+
+    def test_list_is_served_from_cache_until_it_changes(self):
+        task = self.add_task("First", self.member)
+        self.assertEqual(self.fetch(), ["First"])
+
+        # The user comes from the contact directory and the list from the cache
+        with self.assertNumQueries(0):
+            self.assertEqual(self.fetch(), ["First"])
+
+        self.add_task("Unrelated", self.other)
+        with self.assertNumQueries(0):
+            self.fetch()
+
+        self.add_task("Second", self.member, self.other)
+        self.assertEqual(sorted(self.fetch()), ["First", "Second"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            record_task_completion(task.id, self.member.phone_number)
+        self.assertEqual(sorted(self.fetch()), ["Second"])
+        self.assertEqual(cache_stats.as_dict()['by_list']['user'], {'hits': 2, 'misses': 3})
+
+    def test_renaming_a_user_invalidates_every_list(self):
+        self.add_task("Shared", self.member, self.other)
+        self.fetch()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.name = "Renamed"
+            self.other.save()
+
+        names = [user['name'] for user in self.client.get(self.url).json()[0]['assigned_to']]
+        self.assertIn("Renamed", names)
+
+    def test_bulk_created_tasks_invalidate_their_assignees(self):
+        self.fetch()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_tasks([NewTask("Imported", self.creator.phone_number, [self.member.phone_number])])
+
+        self.assertEqual(self.fetch(), ["Imported"])
+        self.assertEqual(TaskService.list_tasks()[0]['description'], "Imported")
+
+    def test_stats_endpoint(self):
+        self.fetch()
+        self.fetch()
+
+        stats = self.client.get('/api/cache/stats/').json()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+
+
+class FileTaskListCacheTests(TaskListCacheTests):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.cache_dir = tempfile.mkdtemp(prefix='faff-cache-tests-')
+        cls.enterClassContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cls.cache_dir,
+        }}))
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.cache_dir, ignore_errors=True)
+
+
+@skipUnless(os.environ.get('TEST_REDIS_URL'), "set TEST_REDIS_URL to a local Redis-protocol server")
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+    'LOCATION': os.environ.get('TEST_REDIS_URL'),
+}})
+class RedisTaskListCacheTests(TaskListCacheTests):
+    pass
@@ -3,9 +3,13 @@ from . import views
 
 urlpatterns = [
     path('register/', views.register_user, name='register_user'),
+    path('workspaces/', views.workspaces, name='workspaces'),
     path('user-tasks/<str:phone_number>/', views.get_user_tasks, name='get_user_tasks'),
     path('users/', views.get_all_users, name='get-all-users'),
     path('tasks/', views.get_all_tasks, name='get-all-tasks'),
+    path('tasks/import/', views.import_tasks, name='import-tasks'),
     path('tasks/<uuid:task_id>/complete/', views.complete_task, name='complete_task'),
+    path('cache/stats/', views.get_cache_stats, name='cache-stats'),
     path('tasks/send-reminders/', views.send_reminders, name='send-reminders'),
+    path('tasks/send-reminders/<uuid:job_id>/', views.reminder_job_status, name='reminder-job-status'),
 ]
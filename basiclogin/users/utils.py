@@ -1,95 +1,184 @@
 import datetime
+import logging
+from django.db.models import Prefetch
 from django.utils import timezone
-from .models import Task
-from webhook.services import send_message
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import User, Task
+from webhook.queue import enqueue_messages
 
 
-def send_task_reminders(hours_before=24):
+logger = logging.getLogger(__name__)
+
+
+# Deadlines given without a time are due at the end of their day
+DEADLINE_TIME = datetime.time(23, 59)
+
+
+def parse_deadline(value):
     """
-    Send reminders for tasks with upcoming deadlines.
-    
+    Convert a deadline into a timezone-aware datetime.
+
     Args:
-        hours_before (int): Send reminders for tasks due within this many hours
-        
+        value (str, date or datetime): "YYYY-MM-DD", "YYYY-MM-DD HH:MM", a date
+            or a datetime. Values without a time are due at ``DEADLINE_TIME``
+            and naive values are taken to be in the current time zone.
+
+    Returns:
+        datetime: The deadline, or None if no deadline was given or it could
+        not be parsed, e.g. "2025-02-30" or a number.
+    """
+    if not value or not isinstance(value, (str, datetime.date)):
+        return None
+    try:
+        if isinstance(value, str):
+            value = value.strip()
+            # Well-formed but impossible dates raise ValueError
+            value = parse_date(value) or parse_datetime(value)
+            if value is None:
+                return None
+        if not isinstance(value, datetime.datetime):
+            value = datetime.datetime.combine(value, DEADLINE_TIME)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+    except (ValueError, TypeError):
+        return None
+    return value
+
+
+def format_deadline(deadline):
+    """Format a deadline for messages, in the current time zone."""
+    if not deadline:
+        return 'No deadline'
+    return timezone.localtime(deadline).strftime('%Y-%m-%d %H:%M')
+
+
+def get_upcoming_tasks(hours_before=24, now=None):
+    """
+    Get in-progress tasks whose deadline falls inside the reminder window.
+
+    Args:
+        hours_before (int): Size of the reminder window in hours
+        now (datetime): Start of the window, defaults to the current time
+
     Returns:
-        tuple: (reminder_count, task_count) - Number of reminders sent and tasks processed
+        QuerySet: Matching tasks
     """
-    now = timezone.now()
+    now = now or timezone.now()
     
     # Calculate the time range for reminders
     reminder_time = now + datetime.timedelta(hours=hours_before)
     
-    print(f"Checking for tasks due by {reminder_time}")
-    
-    # For hour-specific reminders, we need to check the time as well
-    # Convert to date for date-only fields, or keep datetime for datetime fields
-    if hours_before <= 2:  # For short-term reminders (1-2 hours)
-        # If Task.deadline includes time
-        try:
-            # Try to filter by datetime (if deadline is a datetime field)
-            upcoming_tasks = Task.objects.filter(
-                deadline__gte=now,
-                deadline__lte=reminder_time,
-                status='in_progress'
-            )
-        except Exception:
-            # If deadline is a date-only field
-            today = now.date()
-            upcoming_tasks = Task.objects.filter(
-                deadline=today,
-                status='in_progress'
-            )
-    else:  # For longer-term reminders (24 hours, etc.)
-        # If deadline is a date field
-        reminder_date = reminder_time.date()
-        upcoming_tasks = Task.objects.filter(
-            deadline=reminder_date,
-            status='in_progress'
-        )
-    
-    reminder_count = 0
-    
+    logger.debug("Checking for tasks due by %s", reminder_time)
+
+    # A range scan on the (status, deadline) index
+    return Task.objects.filter(
+        status='in_progress',
+        deadline__gt=now,
+        deadline__lte=reminder_time,
+    )
+
+
+def with_reminder_relations(queryset):
+    """
+    Load each task's creator, assignees and completers alongside the tasks.
+
+    Adds one join and two prefetch queries, however many tasks are loaded.
+    """
+    return queryset.select_related('created_by').prefetch_related(
+        'assigned_to',
+        Prefetch('completed_by', queryset=User.objects.only('id')),
+    )
+
+
+def reminder_messages_for(task):
+    """
+    Build the reminder messages for one task loaded with ``with_reminder_relations``.
+
+    Returns:
+        list: (user, message) pairs for the creator and every assignee who
+        hasn't completed the task. A creator who is also a remaining
+        assignee gets a single combined message.
+    """
+    # Get all assigned users who haven't completed the task
+    completed_ids = {user.id for user in task.completed_by.all()}
+    remaining_users = [user for user in task.assigned_to.all() if user.id not in completed_ids]
+
+    # Prepare the reminder message
+    reminder_message = f"⏰ Reminder: Task Due Soon ⏰\n"
+    reminder_message += f"Description: {task.description}\n"
+    reminder_message += f"Deadline: {format_deadline(task.deadline)}\n"
+
+    messages = []
+    creator = task.created_by
+
+    # Remind the creator
+    if creator and creator.phone_number:
+        creator_message = reminder_message
+        creator_message += f"\nThis is a reminder for a task you created."
+
+        if remaining_users:
+            # List users who haven't completed the task
+            names = [user.name for user in remaining_users]
+            creator_message += f"\nStill waiting for: {', '.join(names)}"
+        else:
+            creator_message += "\nAll assigned users have completed this task."
+
+        if creator in remaining_users:
+            creator_message += f"\nYou have not yet completed this task."
+
+        messages.append((creator, creator_message))
+
+    # Remind assigned users who haven't completed the task
+    for user in remaining_users:
+        if user.phone_number and user != creator:
+            user_message = reminder_message
+            user_message += f"\nYou have not yet completed this task."
+            messages.append((user, user_message))
+
+    return messages
+
+
+def build_task_reminders(hours_before=24, now=None):
+    """
+    Build reminder messages for every task due inside the reminder window.
+
+    The due tasks, their creators, their assignees and the assignees who have
+    already completed them are loaded with a fixed number of queries no matter
+    how many tasks are due, and all messages are built in one pass over them.
+
+    Args:
+        hours_before (int): Build reminders for tasks due within this many hours
+        now (datetime): Start of the window, defaults to the current time
+
+    Returns:
+        tuple: (messages, task_count) - List of (phone_number, message) pairs and tasks processed
+    """
+    upcoming_tasks = with_reminder_relations(get_upcoming_tasks(hours_before, now))
+
+    messages = []
+    task_count = 0
+
     for task in upcoming_tasks:
-        print(f"Processing task: {task.id} - {task.description}")
-        
-        # Get all assigned users who haven't completed the task
-        remaining_users = task.assigned_to.exclude(id__in=task.completed_by.all())
-        
-        # Prepare the reminder message
-        reminder_message = f"⏰ Reminder: Task Due Soon ⏰\n"
-        reminder_message += f"Description: {task.description}\n"
-        reminder_message += f"Deadline: {task.deadline}\n"
-        
-        # Send reminder to the creator
-        if task.created_by and task.created_by.phone_number:
-            creator_message = reminder_message
-            creator_message += f"\nThis is a reminder for a task you created."
-            
-            if remaining_users.exists():
-                # List users who haven't completed the task
-                names = [user.name for user in remaining_users]
-                creator_message += f"\nStill waiting for: {', '.join(names)}"
-            else:
-                creator_message += "\nAll assigned users have completed this task."
-            
-            try:
-                send_message(task.created_by.phone_number, creator_message)
-                print(f"  Sent reminder to creator: {task.created_by.name}")
-                reminder_count += 1
-            except Exception as e:
-                print(f"  Failed to send reminder to creator: {str(e)}")
-        
-        # Send reminders to assigned users who haven't completed the task
-        for user in remaining_users:
-            if user.phone_number:
-                user_message = reminder_message
-                user_message += f"\nYou have not yet completed this task."
-                
-                try:
-                    send_message(user.phone_number, user_message)
-                    print(f"  Sent reminder to assignee: {user.name}")
-                    reminder_count += 1
-                except Exception as e:
-                    print(f"  Failed to send reminder to {user.name}: {str(e)}")
+        task_count += 1
+        messages.extend((user.phone_number, message) for user, message in reminder_messages_for(task))
+
+    return messages, task_count
+
+
+def send_task_reminders(hours_before=24):
+    """
+    Send reminders for tasks with upcoming deadlines.
     
-    return reminder_count, upcoming_tasks.count()
+    Args:
+        hours_before (int): Send reminders for tasks due within this many hours
+        
+    Returns:
+        tuple: (reminder_count, task_count) - Number of reminders queued and tasks processed
+    """
+    messages, task_count = build_task_reminders(hours_before)
+
+    # Queue every reminder with one bulk insert; the outbound worker sends them
+    enqueue_messages(messages)
+    logger.info("Queued %s reminders for %s tasks", len(messages), task_count)
+
+    return len(messages), task_count
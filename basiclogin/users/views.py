@@ -1,13 +1,39 @@
+import csv
+import io
+import json
+import logging
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from basiclogin.log import log_request_body
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from .models import User, Task
-from .serializers import UserSerializer, TaskSerializer
+from django.db import IntegrityError
+from .directory import contact_directory
+from .models import DEFAULT_WORKSPACE_ID, User, Task, ReminderJob, Workspace
+from .serializers import UserSerializer, TaskSerializer, WorkspaceSerializer
+from .services import (
+    record_task_completion, TaskCompletionError, create_tasks, NewTask, TaskImportError,
+    assigned_task_list,
+)
+from .cache import stats as cache_stats
+from .jobs import start_reminder_job, job_status
+from .pagination import (
+    TaskCursorPagination, UserCursorPagination,
+    wants_pagination, wants_stream, paginated_response, stream_json_array,
+)
+
+
+logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 def register_user(request):
     """Register a new user or return existing user if phone number and name match"""
-    print("Registration request:", request.data)
+    log_request_body(logger, "Registration", request.data)
     serializer = UserSerializer(data=request.data)
     
     if serializer.is_valid():
@@ -31,7 +57,14 @@ def register_user(request):
                 )
         
         # Create new user if no existing user found
-        new_user = serializer.save()
+        try:
+            new_user = serializer.save()
+        except IntegrityError:
+            # Registered concurrently by another request
+            return Response(
+                {"error": "User with this phone number already exists"},
+                status=status.HTTP_409_CONFLICT
+            )
         return Response({
             "message": "User registered successfully",
             "user": serializer.data
@@ -42,7 +75,7 @@ def register_user(request):
 @api_view(['POST'])
 def login_user(request):
     """Login a user by phone number and name"""
-    print("Login request:", request.data)
+    log_request_body(logger, "Login", request.data)
     phone_number = request.data.get('phone_number')
     name = request.data.get('name')
     
@@ -51,168 +84,252 @@ def login_user(request):
             "error": "Phone number and name are required"
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
-        user = User.objects.get(phone_number=phone_number, name=name)
-        serializer = UserSerializer(user)
-        return Response({
-            "message": "Login successful",
-            "user": serializer.data
-        }, status=status.HTTP_200_OK)
-    
-    except User.DoesNotExist:
+    user = contact_directory.user_for(phone_number)
+    if user is None or user.name != name:
         return Response({
             "error": "Invalid login credentials"
         }, status=status.HTTP_401_UNAUTHORIZED)
-    except User.MultipleObjectsReturned:
-        return Response({
-            "error": "Multiple users found. Contact support."
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    serializer = UserSerializer(user)
+    return Response({
+        "message": "Login successful",
+        "user": serializer.data
+    }, status=status.HTTP_200_OK)
 
 @api_view(['GET'])
 def get_user_tasks(request, phone_number):
-    try:
-        user = User.objects.get(phone_number=phone_number)
-    except User.DoesNotExist:
+    user = contact_directory.user_for(phone_number)
+    if user is None:
         return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
-    # Get tasks assigned to the user
-    assigned_tasks = Task.objects.filter(assigned_to=user)
+    # Tasks assigned to the user, rendered once per change
+    return Response(assigned_task_list(user.id, user.workspace_id))
+
+def _workspace_param(request):
+    """
+    The ``workspace`` query parameter as a UUID, or the default workspace's
+    ID if it was not given.
+
+    Raises:
+        ValueError: If it is not a UUID.
+    """
+    value = request.query_params.get('workspace')
+    return uuid.UUID(value) if value else DEFAULT_WORKSPACE_ID
+
+def _invalid_workspace():
+    return Response({"error": "Invalid workspace ID"}, status=status.HTTP_400_BAD_REQUEST)
 
-    # Serialize tasks
-    assigned_tasks_serializer = TaskSerializer(assigned_tasks, many=True)
+@api_view(['GET', 'POST'])
+def workspaces(request):
+    """List workspaces, or create one from a ``name``"""
+    if request.method == 'GET':
+        return Response(WorkspaceSerializer(Workspace.objects.order_by('name'), many=True).data)
 
-    return Response(assigned_tasks_serializer.data)
+    serializer = WorkspaceSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    serializer.save()
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 @api_view(['GET'])
 def get_all_users(request):
-    users = User.objects.all()
+    """
+    Get the users of one ``workspace``, the default one unless given. Pass
+    ``page_size`` or ``cursor`` for cursor pagination, or ``stream=1`` to
+    stream the full list.
+    """
+    try:
+        workspace_id = _workspace_param(request)
+    except ValueError:
+        return _invalid_workspace()
+    users = User.objects.filter(workspace_id=workspace_id)
+    if wants_stream(request):
+        return stream_json_array(request, users.order_by('id'), UserSerializer)
+    if wants_pagination(request):
+        return paginated_response(request, users, UserSerializer, UserCursorPagination)
     serializer = UserSerializer(users, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 def get_all_tasks(request):
-    """Get all tasks in the system"""
-    tasks = Task.objects.all()
+    """
+    Get the tasks of one ``workspace``, the default one unless given. Pass
+    ``page_size`` or ``cursor`` for cursor pagination, or ``stream=1`` to
+    stream the full list.
+    """
+    try:
+        workspace_id = _workspace_param(request)
+    except ValueError:
+        return _invalid_workspace()
+    # Served from the (workspace, created_at) index, newest first
+    tasks = Task.objects.with_people().filter(workspace_id=workspace_id)
+    if wants_stream(request):
+        return stream_json_array(request, tasks.order_by('-created_at', '-id'), TaskSerializer)
+    if wants_pagination(request):
+        return paginated_response(request, tasks, TaskSerializer, TaskCursorPagination)
     serializer = TaskSerializer(tasks, many=True)
     return Response(serializer.data)
 
-@api_view(['POST'])
-def send_reminders(request):
-    """Manually trigger task reminders"""
-    from .utils import send_task_reminders
-    
+def _request_data(request):
+    """Read a JSON or form-encoded body in a plain (non-DRF) view."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except json.JSONDecodeError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+@csrf_exempt
+@require_POST
+async def send_reminders(request):
+    """
+    Start a background job that queues reminders for tasks due within
+    ``hours`` hours (default 24), and return its ID straight away.
+    """
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid request body"}, status=status.HTTP_400_BAD_REQUEST)
+
     # Get hours parameter from request, default to 24
-    hours = request.data.get('hours', 24)
+    hours = data.get('hours', 24)
     try:
         hours = int(hours)
     except (ValueError, TypeError):
-        return Response({"error": "Hours must be a valid integer"}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Send reminders
-    reminder_count, task_count = send_task_reminders(hours_before=hours)
-    
-    return Response({
-        "message": f"Successfully sent {reminder_count} reminders for {task_count} tasks",
-        "reminder_count": reminder_count,
-        "task_count": task_count
+        return JsonResponse({"error": "Hours must be a valid integer"}, status=status.HTTP_400_BAD_REQUEST)
+    if hours < 0:
+        return JsonResponse({"error": "Hours must not be negative"}, status=status.HTTP_400_BAD_REQUEST)
+
+    job = await sync_to_async(start_reminder_job)(hours)
+
+    return JsonResponse({
+        "message": "Reminder job started",
+        "job_id": str(job.id),
+        "status_url": f"/api/tasks/send-reminders/{job.id}/",
+    }, status=status.HTTP_202_ACCEPTED)
+
+async def reminder_job_status(request, job_id):
+    """Progress of a reminder job started by send_reminders"""
+    try:
+        job = await ReminderJob.objects.aget(id=job_id)
+    except ReminderJob.DoesNotExist:
+        return JsonResponse({"error": "Reminder job not found"}, status=status.HTTP_404_NOT_FOUND)
+    return JsonResponse(await sync_to_async(job_status)(job))
+
+@csrf_exempt
+@require_POST
+async def complete_task(request, task_id):
+    """Mark a task as completed by a user and delete if all users have completed"""
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid request body"}, status=status.HTTP_400_BAD_REQUEST)
+    log_request_body(logger, "Task completion", data)
+
+    phone_number = data.get('phone_number')
+    if not phone_number:
+        return JsonResponse({"error": "Phone number is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+    # The completion holds a row lock inside a transaction, which the async
+    # ORM can't do, so it runs in a worker thread
+    try:
+        result = await sync_to_async(record_task_completion)(task_id, phone_number)
+    except TaskCompletionError as e:
+        return JsonResponse({"error": e.message}, status=e.status_code)
+    except Exception as e:
+        logger.exception("Error completing task %s", task_id)
+        return JsonResponse({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    if result.deleted:
+        return JsonResponse({
+            "message": "Task completed by all users and deleted",
+            "status": "deleted",
+            "notifications_sent": result.notifications_sent
+        })
+
+    # Return remaining users who haven't completed
+    remaining_serializer = UserSerializer(result.remaining_users, many=True)
+    return JsonResponse({
+        "message": "Task completion recorded",
+        "status": "in_progress",
+        "completed_count": result.completed_count,
+        "total_assigned": result.total_assigned,
+        "remaining_users": remaining_serializer.data
     })
 
+def _tasks_from_csv(text):
+    """Read tasks from CSV with a header row; assignees are separated by ``|``."""
+    return [
+        NewTask(
+            description=row.get('description') or '',
+            created_by=row.get('created_by_phone') or '',
+            assigned_to=[phone for phone in (row.get('assigned_to_phones') or '').split('|') if phone.strip()],
+            deadline=row.get('deadline') or None,
+        )
+        for row in csv.DictReader(io.StringIO(text))
+    ]
+
+def _string_field(row, name, number, default=''):
+    """``row[name]``, which must be a string if given; raises TaskImportError otherwise."""
+    value = row.get(name)
+    if value is None:
+        return default
+    if not isinstance(value, str):
+        raise TaskImportError(f"{name} must be a string", number)
+    return value
+
+def _tasks_from_json(data):
+    """Read tasks from JSON objects, checking that every field has the right type."""
+    rows = data.get('tasks') if isinstance(data, dict) else data
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise TaskImportError("expected a list of task objects", 0)
+    new_tasks = []
+    for number, row in enumerate(rows, start=1):
+        assigned_to = row.get('assigned_to_phones') or []
+        if isinstance(assigned_to, str):
+            assigned_to = assigned_to.split('|')
+        if not isinstance(assigned_to, list) or not all(isinstance(phone, str) for phone in assigned_to):
+            raise TaskImportError("assigned_to_phones must be a list of strings", number)
+        new_tasks.append(NewTask(
+            description=_string_field(row, 'description', number),
+            created_by=_string_field(row, 'created_by_phone', number),
+            assigned_to=assigned_to,
+            deadline=_string_field(row, 'deadline', number, default=None) or None,
+        ))
+    return new_tasks
+
 @api_view(['POST'])
-def complete_task(request, task_id):
-    """Mark a task as completed by a user and delete if all users have completed"""
-    # Print request data for debugging
-    print(f"Request data: {request.data}")
-    print(f"Request content type: {request.content_type}")
-    print(f"Task ID: {task_id}")
-    
+def import_tasks(request):
+    """
+    Create many tasks in one request.
+
+    Accepts a JSON list of tasks (or ``{"tasks": [...]}``) using the same field
+    names as task creation, or ``text/csv`` with the columns description,
+    created_by_phone, assigned_to_phones (separated by ``|``) and deadline.
+    Tasks go in the ``workspace`` query parameter's workspace, or the default
+    one. Unknown phone numbers become new users there. Either every task is
+    created or none are.
+    """
     try:
-        # Get the task
-        task = Task.objects.get(id=task_id)
-        
-        # Get the user from phone number
-        phone_number = request.data.get('phone_number')
-        print(f"Phone number from request: {phone_number}")
-        
-        if not phone_number:
-            return Response({"error": "Phone number is required"}, status=status.HTTP_400_BAD_REQUEST)
-        
-        print(f"Looking up user with phone number: {phone_number}")
-        
-        try:
-            user = User.objects.get(phone_number=phone_number)
-            print(f"Found user: {user.name} ({user.phone_number})")
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-        
-        # Check if user is assigned to this task
-        if user not in task.assigned_to.all():
-            print(f"User {user.name} is not assigned to task {task_id}")
-            return Response({"error": "User is not assigned to this task"}, status=status.HTTP_403_FORBIDDEN)
-        
-        print(f"User {user.name} is assigned to task {task_id}")
-        
-        # Add user to completed_by if not already there
-        if user not in task.completed_by.all():
-            task.completed_by.add(user)
-            print(f"Added user {user.name} to completed_by")
-        else:
-            print(f"User {user.name} already marked task as completed")
-            
-        # Check if all users have completed
-        if task.is_completed_by_all():
-            print(f"All users have completed task {task_id}. Sending notifications and deleting task.")
-            
-            # Get all users involved in the task
-            all_users = list(task.assigned_to.all())
-            creator = task.created_by
-            
-            # Add creator to notification list if not already in assigned users
-            if creator not in all_users:
-                all_users.append(creator)
-            
-            # Import the message sending function
-            from webhook.services import send_message
-            
-            # Prepare completion message
-            completion_message = f"🎉 Task Completed! 🎉\n"
-            completion_message += f"Description: {task.description}\n"
-            completion_message += f"All assigned users have completed this task.\n"
-            completion_message += f"The task has been removed from the system.\n"
-            completion_message += f"Thank you for your collaboration!"
-            
-            # Send message to all users
-            for user in all_users:
-                try:
-                    if user.phone_number:
-                        send_message(user.phone_number, completion_message)
-                        print(f"Sent completion notification to {user.name} ({user.phone_number})")
-                except Exception as e:
-                    print(f"Failed to send notification to {user.name}: {str(e)}")
-            
-            # Delete the task
-            task.delete()
-            
-            return Response({
-                "message": "Task completed by all users and deleted",
-                "status": "deleted",
-                "notifications_sent": len(all_users)
-            })
+        workspace_id = _workspace_param(request)
+    except ValueError:
+        return _invalid_workspace()
+    if not Workspace.objects.filter(id=workspace_id).exists():
+        return Response({"error": "Workspace not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        if request.content_type.startswith('text/csv'):
+            new_tasks = _tasks_from_csv(request.body.decode('utf-8-sig'))
         else:
-            # Return remaining users who haven't completed
-            remaining_users = task.assigned_to.exclude(id__in=task.completed_by.all())
-            remaining_serializer = UserSerializer(remaining_users, many=True)
-            print(f"Task {task_id} completion recorded. {task.completed_by.count()}/{task.assigned_to.count()} users completed.")
-            return Response({
-                "message": "Task completion recorded",
-                "status": "in_progress",
-                "completed_count": task.completed_by.count(),
-                "total_assigned": task.assigned_to.count(),
-                "remaining_users": remaining_serializer.data
-            })
-            
-    except Task.DoesNotExist:
-        print(f"Task {task_id} not found")
-        return Response({"error": "Task not found"}, status=status.HTTP_404_NOT_FOUND)
-    except Exception as e:
-        print(f"Error in complete_task: {str(e)}")
-        return Response({"error": f"An error occurred: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            new_tasks = _tasks_from_json(request.data)
+        created = create_tasks(new_tasks, workspace_id)
+    except TaskImportError as e:
+        return Response({"error": str(e), "row": e.row}, status=status.HTTP_400_BAD_REQUEST)
+    except UnicodeDecodeError:
+        return Response({"error": "CSV must be UTF-8 encoded"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({"created": len(created), "tasks": created}, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+def get_cache_stats(request):
+    """Task list cache hits and misses in this process"""
+    return Response(cache_stats.as_dict())
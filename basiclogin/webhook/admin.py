@@ -1,3 +1,28 @@
 from django.contrib import admin
+from django.utils import timezone
+from .models import OutboundMessage, InboundMessage
 
-# Register your models here.
+
+@admin.register(OutboundMessage)
+class OutboundMessageAdmin(admin.ModelAdmin):
+    list_display = ('to', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to',)
+    actions = ['requeue']
+
+    @admin.action(description='Requeue selected messages')
+    def requeue(self, request, queryset):
+        count = queryset.exclude(status=OutboundMessage.STATUS_SENT).update(
+            status=OutboundMessage.STATUS_PENDING,
+            attempts=0,
+            next_attempt_at=timezone.now(),
+            claimed_by='',
+            claimed_at=None,
+        )
+        self.message_user(request, f"Requeued {count} messages")
+
+
+@admin.register(InboundMessage)
+class InboundMessageAdmin(admin.ModelAdmin):
+    list_display = ('message_id', 'sender', 'received_at')
+    search_fields = ('message_id', 'sender')
@@ -0,0 +1,283 @@
+"""
+WhatsApp command registry.
+
+Each command registers a keyword, a grammar for its arguments and a handler.
+Parsing is a single pass: one precompiled pattern, built from every registered
+keyword, picks the command off the front of the message and the command's own
+precompiled grammar matches the rest. Adding a command means writing one
+handler, nothing else changes.
+"""
+import re
+import uuid
+from dataclasses import dataclass
+from typing import Callable
+
+from metrics.collector import tag_command
+from users import cache
+from users.directory import contact_directory
+from users.models import DEFAULT_WORKSPACE_ID
+from users.services import NewTask
+from users.utils import parse_deadline, format_deadline
+from .rendering import LIST_FILTERS, list_replies, person_replies
+from .services import get_contact_numbers, TaskService, mark_task_as_done
+
+
+class CommandSyntaxError(Exception):
+    """A message starts with a known keyword but its arguments don't parse."""
+
+    def __init__(self, command, reply):
+        super().__init__(reply)
+        self.command = command
+        self.reply = reply
+
+
+@dataclass(frozen=True)
+class Command:
+    name: str
+    grammar: re.Pattern
+    handler: Callable
+    # Reply sent when the arguments don't match the grammar
+    usage: str
+    # Status reported in the webhook response for a syntax error
+    error_status: str
+
+
+@dataclass
+class CommandContext:
+    """What a handler needs to know about the message it is answering."""
+    from_number: str
+    sender: object
+    replies: list
+
+    def reply(self, text, to=None):
+        self.replies.append((to or self.from_number, text))
+
+    @property
+    def workspace_id(self):
+        """The sender's workspace; senders who aren't users yet are in the default one."""
+        return self.sender.workspace_id if self.sender is not None else DEFAULT_WORKSPACE_ID
+
+    def refuse_non_member(self):
+        """
+        Tell a sender who isn't a user that they can't read any workspace's
+        tasks. Returns the handler's result, or None for members.
+        """
+        if self.sender is not None:
+            return None
+        self.reply("You are not a member of any workspace. Register to see its tasks.")
+        return {"status": "Not a member"}
+
+
+class CommandRegistry:
+
+    def __init__(self):
+        self._commands = {}
+        self._tokenizer = None
+
+    def command(self, keyword, grammar, usage='', error_status='Command error'):
+        """Register the decorated function as the handler for ``keyword``."""
+        def register(handler):
+            name = ' '.join(keyword.upper().split())
+            self._commands[name] = Command(
+                name=name,
+                grammar=re.compile(grammar, re.IGNORECASE | re.DOTALL),
+                handler=handler,
+                usage=usage,
+                error_status=error_status,
+            )
+            self._tokenizer = None
+            return handler
+        return register
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            # Longest keyword first, so "TASKS FOR" wins over "TASK"
+            keywords = sorted(self._commands, key=len, reverse=True)
+            alternatives = '|'.join(r'\s+'.join(map(re.escape, name.split())) for name in keywords)
+            self._tokenizer = re.compile(rf'\s*({alternatives})(?![^\W_])(.*)', re.IGNORECASE | re.DOTALL)
+        return self._tokenizer
+
+    def identify(self, text):
+        """Return the name of the command ``text`` starts with, or None."""
+        token = self.tokenizer.match(text)
+        return ' '.join(token.group(1).upper().split()) if token else None
+
+    def parse(self, text):
+        """
+        Split a message into its command and arguments.
+
+        Returns:
+            tuple: (Command, dict of arguments), or None if the message is not
+            a command.
+
+        Raises:
+            CommandSyntaxError: The arguments don't match the command's grammar.
+        """
+        token = self.tokenizer.match(text)
+        if token is None:
+            return None
+        command = self._commands[' '.join(token.group(1).upper().split())]
+        arguments = command.grammar.match(token.group(2))
+        if arguments is None:
+            raise CommandSyntaxError(command, command.usage)
+        return command, arguments.groupdict()
+
+    def dispatch(self, text, context):
+        """
+        Run the command in ``text``.
+
+        Returns:
+            dict: The outcome reported for this message in the webhook response.
+        """
+        try:
+            parsed = self.parse(text)
+        except CommandSyntaxError as e:
+            tag_command(e.command.name)
+            context.reply(e.reply)
+            return {"status": e.command.error_status}
+        if parsed is None:
+            return {"status": "Message received (not a command)"}
+        command, arguments = parsed
+        tag_command(command.name)
+        return command.handler(context, **arguments)
+
+
+commands = CommandRegistry()
+tasks_storage = TaskService()
+
+
+@commands.command(
+    'TASK',
+    # TASK, [John|Sarah], 2025-06-30 17:00, Project proposal
+    # The deadline is optional and may leave out the time.
+    grammar=r'\s*,\s*\[(?P<people>[^\]]*)\][^,]*'
+            r'(?:,\s*(?P<deadline>\d{4}-\d{2}-\d{2}(?:\s+\d{1,2}:\d{2})?)\s*(?=,|$))?'
+            r'(?:,\s*(?P<notes>.*?))?\s*$',
+    usage='People must be enclosed in square brackets. Example: TASK, [John|Sarah], 2025-06-30 17:00, Project proposal',
+    error_status='People input error',
+)
+def handle_task(context, people, deadline, notes):
+    return create_announced_tasks(context, [(people, deadline, notes)])
+
+
+def create_announced_tasks(context, parsed_tasks):
+    """
+    Create tasks from parsed TASK arguments in one batch and announce each
+    one to its creator and assignees.
+    """
+    parsed_tasks = [
+        ([name.strip() for name in people.split('|')], ' '.join(deadline.split()) if deadline else '', notes or '')
+        for people, deadline, notes in parsed_tasks
+    ]
+    contact_numbers = get_contact_numbers(
+        {name for people, _, _ in parsed_tasks for name in people}, context.workspace_id,
+    )
+
+    created = tasks_storage.add_tasks([
+        NewTask(notes, context.from_number, [contact_numbers[name] for name in people], deadline)
+        for people, deadline, notes in parsed_tasks
+    ], context.workspace_id)
+    for task, (people, deadline, notes) in zip(created, parsed_tasks):
+        task_contacts = {name: contact_numbers[name] for name in people}
+        task_message = f"New Task (ID: {task['id']}):\n"
+        task_message += f"👥 People: {', '.join(people)}\n"
+        if deadline:
+            task_message += f"📅 Deadline: {format_deadline(parse_deadline(deadline))}\n"
+        task_message += f"📝 Notes: {notes or 'No additional notes'}\n"
+        task_message += "📱 Contact Numbers:\n" + '\n'.join([f"{name}: {number}" for name, number in task_contacts.items()])
+
+        context.reply(task_message)
+        for number in dict.fromkeys(task_contacts.values()):
+            if number != context.from_number:
+                context.reply(task_message, to=number)
+    return {"status": "success", "created": len(created)}
+
+
+def dispatch_message(text, context):
+    """
+    Run the command in a message.
+
+    A message made of several TASK lines creates all of its tasks in one
+    batch; if any line doesn't parse, none are created.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if len(lines) < 2 or any(commands.identify(line) != 'TASK' for line in lines):
+        return commands.dispatch(text, context)
+
+    tag_command('TASK')
+    parsed_tasks = []
+    for number, line in enumerate(lines, start=1):
+        try:
+            command, arguments = commands.parse(line)
+        except CommandSyntaxError as e:
+            context.reply(f"Line {number}: {e.reply}")
+            return {"status": e.command.error_status}
+        parsed_tasks.append((arguments['people'], arguments['deadline'], arguments['notes']))
+    return create_announced_tasks(context, parsed_tasks)
+
+
+@commands.command(
+    'LIST',
+    # LIST, LIST 2, LIST overdue, LIST overdue 2
+    grammar=rf'(?:\s+(?P<list_filter>{"|".join(LIST_FILTERS)}))?(?:\s+(?P<page>\d+))?\s*$',
+    usage=f'Format: LIST [{"|".join(LIST_FILTERS)}] [page]',
+)
+def handle_list(context, list_filter, page):
+    if refused := context.refuse_non_member():
+        return refused
+    list_filter = list_filter.lower() if list_filter else None
+    page = max(int(page or 1), 1)
+    workspace_id = context.workspace_id
+    if list_filter:
+        # Filters depend on the time of day, so they are always rendered fresh
+        replies = list_replies(workspace_id, list_filter, page)
+    else:
+        replies = cache.cached_task_list(
+            f'list:{workspace_id}:{page}', workspace_id, [cache.workspace_scope(workspace_id)],
+            lambda: list_replies(workspace_id, None, page),
+        )
+    for reply in replies:
+        context.reply(reply)
+    return {"status": "success"}
+
+
+@commands.command(
+    'TASKS FOR',
+    grammar=r'\s+(?P<person_name>\S.*?)(?:\s+(?P<page>\d+))?\s*$',
+    usage='Please say whose tasks to list. Format: TASKS FOR name [page]',
+)
+def handle_tasks_for(context, person_name, page):
+    if refused := context.refuse_non_member():
+        return refused
+    page = max(int(page or 1), 1)
+    phone = contact_directory.phones_for([person_name], context.workspace_id).get(person_name)
+    user = contact_directory.user_for(phone) if phone else None
+    if user is None:
+        replies = person_replies(None, person_name, page)
+    else:
+        replies = cache.cached_task_list(
+            f'person-list:{user.id}:{page}', user.workspace_id, [cache.user_scope(user.id)],
+            lambda: person_replies(user, user.name, page),
+        )
+    for reply in replies:
+        context.reply(reply)
+    return {"status": "success"}
+
+
+@commands.command(
+    'DONE',
+    grammar=r'\s+(?P<task_id>\S+)',
+    usage='Please provide a task ID. Format: DONE task-id',
+    error_status='Task completion error',
+)
+def handle_done(context, task_id):
+    try:
+        task_id = str(uuid.UUID(task_id))
+    except ValueError:
+        context.reply(f"Invalid task ID format: {task_id}. Please provide a valid task ID.")
+        return {"status": "Task completion error"}
+
+    success, reply = mark_task_as_done(task_id, context.from_number, user=context.sender)
+    context.reply(reply)
+    return {"status": "Task completion processed", "success": success}
@@ -0,0 +1,93 @@
+"""
+A stand-in for the WhatsApp gateway that runs on localhost.
+
+It accepts ``POST /messages/text`` like the real gateway and answers the way
+its responder (see ``webhook.transports``) decides: a ``SimulatedGateway``
+with some latency, failures and 429s, or a ``Replayer`` playing back
+recorded traffic. The outbound worker can so be exercised end to end, over
+real connections, without sending anything. Used by the benchmark suite and
+``manage.py run_fake_gateway``.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .transports import Reply, SimulatedGateway
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path != '/messages/text':
+            self.respond(Reply(404, {"error": "Not found"}))
+            return
+
+        reply = self.server.gateway.responder.respond(json.loads(body or b'{}'))
+        if reply.delay:
+            time.sleep(reply.delay)
+        if reply.status_code is None:
+            # Hang up without answering, like a gateway that fell over
+            self.close_connection = True
+            return
+        self.respond(reply)
+
+    def respond(self, reply):
+        content = json.dumps(reply.body).encode()
+        try:
+            self.send_response(reply.status_code)
+            for name, value in reply.headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up waiting, e.g. on its read timeout
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGateway:
+    """
+    Run the stand-in on a local port; use as a context manager.
+
+    Args:
+        responder: Decides every answer; defaults to a ``SimulatedGateway``
+            that accepts everything at once.
+        port (int): Port to listen on; 0 picks a free one.
+    """
+
+    def __init__(self, responder=None, host='127.0.0.1', port=0):
+        self.responder = responder or SimulatedGateway()
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.server = ThreadingHTTPServer((self.host, self.port), FakeGatewayHandler)
+        self.server.daemon_threads = True
+        self.server.gateway = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-gateway', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
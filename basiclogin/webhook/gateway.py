@@ -0,0 +1,295 @@
+"""
+HTTP clients for the WhatsApp gateway.
+
+Each process keeps one ``GatewayClient`` (see ``get_client``) whose
+``requests.Session`` holds a pool of keep-alive connections, so repeated
+sends reuse the same TCP/TLS connection instead of reconnecting per message.
+
+``AsyncGatewayClient`` (see ``get_async_client``) does the same over
+``httpx.AsyncClient`` for code running on an event loop, where many sends can
+be in flight on one thread.
+
+Both clients take a token from the shared ``rate_limiter`` before every send
+and raise ``RateLimited`` instead of sending when none is left, or when the
+gateway itself answers 429.
+
+Where sends go is set by ``GATEWAY_URL`` and ``GATEWAY_TRANSPORT``; see
+``webhook.transports`` for the in-memory, simulated and replayed gateways.
+"""
+import asyncio
+import os
+import threading
+import time
+import weakref
+from collections import Counter
+
+import httpx
+import requests
+from django.conf import settings
+
+from metrics.collector import record_gateway_call
+from .ratelimit import rate_limiter
+from .transports import build_adapter, build_async_transport
+
+
+class MessageDeliveryError(Exception):
+    """Raised when the WhatsApp gateway does not accept a message."""
+
+
+class RateLimited(MessageDeliveryError):
+    """Raised when a message must wait ``retry_after`` seconds before it is sent."""
+
+    def __init__(self, retry_after, message=''):
+        super().__init__(message or f"Rate limited, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def retry_after(response):
+    """Seconds the gateway asked us to wait in a 429 response."""
+    try:
+        return max(float(response.headers.get('Retry-After', '')), 0.0)
+    except ValueError:
+        return settings.OUTBOUND_RETRY_BACKOFF
+
+
+def check_response(response):
+    """Raise unless the gateway accepted the message; works for requests and httpx responses."""
+    if response.status_code == 429:
+        raise RateLimited(retry_after(response), f"Gateway returned 429: {response.text}")
+    if response.status_code != 200:
+        raise MessageDeliveryError(f"Gateway returned {response.status_code}: {response.text}")
+
+
+def acquire(limiter, to):
+    wait = limiter.acquire(to)
+    if wait:
+        raise RateLimited(wait)
+
+
+class DeliveryStats:
+    """Thread-safe request, status code and latency counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._errors = 0
+        self._status_codes = Counter()
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def record(self, elapsed, status_code):
+        """Count one request; ``status_code`` is None if no response arrived."""
+        # Also counted against the current request, if there is one
+        record_gateway_call(elapsed)
+        with self._lock:
+            self._requests += 1
+            self._latency_total += elapsed
+            self._latency_max = max(self._latency_max, elapsed)
+            if status_code is None:
+                self._errors += 1
+            else:
+                self._status_codes[status_code] += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "errors": self._errors,
+                "status_codes": dict(self._status_codes),
+                "latency_avg": self._latency_total / self._requests if self._requests else 0.0,
+                "latency_max": self._latency_max,
+            }
+
+
+class GatewayClient:
+    """Sends messages over a pooled session and keeps delivery counters."""
+
+    def __init__(
+        self, token=None, connect_timeout=None, read_timeout=None, pool_size=None, limiter=None, base_url=None,
+    ):
+        self.base_url = base_url or settings.GATEWAY_URL
+        self.limiter = limiter or rate_limiter
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else settings.GATEWAY_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else settings.GATEWAY_READ_TIMEOUT,
+        )
+
+        self.adapter = build_adapter(pool_size or settings.GATEWAY_POOL_SIZE)
+        self.session = requests.Session()
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {token if token is not None else settings.WHAPI_TOKEN}",
+            "Content-Type": "application/json",
+        })
+
+        self.delivery_stats = DeliveryStats()
+
+    def send_text(self, to, body):
+        """
+        Send a text message.
+
+        Args:
+            to (str): Recipient phone number.
+            body (str): Message text.
+
+        Raises:
+            RateLimited: If the message has to wait for the rate limit.
+            MessageDeliveryError: If the gateway rejects the message.
+            requests.RequestException: If the gateway cannot be reached in time.
+        """
+        acquire(self.limiter, to)
+        started = time.monotonic()
+        try:
+            response = self.session.post(
+                f"{self.base_url}/messages/text",
+                json={"to": to, "body": body},
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            self.delivery_stats.record(time.monotonic() - started, None)
+            raise
+        self.delivery_stats.record(time.monotonic() - started, response.status_code)
+
+        check_response(response)
+        return response
+
+    def _connection_counts(self):
+        """Return (connections opened, requests made) across the session's pools."""
+        opened = made = 0
+        # Only HTTP transports have connections to count
+        poolmanager = getattr(self.adapter, 'poolmanager', None)
+        if poolmanager is None:
+            return opened, made
+        pools = poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+                made += pool.num_requests
+        return opened, made
+
+    def stats(self):
+        """
+        Snapshot of the client's counters.
+
+        Returns:
+            dict: Request, error and status code counts, latency in seconds and
+            the share of requests that reused an open connection.
+        """
+        opened, made = self._connection_counts()
+        return {
+            **self.delivery_stats.as_dict(),
+            "connections_opened": opened,
+            "connection_reuse_rate": 1 - opened / made if made else 0.0,
+            "rate_limited": self.limiter.limited,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Return this process's shared gateway client.
+
+    The client is created lazily and recreated after a fork, so gunicorn
+    workers never share sockets with their parent.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = GatewayClient()
+                _client_pid = pid
+    return _client
+
+
+def set_client(client):
+    """
+    Make ``client`` this process's shared gateway client, e.g. one pointed at
+    a stand-in gateway.
+
+    Returns:
+        GatewayClient: The client it replaces, or None.
+    """
+    global _client, _client_pid
+    with _client_lock:
+        previous = _client
+        _client = client
+        _client_pid = os.getpid()
+    return previous
+
+
+class AsyncGatewayClient:
+    """
+    Sends messages from async code over a pooled ``httpx.AsyncClient``.
+
+    The underlying connections belong to the event loop the client was
+    created on; use ``get_async_client`` to get the one for the running loop.
+    """
+
+    def __init__(
+        self, token=None, connect_timeout=None, read_timeout=None, pool_size=None, transport=None, limiter=None,
+        base_url=None,
+    ):
+        self.base_url = base_url or settings.GATEWAY_URL
+        self.limiter = limiter or rate_limiter
+        connect_timeout = connect_timeout if connect_timeout is not None else settings.GATEWAY_CONNECT_TIMEOUT
+        read_timeout = read_timeout if read_timeout is not None else settings.GATEWAY_READ_TIMEOUT
+        pool_size = pool_size or settings.GATEWAY_POOL_SIZE
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            headers={
+                "Authorization": f"Bearer {token if token is not None else settings.WHAPI_TOKEN}",
+                "Content-Type": "application/json",
+            },
+            transport=transport or build_async_transport(pool_size),
+        )
+        self.delivery_stats = DeliveryStats()
+
+    async def send_text(self, to, body):
+        """
+        Send a text message.
+
+        Raises:
+            RateLimited: If the message has to wait for the rate limit.
+            MessageDeliveryError: If the gateway rejects the message.
+            httpx.HTTPError: If the gateway cannot be reached in time.
+        """
+        acquire(self.limiter, to)
+        started = time.monotonic()
+        try:
+            response = await self.client.post(f"{self.base_url}/messages/text", json={"to": to, "body": body})
+        except httpx.HTTPError:
+            self.delivery_stats.record(time.monotonic() - started, None)
+            raise
+        self.delivery_stats.record(time.monotonic() - started, response.status_code)
+
+        check_response(response)
+        return response
+
+    def stats(self):
+        return {**self.delivery_stats.as_dict(), "rate_limited": self.limiter.limited}
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# One async client per event loop, dropped with the loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    """Return the shared async gateway client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = AsyncGatewayClient()
+    return client
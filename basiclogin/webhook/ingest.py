@@ -0,0 +1,153 @@
+"""
+Idempotent webhook ingestion.
+
+Gateways redeliver a webhook when the response is slow, so the same message
+can arrive several times. Each message is recorded in ``InboundMessage`` under
+the gateway's message ID before it is processed; the unique constraint lets
+exactly one delivery through. A batch that fails before its replies are queued
+is released again, so the gateway's redelivery is processed.
+
+A per-process TTL cache sits in front of the table so retries seen recently
+are acknowledged without a database round trip. Rows older than
+``INBOUND_LOG_RETENTION_DAYS`` are pruned by the reminder scheduler; by then
+the gateway has long stopped redelivering them.
+"""
+import datetime
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+from users.models import normalize_phone_number
+from .models import InboundMessage
+
+
+class DedupCache:
+    """Remembers message IDs for ``ttl`` seconds, holding at most ``max_size``."""
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Entries are kept in insertion order, so expired ones are at the front
+        while self._expires:
+            key, expires = next(iter(self._expires.items()))
+            if expires > now and len(self._expires) <= self.max_size:
+                break
+            self._expires.popitem(last=False)
+
+    def __contains__(self, key):
+        now = time.monotonic()
+        with self._lock:
+            expires = self._expires.get(key)
+            return expires is not None and expires > now
+
+    def add_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                self._expires.pop(key, None)
+                self._expires[key] = now + self.ttl
+            self._evict(now)
+
+    def discard_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._expires.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._expires.clear()
+
+    def __len__(self):
+        return len(self._expires)
+
+
+recent_messages = DedupCache(settings.INBOUND_DEDUP_TTL, settings.INBOUND_DEDUP_MAX_SIZE)
+
+
+async def aclaim_new_messages(messages):
+    """
+    Record a batch of webhook messages and return the ones to process.
+
+    Messages whose ID is in the cache are dropped straight away. The rest are
+    inserted into the ingestion log in one statement through the async ORM,
+    ignoring conflicts, and only the rows this call inserted are claimed.
+    Messages without an ID cannot be deduplicated and are always returned.
+
+    Returns:
+        tuple: (new_messages, duplicate_ids)
+    """
+    duplicates = []
+    candidates = {}
+    for message in messages:
+        message_id = str(message.get('id') or '')
+        if not message_id:
+            continue
+        if message_id in recent_messages or message_id in candidates:
+            duplicates.append(message_id)
+        else:
+            candidates[message_id] = message
+
+    if candidates:
+        batch_id = uuid.uuid4().hex
+        await InboundMessage.objects.abulk_create([
+            InboundMessage(
+                message_id=message_id,
+                sender=normalize_phone_number(message.get('from', ''))[:32],
+                batch_id=batch_id,
+            )
+            for message_id, message in candidates.items()
+        ], ignore_conflicts=True)
+        claimed = {
+            message_id async for message_id in
+            InboundMessage.objects.filter(batch_id=batch_id, message_id__in=candidates).values_list('message_id', flat=True)
+        }
+        recent_messages.add_many(candidates)
+        duplicates.extend(message_id for message_id in candidates if message_id not in claimed)
+    else:
+        claimed = set()
+
+    new_messages = []
+    for message in messages:
+        message_id = str(message.get('id') or '')
+        if not message_id:
+            new_messages.append(message)
+        elif message_id in claimed:
+            new_messages.append(message)
+            # A repeat inside the same payload is only processed once
+            claimed.discard(message_id)
+    return new_messages, duplicates
+
+
+async def arelease_messages(messages):
+    """
+    Forget the claims on ``messages`` so a redelivery is processed again.
+
+    Used when a claimed batch fails before its replies are queued; otherwise
+    every retry of it would be acknowledged as a duplicate and it would be lost.
+    """
+    message_ids = [str(message.get('id')) for message in messages if message.get('id')]
+    if not message_ids:
+        return
+    recent_messages.discard_many(message_ids)
+    await InboundMessage.objects.filter(message_id__in=message_ids).adelete()
+
+
+def prune_inbound_messages(now=None):
+    """
+    Delete ingestion log rows older than ``INBOUND_LOG_RETENTION_DAYS``.
+
+    A retention of 0 keeps every row. Returns the number of rows deleted.
+    """
+    if not settings.INBOUND_LOG_RETENTION_DAYS:
+        return 0
+    cutoff = (now or timezone.now()) - datetime.timedelta(days=settings.INBOUND_LOG_RETENTION_DAYS)
+    deleted, _ = InboundMessage.objects.filter(received_at__lt=cutoff).delete()
+    return deleted
@@ -0,0 +1,77 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from webhook.fake_gateway import FakeGateway
+from webhook.transports import Replayer, SimulatedGateway
+
+
+class Command(BaseCommand):
+    help = 'Serve a stand-in WhatsApp gateway on localhost; point GATEWAY_URL at it'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8025,
+            help='Port to listen on'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=settings.GATEWAY_SIMULATED_LATENCY,
+            help='Seconds to wait before answering each send'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=settings.GATEWAY_SIMULATED_ERROR_RATE,
+            help='Share of sends answered with a 500'
+        )
+        parser.add_argument(
+            '--rate-limit',
+            type=float,
+            default=settings.GATEWAY_SIMULATED_RATE_LIMIT,
+            help='Sends per second before answering 429 (0 = never)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Seed for choosing which sends fail'
+        )
+        parser.add_argument(
+            '--replay',
+            metavar='RECORDING',
+            help='Answer with the exchanges recorded in this file instead of simulating'
+        )
+
+    def handle(self, *args, **options):
+        if options['replay']:
+            responder = Replayer(options['replay'])
+            behaviour = f"replaying {len(responder.exchanges)} recorded exchanges"
+        else:
+            responder = SimulatedGateway(
+                latency=options['latency'],
+                error_rate=options['error_rate'],
+                rate_limit=options['rate_limit'],
+                seed=options['seed'],
+            )
+            behaviour = (
+                f"latency {options['latency']}s, error rate {options['error_rate']}, "
+                f"rate limit {options['rate_limit'] or 'off'}"
+            )
+
+        gateway = FakeGateway(responder, port=options['port']).start()
+        self.stdout.write(f"Fake gateway listening on {gateway.url} ({behaviour})")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            gateway.stop()
+            if isinstance(responder, SimulatedGateway):
+                self.stdout.write(
+                    f"Accepted {len(responder.messages)}, failed {responder.failures}, "
+                    f"throttled {responder.throttled}"
+                )
+            self.stdout.write("Fake gateway stopped")
@@ -0,0 +1,64 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+from webhook.gateway import get_client
+from webhook.queue import OutboundWorker
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued WhatsApp messages using a pool of sender threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=None,
+            help='Number of sender threads (defaults to OUTBOUND_WORKER_THREADS)'
+        )
+        parser.add_argument(
+            '--async',
+            action='store_true',
+            dest='use_async',
+            help='Send each batch concurrently on an event loop instead of a thread pool'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Deliver everything that is currently due and exit'
+        )
+
+    def handle(self, *args, **options):
+        worker = OutboundWorker(threads=options['threads'])
+
+        if options['use_async']:
+            self.handle_async(worker, options['once'])
+            return
+
+        if options['once']:
+            claimed, delivered = worker.drain()
+            self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} of {claimed} queued messages"))
+            self.stdout.write(f"Gateway stats: {get_client().stats()}")
+            return
+
+        self.stdout.write(f"Outbound worker {worker.worker_id} started with {worker.threads} threads")
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
+            self.stdout.write(f"Gateway stats: {get_client().stats()}")
+            self.stdout.write("Outbound worker stopped")
+
+    def handle_async(self, worker, once):
+        if once:
+            claimed, delivered = asyncio.run(worker.adrain())
+            self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} of {claimed} queued messages"))
+            self.stdout.write(f"Gateway stats: {worker.async_stats}")
+            return
+
+        self.stdout.write(f"Outbound worker {worker.worker_id} started on an event loop")
+        try:
+            asyncio.run(worker.arun())
+        except KeyboardInterrupt:
+            worker.stop()
+            self.stdout.write(f"Gateway stats: {worker.async_stats}")
+            self.stdout.write("Outbound worker stopped")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-18 17:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('webhook', '0002_inboundmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundmessage',
+            name='tag',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+    ]
@@ -1,3 +1,63 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class OutboundMessage(models.Model):
+    """A WhatsApp message waiting to be delivered by the outbound worker."""
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_DEAD = 'dead'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_DEAD, 'Dead'),
+    ]
+
+    to = models.CharField(max_length=32)
+    body = models.TextField()
+    # Groups messages queued together, e.g. by one reminder job
+    tag = models.CharField(max_length=64, blank=True, db_index=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+
+    # Set while a worker owns the message so several workers can share the queue
+    claimed_by = models.CharField(max_length=64, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_status_due_idx'),
+            models.Index(fields=['to', 'status'], name='outbound_to_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"To {self.to} ({self.status})"
+
+
+class InboundMessage(models.Model):
+    """
+    Ingestion log of webhook messages, keyed by the gateway's message ID.
+
+    The unique ``message_id`` is what makes a retried delivery a no-op: only
+    the request whose insert wins goes on to process the message.
+    """
+
+    message_id = models.CharField(max_length=128, unique=True)
+    sender = models.CharField(max_length=32, blank=True)
+    # Identifies the request that inserted the row
+    batch_id = models.CharField(max_length=32)
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.message_id} from {self.sender}"
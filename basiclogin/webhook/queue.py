@@ -0,0 +1,404 @@
+"""
+Database-backed outbound message queue.
+
+Request handlers call ``enqueue_message``/``enqueue_messages`` and return
+immediately; ``OutboundWorker`` (run with ``manage.py run_outbound_worker``)
+drains the queue with a thread pool. Only the oldest undelivered message for
+each recipient is ever handed to a thread, so messages to one person arrive in
+the order they were queued while different recipients are served concurrently.
+Failed deliveries are retried with exponential backoff and moved to the
+``dead`` status once ``OUTBOUND_MAX_ATTEMPTS`` is reached.
+
+Sends go through the gateway's rate limiter (see ``webhook.ratelimit``). A
+message that has to wait is put back with ``next_attempt_at`` set to when a
+token is due, without using up an attempt. Messages to one recipient that
+pile up meanwhile, or that were queued together, are sent as one digest when
+they were queued within ``OUTBOUND_COALESCE_WINDOW`` seconds of each other.
+
+The worker can also run on an event loop (``--async``), sending each batch
+concurrently through the async gateway client instead of a thread pool.
+"""
+import asyncio
+import datetime
+import logging
+import random
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .models import OutboundMessage
+from .gateway import get_client, get_async_client, RateLimited
+
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_message(to, body):
+    """
+    Queue a single message for delivery.
+
+    Args:
+        to (str): Recipient phone number.
+        body (str): Message text.
+
+    Returns:
+        OutboundMessage: The queued message.
+    """
+    return OutboundMessage.objects.create(to=to, body=body)
+
+
+def enqueue_messages(messages, tag=''):
+    """
+    Queue many messages with a single insert.
+
+    Args:
+        messages (iterable): ``(to, body)`` pairs, in the order they should be sent.
+        tag (str): Stored on every message so the batch can be tracked later.
+
+    Returns:
+        list: The queued OutboundMessage instances.
+    """
+    now = timezone.now()
+    rows = [OutboundMessage(to=to, body=body, tag=tag, next_attempt_at=now) for to, body in messages]
+    return OutboundMessage.objects.bulk_create(rows)
+
+
+async def aenqueue_messages(messages, tag=''):
+    """Async version of ``enqueue_messages``."""
+    now = timezone.now()
+    rows = [OutboundMessage(to=to, body=body, tag=tag, next_attempt_at=now) for to, body in messages]
+    return await OutboundMessage.objects.abulk_create(rows)
+
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a message that has failed ``attempts`` times."""
+    delay = settings.OUTBOUND_RETRY_BACKOFF * (2 ** (attempts - 1))
+    delay = min(delay, settings.OUTBOUND_RETRY_BACKOFF_MAX)
+    # Jitter keeps messages that failed together from retrying in lockstep
+    return delay * random.uniform(0.8, 1.2)
+
+
+def release_stale_claims(now=None):
+    """
+    Return messages abandoned by a crashed worker to the pending state.
+
+    Returns:
+        int: Number of messages released.
+    """
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(seconds=settings.OUTBOUND_CLAIM_TIMEOUT)
+    return OutboundMessage.objects.filter(
+        status=OutboundMessage.STATUS_SENDING,
+        claimed_at__lt=cutoff,
+    ).update(status=OutboundMessage.STATUS_PENDING, claimed_by='', claimed_at=None)
+
+
+def claim_batch(worker_id, limit):
+    """
+    Claim up to ``limit`` due messages, at most one per recipient.
+
+    A message is only eligible when no earlier message to the same recipient is
+    still pending or being sent, which keeps per-recipient ordering even when
+    an earlier message is waiting out a retry backoff.
+
+    Returns:
+        list: OutboundMessage instances now owned by this worker.
+    """
+    now = timezone.now()
+    earlier = OutboundMessage.objects.filter(
+        to=OuterRef('to'),
+        id__lt=OuterRef('id'),
+        status__in=[OutboundMessage.STATUS_PENDING, OutboundMessage.STATUS_SENDING],
+    )
+    due_ids = list(
+        OutboundMessage.objects
+        .filter(status=OutboundMessage.STATUS_PENDING, next_attempt_at__lte=now)
+        .exclude(Exists(earlier))
+        .order_by('id')
+        .values_list('id', flat=True)[:limit]
+    )
+    if not due_ids:
+        return []
+
+    # The conditional update is the claim: another worker racing for the same
+    # rows only gets the ones that were still pending when it ran.
+    token = f"{worker_id}:{uuid.uuid4().hex[:12]}"
+    OutboundMessage.objects.filter(
+        id__in=due_ids,
+        status=OutboundMessage.STATUS_PENDING,
+    ).update(status=OutboundMessage.STATUS_SENDING, claimed_by=token, claimed_at=now)
+    return list(OutboundMessage.objects.filter(claimed_by=token, status=OutboundMessage.STATUS_SENDING))
+
+
+def mark_failed(message, error):
+    """
+    Record a failed attempt on ``message``, scheduling a retry or giving up.
+
+    Returns:
+        list: The fields to save.
+    """
+    message.attempts += 1
+    message.last_error = str(error)
+    message.claimed_by = ''
+    message.claimed_at = None
+    if message.attempts >= settings.OUTBOUND_MAX_ATTEMPTS:
+        message.status = OutboundMessage.STATUS_DEAD
+        logger.error("Giving up on message %s to %s after %s attempts: %s", message.id, message.to, message.attempts, error)
+    else:
+        message.status = OutboundMessage.STATUS_PENDING
+        message.next_attempt_at = timezone.now() + datetime.timedelta(seconds=retry_delay(message.attempts))
+        logger.warning(
+            "Message %s to %s failed (attempt %s), retrying: %s", message.id, message.to, message.attempts, error,
+        )
+    return ['attempts', 'last_error', 'status', 'next_attempt_at', 'claimed_by', 'claimed_at']
+
+
+def mark_sent(message):
+    """
+    Record a successful delivery on ``message``.
+
+    Returns:
+        list: The fields to save.
+    """
+    message.attempts += 1
+    message.status = OutboundMessage.STATUS_SENT
+    message.sent_at = timezone.now()
+    message.last_error = ''
+    message.claimed_by = ''
+    message.claimed_at = None
+    return ['attempts', 'status', 'sent_at', 'last_error', 'claimed_by', 'claimed_at']
+
+
+def mark_deferred(message, delay):
+    """
+    Put ``message`` back to be sent in ``delay`` seconds without counting an attempt.
+
+    Returns:
+        list: The fields to save.
+    """
+    message.status = OutboundMessage.STATUS_PENDING
+    message.next_attempt_at = timezone.now() + datetime.timedelta(seconds=delay)
+    message.claimed_by = ''
+    message.claimed_at = None
+    return ['status', 'next_attempt_at', 'claimed_by', 'claimed_at']
+
+
+# Separates the messages combined into one digest
+DIGEST_SEPARATOR = "\n\n- - -\n\n"
+
+
+def claim_followers(message):
+    """
+    Claim the messages queued to the same recipient right after ``message``
+    that can be sent with it as one digest.
+
+    Followers are taken in order while they were queued within
+    ``OUTBOUND_COALESCE_WINDOW`` seconds of ``message`` and the digest stays
+    within ``WHATSAPP_MESSAGE_LIMIT``. No other worker can claim them, because
+    ``claim_batch`` never hands out a message while an earlier one to the
+    same recipient is being sent.
+
+    Returns:
+        list: The claimed OutboundMessage instances, in queue order.
+    """
+    window = settings.OUTBOUND_COALESCE_WINDOW
+    if not window:
+        return []
+    candidates = (
+        OutboundMessage.objects
+        .filter(
+            to=message.to,
+            id__gt=message.id,
+            status=OutboundMessage.STATUS_PENDING,
+            next_attempt_at__lte=timezone.now(),
+            created_at__lte=message.created_at + datetime.timedelta(seconds=window),
+        )
+        .order_by('id')
+        .only('id', 'body')
+    )
+
+    length = len(message.body)
+    follower_ids = []
+    for candidate in candidates.iterator():
+        length += len(DIGEST_SEPARATOR) + len(candidate.body)
+        if length > settings.WHATSAPP_MESSAGE_LIMIT:
+            break
+        follower_ids.append(candidate.id)
+    if not follower_ids:
+        return []
+
+    OutboundMessage.objects.filter(id__in=follower_ids, status=OutboundMessage.STATUS_PENDING).update(
+        status=OutboundMessage.STATUS_SENDING, claimed_by=message.claimed_by, claimed_at=message.claimed_at,
+    )
+    return list(OutboundMessage.objects.filter(
+        id__in=follower_ids, claimed_by=message.claimed_by, status=OutboundMessage.STATUS_SENDING,
+    ))
+
+
+def digest_body(message, followers):
+    return DIGEST_SEPARATOR.join([message.body, *(follower.body for follower in followers)])
+
+
+def record_outcome(message, followers, error=None):
+    """
+    Save the outcome of sending ``message`` and its followers as one digest.
+
+    The followers share the message's fate when it is delivered; otherwise
+    they go back to pending untouched and wait behind it.
+
+    Returns:
+        bool: True if the digest was delivered.
+    """
+    follower_ids = [follower.id for follower in followers]
+    if error is None:
+        message.save(update_fields=mark_sent(message))
+        OutboundMessage.objects.filter(id__in=follower_ids).update(
+            status=OutboundMessage.STATUS_SENT, sent_at=message.sent_at, attempts=F('attempts') + 1,
+            last_error='', claimed_by='', claimed_at=None,
+        )
+        return True
+
+    if isinstance(error, RateLimited):
+        message.save(update_fields=mark_deferred(message, error.retry_after))
+    else:
+        message.save(update_fields=mark_failed(message, error))
+    OutboundMessage.objects.filter(id__in=follower_ids).update(
+        status=OutboundMessage.STATUS_PENDING, claimed_by='', claimed_at=None,
+    )
+    return False
+
+
+def process_message(message):
+    """
+    Deliver one claimed message, with any followers it can carry, and record
+    the outcome.
+
+    Returns:
+        bool: True if the message was delivered.
+    """
+    followers = claim_followers(message)
+    try:
+        get_client().send_text(message.to, digest_body(message, followers))
+    except Exception as e:
+        return record_outcome(message, followers, e)
+    return record_outcome(message, followers)
+
+
+async def aprocess_message(message):
+    """Async version of ``process_message``, using the async gateway client."""
+    followers = await sync_to_async(claim_followers)(message)
+    try:
+        await get_async_client().send_text(message.to, digest_body(message, followers))
+    except Exception as e:
+        return await sync_to_async(record_outcome)(message, followers, e)
+    return await sync_to_async(record_outcome)(message, followers)
+
+
+class OutboundWorker:
+    """Drains the outbound queue with a pool of sender threads."""
+
+    def __init__(self, threads=None, batch_size=None, poll_interval=None, worker_id=None):
+        self.threads = threads or settings.OUTBOUND_WORKER_THREADS
+        self.batch_size = batch_size or settings.OUTBOUND_BATCH_SIZE
+        self.poll_interval = poll_interval if poll_interval is not None else settings.OUTBOUND_POLL_INTERVAL
+        self.worker_id = worker_id or uuid.uuid4().hex[:12]
+        self.stop_event = threading.Event()
+        # Gateway counters from the last async run
+        self.async_stats = {}
+
+    def _process(self, message):
+        try:
+            return process_message(message)
+        finally:
+            close_old_connections()
+
+    def run_once(self, executor):
+        """
+        Claim and deliver one batch.
+
+        Returns:
+            tuple: (claimed, delivered) message counts.
+        """
+        release_stale_claims()
+        batch = claim_batch(self.worker_id, self.batch_size)
+        if not batch:
+            return 0, 0
+        delivered = sum(1 for ok in executor.map(self._process, batch) if ok)
+        return len(batch), delivered
+
+    def drain(self):
+        """
+        Deliver everything that is currently due, then return.
+
+        Returns:
+            tuple: (claimed, delivered) message counts.
+        """
+        claimed_total = delivered_total = 0
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            while True:
+                claimed, delivered = self.run_once(executor)
+                if not claimed:
+                    break
+                claimed_total += claimed
+                delivered_total += delivered
+        return claimed_total, delivered_total
+
+    def run(self):
+        """Keep draining the queue until ``stop()`` is called."""
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            while not self.stop_event.is_set():
+                claimed, _ = self.run_once(executor)
+                if not claimed:
+                    self.stop_event.wait(self.poll_interval)
+
+    def stop(self):
+        self.stop_event.set()
+
+    async def arun_once(self):
+        """
+        Claim one batch and deliver all of it concurrently on the event loop.
+
+        Returns:
+            tuple: (claimed, delivered) message counts.
+        """
+        await sync_to_async(release_stale_claims)()
+        batch = await sync_to_async(claim_batch)(self.worker_id, self.batch_size)
+        if not batch:
+            return 0, 0
+        delivered = sum(await asyncio.gather(*(aprocess_message(message) for message in batch)))
+        return len(batch), delivered
+
+    async def adrain(self):
+        """Async version of ``drain``."""
+        claimed_total = delivered_total = 0
+        try:
+            while True:
+                claimed, delivered = await self.arun_once()
+                if not claimed:
+                    break
+                claimed_total += claimed
+                delivered_total += delivered
+        finally:
+            await self._close_async_client()
+        return claimed_total, delivered_total
+
+    async def arun(self):
+        """Async version of ``run``."""
+        try:
+            while not self.stop_event.is_set():
+                claimed, _ = await self.arun_once()
+                if not claimed:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            await self._close_async_client()
+
+    async def _close_async_client(self):
+        client = get_async_client()
+        self.async_stats = client.stats()
+        await client.aclose()
@@ -0,0 +1,107 @@
+"""
+Token-bucket rate limiting for the WhatsApp gateway.
+
+Every send takes one token from a global bucket and one from the recipient's
+own bucket. Buckets refill continuously at their rate up to their burst size.
+When either is empty the send is refused with the time until both have a
+token, and the outbound queue reschedules the message for then instead of
+letting the gateway drop it.
+
+Limits apply per process; with several worker processes, divide the gateway's
+limits between them.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available, 0 if one is available now."""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Global and per-recipient token buckets.
+
+    A rate of 0 turns that limit off. At most ``max_recipients`` recipient
+    buckets are kept; the least recently used is dropped first, which at worst
+    lets that recipient burst again.
+    """
+
+    def __init__(self, rate, burst, recipient_rate, recipient_burst, max_recipients=10000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.recipient_rate = recipient_rate
+        self.recipient_burst = recipient_burst
+        self.max_recipients = max_recipients
+        self.clock = clock
+        self.limited = 0
+        self._global = TokenBucket(rate, burst, clock())
+        self._recipients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recipient_bucket(self, to, now):
+        bucket = self._recipients.get(to)
+        if bucket is None:
+            bucket = self._recipients[to] = TokenBucket(self.recipient_rate, self.recipient_burst, now)
+            while len(self._recipients) > self.max_recipients:
+                self._recipients.popitem(last=False)
+        self._recipients.move_to_end(to)
+        return bucket
+
+    def acquire(self, to):
+        """
+        Take a token for one message to ``to`` if both buckets have one.
+
+        Returns:
+            float: 0 if the message may be sent now, otherwise the seconds to
+            wait before trying again. No token is taken in that case.
+        """
+        with self._lock:
+            now = self.clock()
+            buckets = []
+            if self.rate:
+                buckets.append(self._global)
+            if self.recipient_rate:
+                buckets.append(self._recipient_bucket(to, now))
+            for bucket in buckets:
+                bucket.refill(now)
+
+            wait = max((bucket.wait_time() for bucket in buckets), default=0.0)
+            if wait:
+                self.limited += 1
+                return wait
+            for bucket in buckets:
+                bucket.tokens -= 1
+            return 0.0
+
+    def clear(self):
+        with self._lock:
+            self._global = TokenBucket(self.rate, self.burst, self.clock())
+            self._recipients.clear()
+            self.limited = 0
+
+
+rate_limiter = RateLimiter(
+    settings.GATEWAY_RATE_LIMIT,
+    settings.GATEWAY_RATE_BURST,
+    settings.GATEWAY_RECIPIENT_RATE_LIMIT,
+    settings.GATEWAY_RECIPIENT_RATE_BURST,
+)
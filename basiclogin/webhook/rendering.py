@@ -0,0 +1,130 @@
+"""
+Task list replies for LIST and TASKS FOR.
+
+Only the requested page of tasks is read from the database (plus one row to
+know whether another page follows). Tasks are rendered one at a time from a
+generator and packed into messages no longer than the gateway accepts, so a
+long page becomes several messages instead of one oversized one.
+"""
+import datetime
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from users.models import Task
+from users.utils import format_deadline
+
+
+def filter_overdue(tasks, now):
+    return tasks.filter(deadline__lt=now)
+
+
+def filter_today(tasks, now):
+    start = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    return tasks.filter(deadline__gte=start, deadline__lt=start + datetime.timedelta(days=1))
+
+
+# Filters accepted after LIST, e.g. "LIST overdue 2"
+LIST_FILTERS = {
+    'overdue': filter_overdue,
+    'today': filter_today,
+}
+
+
+def task_page(tasks, page, page_size=None):
+    """
+    Read one page of ``tasks``, soonest deadline first.
+
+    Returns:
+        tuple: (list of tasks, whether there is a next page)
+    """
+    page_size = page_size or settings.LIST_PAGE_SIZE
+    offset = (page - 1) * page_size
+    rows = list(
+        tasks
+        .order_by(F('deadline').asc(nulls_last=True), 'created_at')
+        .select_related('created_by')
+        .prefetch_related('assigned_to')[offset:offset + page_size + 1]
+    )
+    return rows[:page_size], len(rows) > page_size
+
+
+def render_task(task):
+    people = ', '.join(user.name or user.phone_number for user in task.assigned_to.all()) or 'Nobody'
+    return (
+        f"ID: {task.id}\n"
+        f"👥 People: {people}\n"
+        f"📅 Deadline: {format_deadline(task.deadline)}\n"
+        f"📝 Notes: {task.description or 'No notes'}\n"
+        f"🔖 Status: {task.status}"
+    )
+
+
+def chunk_messages(blocks, header='', footer='', limit=None):
+    """
+    Pack text blocks into messages of at most ``limit`` characters.
+
+    Blocks are separated by a blank line and never split unless a single
+    block is longer than ``limit`` on its own. ``header`` starts the first
+    message and ``footer`` ends the last.
+    """
+    limit = limit or settings.WHATSAPP_MESSAGE_LIMIT
+    current = header
+    for block in blocks:
+        joined = f"{current}\n\n{block}" if current else block
+        if len(joined) <= limit:
+            current = joined
+            continue
+        if current:
+            yield current
+        while len(block) > limit:
+            yield block[:limit]
+            block = block[limit:]
+        current = block
+    if footer:
+        joined = f"{current}\n\n{footer}" if current else footer
+        if len(joined) > limit:
+            yield current
+            joined = footer
+        current = joined
+    if current:
+        yield current
+
+
+def render_task_list(tasks, title, page, empty, more_command):
+    """
+    Render one page of ``tasks`` as a list of messages.
+
+    Args:
+        tasks (QuerySet): The tasks to list, unordered and unpaged.
+        title (str): First line of the reply.
+        page (int): 1-based page number.
+        empty (str): Reply when the page has no tasks.
+        more_command (str): Command that shows the next page, without the number.
+    """
+    rows, has_more = task_page(tasks, page)
+    if not rows:
+        return [empty if page == 1 else f"{title}: no tasks on page {page}."]
+    header = title if page == 1 else f"{title} (page {page})"
+    footer = f"Send {more_command} {page + 1} for more." if has_more else ''
+    return list(chunk_messages((render_task(task) for task in rows), header, footer))
+
+
+def list_replies(workspace_id, list_filter, page, now=None):
+    """Messages answering ``LIST [filter] [page]`` from someone in ``workspace_id``."""
+    # Filtered on the leading column of the (workspace, deadline, created_at) index
+    tasks = Task.objects.filter(workspace_id=workspace_id)
+    if list_filter:
+        tasks = LIST_FILTERS[list_filter](tasks, now or timezone.now())
+    more_command = f"LIST {list_filter}" if list_filter else "LIST"
+    title = f"Tasks ({list_filter})" if list_filter else "Tasks"
+    return render_task_list(tasks, title, page, 'No tasks found.', more_command)
+
+
+def person_replies(user, person_name, page):
+    """Messages answering ``TASKS FOR name [page]``."""
+    tasks = Task.objects.filter(assigned_to=user) if user else Task.objects.none()
+    return render_task_list(
+        tasks, f"Tasks for {person_name}", page, f"No tasks found for {person_name}.", f"TASKS FOR {person_name}",
+    )
@@ -1,100 +1,32 @@
-import json
-import os
-import requests
-from django.conf import settings
-from users.models import User, Task
-from datetime import datetime
-from django.utils.dateparse import parse_date
-import re
-import uuid
-
-def get_contact_numbers(names):
+import logging
+from users.models import DEFAULT_WORKSPACE_ID, normalize_phone_number
+from users.directory import contact_directory
+
+
+logger = logging.getLogger(__name__)
+
+def get_contact_numbers(names, workspace_id=DEFAULT_WORKSPACE_ID):
     """
-    Get phone numbers for a list of names using the Django ORM.
+    Get phone numbers for a list of names from the contact directory.
 
     Args:
         names (list): List of names to look up.
+        workspace_id (UUID): Only people in this workspace are found.
 
     Returns:
         dict: Dictionary with names and their corresponding phone numbers.
     """
-    contact_numbers = {}
-    trimmed_names = [name.strip() for name in names]
-    
-    # Fetch matching users in a single query
-    users = User.objects.filter(name__in=trimmed_names)
-
-    # Create a mapping from name to phone_number
-    for user in users:
-        clean_number = user.phone_number.lstrip('+').strip()
-        contact_numbers[user.name] = clean_number
-
-    return contact_numbers
-
-
-def send_message(to, message):
-    url = "https://gate.whapi.cloud/messages/text"
-    headers = {
-        "Authorization": "Bearer ", #use your own whapi key here
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "to": to,
-        "body": message
-    }
-    try:
-        response = requests.post(url, json=payload, headers=headers)
-        if response.status_code == 200:
-            print(f"Message sent to {to}")
-        else:
-            print(f"Failed to send message to {to}: {response.text}")
-    except Exception as e:
-        print(f"Error sending message to {to}: {e}")
+    # Names not cached yet are fetched in a single query
+    return contact_directory.phones_for(names, workspace_id)
 
 
-from users.models import Task, User
-from users.serializers import TaskSerializer
-
-def mark_task_as_done(task_id, user_phone_number):
-    """
-    Mark a task as completed
-    
-    Args:
-        task_id (str): UUID of the task to mark as done
-        user_phone_number (str): Phone number of the user marking the task
-    
-    Returns:
-        bool: True if task was successfully marked as done, False otherwise
-    """
-    try:
-        # Find the task
-        task = Task.objects.get(id=task_id)
-        
-        # Verify the user is assigned to the task
-        user = User.objects.get(phone_number=user_phone_number)
-        if user not in task.assigned_to.all():
-            print(f"User {user_phone_number} is not assigned to this task")
-            return False
-        
-        # Mark task as completed
-        task.status = 'completed'
-        task.save()
-        
-        print(f"Task {task_id} marked as completed by {user_phone_number}")
-        return True
-    
-    except Task.DoesNotExist:
-        print(f"Task {task_id} not found")
-        return False
-    except User.DoesNotExist:
-        print(f"User {user_phone_number} not found")
-        return False
-from datetime import datetime
-from django.utils.dateparse import parse_date
+from users.services import (
+    record_task_completion, TaskCompletionError, NewTask, create_tasks, assigned_task_list, all_task_list,
+)
 
 class TaskService:
     @staticmethod
-    def add_task(description, created_by_id=None, assigned_to_ids=None, deadline=None):
+    def add_task(description, created_by_id=None, assigned_to_ids=None, deadline=None, created_by=None):
         """
         Create and save a Task in the database.
 
@@ -102,113 +34,102 @@ class TaskService:
             description (str): Task description.
             created_by_id (str): Phone number of the User creating the task.
             assigned_to_ids (list): List of phone numbers to assign the task to.
-            deadline (str or date): Optional deadline string (YYYY-MM-DD) or date.
+            deadline (str, date or datetime): Optional deadline, as a string
+                ("YYYY-MM-DD" or "YYYY-MM-DD HH:MM"), date or datetime.
+            created_by (User): The creating User, if already loaded; its phone
+                number is used instead of ``created_by_id`` and the task goes
+                in its workspace.
 
         Returns:
-            Task instance.
+            dict: The created task, as returned by ``TaskService.add_tasks``.
         """
-        # Parse deadline string if needed
-        if isinstance(deadline, str):
-            deadline = parse_date(deadline)
-
-        # Ensure created_by exists
-        created_by, _ = User.objects.get_or_create(phone_number=created_by_id)
-        # Create the task
-        task = Task.objects.create(
-            description=description,
-            created_by=created_by,
-            deadline=deadline
-        )
-
-        if assigned_to_ids:
-            assigned_users = User.objects.filter(phone_number__in=assigned_to_ids)
-            if not assigned_users.exists():
-                assigned_users = [User.objects.get_or_create(phone_number=phone)[0] for phone in assigned_to_ids]
-            task.assigned_to.set(assigned_users)
-        
-        # Serialize the task before returning
-        serializer = TaskSerializer(task)
-        return serializer.data
+        workspace_id = DEFAULT_WORKSPACE_ID
+        if created_by is not None:
+            created_by_id = created_by.phone_number
+            workspace_id = created_by.workspace_id
+        return TaskService.add_tasks([
+            NewTask(description, created_by_id, assigned_to_ids or [], deadline)
+        ], workspace_id)[0]
 
+    @staticmethod
+    def add_tasks(new_tasks, workspace_id=DEFAULT_WORKSPACE_ID):
+        """
+        Create many tasks with a fixed number of queries.
+
+        Users are created, in ``workspace_id``, for any phone number that
+        isn't registered yet.
+
+        Args:
+            new_tasks (list of NewTask): The tasks to create.
+            workspace_id (UUID): Workspace the tasks go in.
+
+        Returns:
+            list: One dict per task with ``id``, ``description``, ``deadline``,
+            ``created_by`` and ``assigned_to`` (phone numbers).
+        """
+        return create_tasks(new_tasks, workspace_id)
 
     @staticmethod
-    def list_tasks():
+    def list_tasks(workspace_id=DEFAULT_WORKSPACE_ID):
         """
-        Get all tasks.
+        Get all tasks in a workspace.
 
         Returns:
             List of serialized tasks.
         """
-        tasks = Task.objects.all()
-        return TaskSerializer(tasks, many=True).data
+        return all_task_list(workspace_id)
 
     @staticmethod
-    def get_tasks_for_person(user_id):
+    def get_tasks_for_person(user_id, workspace_id=DEFAULT_WORKSPACE_ID):
         """
         Get all tasks assigned to a specific user.
 
         Args:
             user_id (UUID): The user's ID.
+            workspace_id (UUID): The user's workspace.
 
         Returns:
             List of serialized tasks assigned to the user.
         """
-        tasks = Task.objects.filter(assigned_to__id=user_id)
-        return TaskSerializer(tasks, many=True).data
+        return assigned_task_list(user_id, workspace_id)
 
 
-def mark_task_as_done(task_id, phone_number):
+def mark_task_as_done(task_id, phone_number, user=None):
     """
     Mark a task as completed by a user.
     
     Args:
         task_id (str): The ID of the task to mark as done.
         phone_number (str): The phone number of the user marking the task as done.
+        user (User): The user, if already loaded.
         
     Returns:
         tuple: (success, message) - success is a boolean, message is a string with details
     """
+    # Clean the phone number
+    clean_phone = normalize_phone_number(phone_number)
+
     try:
-        import requests
-        import json
-        from django.conf import settings
-        
-        # Clean the phone number
-        clean_phone = phone_number.lstrip('+').strip()
-        
-        # Make a request to our own API
-        api_base_url = os.environ.get('API_BASE_URL', 'http://localhost:8001')
-        url = f"{api_base_url}/api/tasks/{task_id}/complete/"
-        payload = {"phone_number": clean_phone}
-        headers = {"Content-Type": "application/json"}
-        
-        response = requests.post(url, json=payload, headers=headers)
-        response_data = response.json()
-        
-        if response.status_code in [200, 201]:
-            print(f"Task {task_id} marked as completed by {clean_phone}")
-            
-            # Check if task was deleted (all users completed)
-            if response_data.get('status') == 'deleted':
-                return True, "Task completed by all users and has been removed."
-            else:
-                # Task is still in progress, some users haven't completed yet
-                completed_count = response_data.get('completed_count', 0)
-                total_assigned = response_data.get('total_assigned', 0)
-                
-                message = f"You've marked this task as completed! ({completed_count}/{total_assigned} users completed)"
-                
-                # If there are remaining users, list them
-                remaining_users = response_data.get('remaining_users', [])
-                if remaining_users:
-                    names = [user.get('name', 'Unknown') for user in remaining_users]
-                    message += f"\nWaiting for: {', '.join(names)}"
-                
-                return True, message
-        else:
-            error_msg = response_data.get('error', 'Unknown error')
-            print(f"Failed to mark task {task_id} as completed: {error_msg}")
-            return False, f"Could not complete task: {error_msg}"
+        result = record_task_completion(task_id, clean_phone, user=user)
+    except TaskCompletionError as e:
+        logger.info("Failed to mark task %s as completed: %s", task_id, e.message)
+        return False, f"Could not complete task: {e.message}"
     except Exception as e:
-        print(f"Error marking task as done: {e}")
+        logger.exception("Error marking task %s as done", task_id)
         return False, f"Error: {str(e)}"
+
+    logger.info("Task %s marked as completed by %s", task_id, clean_phone)
+
+    # Check if task was deleted (all users completed)
+    if result.deleted:
+        return True, "Task completed by all users and has been removed."
+
+    # Task is still in progress, some users haven't completed yet
+    message = f"You've marked this task as completed! ({result.completed_count}/{result.total_assigned} users completed)"
+
+    # If there are remaining users, list them
+    if result.remaining_users:
+        names = [user.name or 'Unknown' for user in result.remaining_users]
+        message += f"\nWaiting for: {', '.join(names)}"
+
+    return True, message
@@ -1,3 +1,740 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import httpx
+import requests
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from users.directory import contact_directory
+from users.models import User, Task, Workspace
+from .commands import commands, CommandSyntaxError
+from .fake_gateway import FakeGateway
+from .gateway import (
+    AsyncGatewayClient, GatewayClient, MessageDeliveryError, RateLimited, _async_clients, set_client,
+)
+from .ingest import recent_messages, prune_inbound_messages
+from .queue import (
+    OutboundWorker, aenqueue_messages, claim_batch, enqueue_messages, release_stale_claims, retry_delay,
+    DIGEST_SEPARATOR,
+)
+from .ratelimit import RateLimiter
+from .rendering import chunk_messages
+from .transports import Reply, SimulatedGateway, get_responder
+from .models import OutboundMessage, InboundMessage
+
+
+class WebhookTestCase(TestCase):
+
+    def setUp(self):
+        recent_messages.clear()
+        contact_directory.clear()
+        cache.clear()
+
+    def post_messages(self, *messages, ids=None):
+        ids = ids or [f"msg-{i}" for i in range(len(messages))]
+        payload = {"messages": [
+            {"id": message_id, "from": sender, "text": {"body": body}}
+            for message_id, (sender, body) in zip(ids, messages)
+        ]}
+        response = self.client.post('/webhooks/messages', json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+
+class WebhookBatchTests(WebhookTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create(name="Alice", phone_number="919800000001")
+        self.bob = User.objects.create(name="Bob", phone_number="919800000002")
+
+    def test_every_message_in_the_payload_is_processed(self):
+        task = Task.objects.create(description="Existing", created_by=self.alice)
+        task.assigned_to.set([self.alice, self.bob])
+
+        body = self.post_messages(
+            ("+91 98000 00001", f"DONE {task.id}"),
+            ("919800000002", "TASK, [Alice], 2030-01-01, Write report"),
+            ("919800000003", "hello there"),
+        )
+
+        self.assertEqual(body["processed"], 3)
+        self.assertEqual([result["id"] for result in body["results"]], ["msg-0", "msg-1", "msg-2"])
+        self.assertEqual(body["results"][0]["status"], "Task completion processed")
+        self.assertTrue(body["results"][0]["success"])
+        self.assertEqual(body["results"][1]["status"], "success")
+        self.assertEqual(body["results"][2]["status"], "Message received (not a command)")
+        self.assertTrue(Task.objects.filter(description="Write report", created_by=self.bob).exists())
+        # DONE reply, plus the new task sent to its creator and to Alice
+        self.assertEqual(OutboundMessage.objects.count(), 3)
+
+    def test_done_updates_the_completion_counters(self):
+        task = Task.objects.create(description="Existing", created_by=self.alice)
+        task.assigned_to.set([self.alice, self.bob])
+
+        self.post_messages(("919800000001", f"DONE {task.id}"))
+
+        task.refresh_from_db()
+        self.assertEqual((task.completed_count, task.assigned_count), (1, 2))
+        self.assertEqual(list(task.completed_by.all()), [self.alice])
+        reply = OutboundMessage.objects.get(to="919800000001").body
+        self.assertIn("(1/2 users completed)", reply)
+        self.assertIn("Waiting for: Bob", reply)
+
+        self.post_messages(("919800000002", f"DONE {task.id}"), ids=["msg-last"])
+
+        self.assertFalse(Task.objects.filter(id=task.id).exists())
+        replies = OutboundMessage.objects.filter(to="919800000002").values_list('body', flat=True)
+        self.assertTrue(any("has been removed" in reply for reply in replies))
+
+    def test_replies_are_queued_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.post_messages(
+                *[("919800000001", "hello")] * 5, ("919800000001", "DONE not-a-uuid"), ("919800000002", "DONE"),
+                ids=[f"msg-{i}" for i in range(7)],
+            )
+
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "webhook_outboundmessage"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(OutboundMessage.objects.count(), 2)
+
+    def test_failing_message_does_not_stop_the_batch(self):
+        body = self.post_messages(
+            ("919800000001", "TASK, [Nobody], Unknown person"),
+            ("919800000002", "DONE"),
+        )
+
+        self.assertEqual(body["results"][0]["status"], "Error processed")
+        self.assertEqual(body["results"][1]["status"], "Task completion error")
+        self.assertEqual(
+            list(OutboundMessage.objects.values_list('to', flat=True)),
+            ["919800000001", "919800000002"],
+        )
+
+
+    def test_multi_line_task_creates_every_task(self):
+        body = self.post_messages(("919800000002", "TASK, [Alice], Buy milk\nTASK, [Alice|Bob], 2030-01-01, Clean up"))
+
+        self.assertEqual(body["results"][0]["created"], 2)
+        self.assertEqual(Task.objects.filter(created_by=self.bob).count(), 2)
+        # Each task goes to Bob, and to Alice once
+        self.assertEqual(OutboundMessage.objects.count(), 4)
+
+    def test_multi_line_task_with_a_bad_line_creates_nothing(self):
+        body = self.post_messages(("919800000002", "TASK, [Alice], Buy milk\nTASK, Alice, Clean up"))
+
+        self.assertEqual(body["results"][0]["status"], "People input error")
+        self.assertFalse(Task.objects.exists())
+        self.assertTrue(OutboundMessage.objects.get().body.startswith("Line 2:"))
+
+class WebhookIdempotencyTests(WebhookTestCase):
+
+    def setUp(self):
+        super().setUp()
+        User.objects.create(name="Alice", phone_number="919800000001")
+        self.task_message = ("919800000002", "TASK, [Alice], Write report")
+
+    def test_retried_delivery_is_only_acknowledged(self):
+        self.post_messages(self.task_message, ids=["wamid.1"])
+
+        with CaptureQueriesContext(connection) as queries:
+            body = self.post_messages(self.task_message, ids=["wamid.1"])
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(body["processed"], 0)
+        self.assertEqual(body["results"], [{"id": "wamid.1", "status": "duplicate"}])
+        self.assertEqual(Task.objects.count(), 1)
+        self.assertEqual(OutboundMessage.objects.count(), 2)
+
+    def test_unique_log_catches_retries_the_cache_has_not_seen(self):
+        self.post_messages(self.task_message, ids=["wamid.1"])
+        # Another process, or an entry evicted from this one's cache
+        recent_messages.clear()
+
+        body = self.post_messages(self.task_message, self.task_message, ids=["wamid.1", "wamid.2"])
+
+        self.assertEqual(body["processed"], 1)
+        self.assertEqual([result["status"] for result in body["results"]], ["success", "duplicate"])
+        self.assertEqual(Task.objects.count(), 2)
+        self.assertEqual(InboundMessage.objects.count(), 2)
+
+    def test_redelivery_of_a_failed_batch_is_processed(self):
+        with mock.patch('webhook.views.process_batch', side_effect=RuntimeError("database went away")):
+            body = self.post_messages(self.task_message, ids=["wamid.1"])
+        self.assertEqual(body["status"], "Error processed")
+        self.assertFalse(InboundMessage.objects.exists())
+
+        body = self.post_messages(self.task_message, ids=["wamid.1"])
+
+        self.assertEqual(body["processed"], 1)
+        self.assertEqual(body["results"][0]["status"], "success")
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_failed_reply_queueing_keeps_no_task(self):
+        with mock.patch('webhook.views.enqueue_messages', side_effect=RuntimeError("database went away")):
+            body = self.post_messages(self.task_message, ids=["wamid.1"])
+        self.assertEqual(body["status"], "Error processed")
+        self.assertFalse(Task.objects.exists())
+
+        body = self.post_messages(self.task_message, ids=["wamid.1"])
+
+        self.assertEqual(body["results"][0]["status"], "success")
+        self.assertEqual(Task.objects.count(), 1)
+        self.assertEqual(OutboundMessage.objects.count(), 2)
+
+    def test_repeat_within_one_payload_is_processed_once(self):
+        body = self.post_messages(self.task_message, self.task_message, ids=["wamid.1", "wamid.1"])
+
+        self.assertEqual(body["processed"], 1)
+        self.assertEqual(Task.objects.count(), 1)
+
+    @override_settings(INBOUND_LOG_RETENTION_DAYS=7)
+    def test_log_rows_past_retention_are_pruned(self):
+        self.post_messages(self.task_message, self.task_message, ids=["wamid.1", "wamid.2"])
+        InboundMessage.objects.filter(message_id="wamid.1").update(
+            received_at=timezone.now() - datetime.timedelta(days=8)
+        )
+
+        self.assertEqual(prune_inbound_messages(), 1)
+        self.assertEqual(list(InboundMessage.objects.values_list('message_id', flat=True)), ["wamid.2"])
+
+        with override_settings(INBOUND_LOG_RETENTION_DAYS=0):
+            self.assertEqual(prune_inbound_messages(now=timezone.now() + datetime.timedelta(days=30)), 0)
+        self.assertEqual(InboundMessage.objects.count(), 1)
+
+
+# Messages as they arrive from users, including the malformed ones
+COMMAND_CORPUS = [
+    ("TASK, [John|Sarah], 2025-06-30 17:00, Project proposal", "TASK"),
+    ("TASK, [John], 2025-06-30, Send invoices, then file them", "TASK"),
+    ("task,[Sarah],  call the bank", "TASK"),
+    ("TASK, [John]", "TASK"),
+    ("LIST", "LIST"),
+    ("list", "LIST"),
+    ("Tasks for Sarah", "TASKS FOR"),
+    ("TASKS  FOR John Smith", "TASKS FOR"),
+    ("DONE 7b0e4a8e-4f7b-4c4e-9d2a-2a6f2f0f6a11", "DONE"),
+    ("done 7b0e4a8e4f7b4c4e9d2a2a6f2f0f6a11 thanks!", "DONE"),
+    ("TASK, John, 2025-06-30, no brackets", CommandSyntaxError),
+    ("TASK [John] missing comma", CommandSyntaxError),
+    ("TASKS FOR", CommandSyntaxError),
+    ("LIST everything please", CommandSyntaxError),
+    ("DONE", CommandSyntaxError),
+    ("Done.", CommandSyntaxError),
+    ("hello there", None),
+    ("Listen, are we meeting today?", None),
+    ("Tasks are piling up", None),
+    ("👍", None),
+]
+
+
+class CommandParserTests(TestCase):
+
+    def parse(self, text):
+        try:
+            parsed = commands.parse(text)
+        except CommandSyntaxError:
+            return CommandSyntaxError
+        return parsed[0].name if parsed else None
+
+    def test_corpus(self):
+        for text, expected in COMMAND_CORPUS:
+            with self.subTest(text=text):
+                self.assertEqual(self.parse(text), expected)
+
+    def test_task_arguments(self):
+        _, arguments = commands.parse("TASK, [John | Sarah], 2025-06-30  17:00, Proposal, v2")
+        self.assertEqual(arguments, {"people": "John | Sarah", "deadline": "2025-06-30  17:00", "notes": "Proposal, v2"})
+
+        _, arguments = commands.parse("TASK, [John], 2025-06-30x, Proposal")
+        self.assertEqual((arguments["deadline"], arguments["notes"]), (None, "2025-06-30x, Proposal"))
+
+
+class ChunkMessagesTests(TestCase):
+
+    def test_blocks_are_packed_without_splitting(self):
+        chunks = list(chunk_messages(["a" * 4, "b" * 4, "c" * 4], header="H", footer="F", limit=12))
+
+        self.assertEqual(chunks, ["H\n\naaaa", "bbbb\n\ncccc", "F"])
+        self.assertTrue(all(len(chunk) <= 12 for chunk in chunks))
+
+    def test_oversized_block_is_split(self):
+        self.assertEqual(list(chunk_messages(["x" * 25], limit=10)), ["x" * 10, "x" * 10, "x" * 5])
+
+
+@override_settings(LIST_PAGE_SIZE=10)
+class TaskListReplyTests(WebhookTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create(name="Alice", phone_number="919800000001")
+        now = timezone.now()
+        for i in range(12):
+            task = Task.objects.create(
+                description=f"Task {i:02d}", created_by=self.alice, deadline=now + datetime.timedelta(days=i - 2, hours=1),
+            )
+            task.assigned_to.set([self.alice])
+
+    def replies(self, text):
+        OutboundMessage.objects.all().delete()
+        self.post_messages(("919800000001", text), ids=[f"{text}-{time.monotonic_ns()}"])
+        return list(OutboundMessage.objects.values_list('body', flat=True))
+
+    def test_pages(self):
+        first = "\n\n".join(self.replies("LIST"))
+        second = "\n\n".join(self.replies("list 2"))
+
+        self.assertIn("👥 People: Alice", first)
+        self.assertIn("📝 Notes: Task 00", first)
+        self.assertNotIn("Task 10", first)
+        self.assertTrue(first.endswith("Send LIST 2 for more."))
+        self.assertIn("Task 11", second)
+        self.assertNotIn("for more", second)
+
+    def test_only_the_page_is_read(self):
+        # Warm the contact directory so both runs do the same lookups
+        self.replies("LIST overdue")
+        with CaptureQueriesContext(connection) as small:
+            self.replies("LIST overdue")
+        for i in range(30):
+            Task.objects.create(description=f"Late {i}", created_by=self.alice, deadline=timezone.now() - datetime.timedelta(days=1))
+        with CaptureQueriesContext(connection) as large:
+            self.replies("LIST overdue")
+
+        self.assertEqual(len(small), len(large))
+
+    def test_overdue_filter(self):
+        overdue = "\n\n".join(self.replies("LIST overdue"))
+
+        self.assertIn("Task 00", overdue)
+        self.assertIn("Task 01", overdue)
+        self.assertNotIn("Task 02", overdue)
+        self.assertNotIn("for more", overdue)
+
+    def test_long_page_is_split_into_gateway_sized_messages(self):
+        with self.settings(WHATSAPP_MESSAGE_LIMIT=400):
+            replies = self.replies("LIST")
+
+        self.assertGreater(len(replies), 1)
+        self.assertTrue(all(len(reply) <= 400 for reply in replies))
+
+    def test_tasks_for_a_person(self):
+        replies = self.replies("TASKS FOR Alice 2")
+
+        self.assertEqual(len(replies), 1)
+        self.assertTrue(replies[0].startswith("Tasks for Alice (page 2)"))
+        self.assertEqual(self.replies("tasks for Nobody"), ["No tasks found for Nobody."])
+
+
+class WorkspaceScopingTests(WebhookTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.red = Workspace.objects.create(name="Red")
+        self.blue = Workspace.objects.create(name="Blue")
+        self.red_alice = User.objects.create(name="Alice", phone_number="919800000011", workspace=self.red)
+        self.blue_alice = User.objects.create(name="Alice", phone_number="919800000012", workspace=self.blue)
+        self.blue_bob = User.objects.create(name="Bob", phone_number="919800000013", workspace=self.blue)
+        Task.objects.create(description="Red task", created_by=self.red_alice, workspace=self.red)
+        Task.objects.create(description="Blue task", created_by=self.blue_bob, workspace=self.blue)
+
+    def replies(self, sender, text):
+        OutboundMessage.objects.all().delete()
+        self.post_messages((sender, text), ids=[f"{text}-{time.monotonic_ns()}"])
+        return "\n\n".join(OutboundMessage.objects.values_list('body', flat=True))
+
+    def test_list_shows_only_the_senders_workspace(self):
+        red = self.replies("919800000011", "LIST")
+        blue = self.replies("919800000013", "LIST")
+
+        self.assertIn("Red task", red)
+        self.assertNotIn("Blue task", red)
+        self.assertIn("Blue task", blue)
+        self.assertNotIn("Red task", blue)
+
+    def test_task_assigns_people_from_the_senders_workspace(self):
+        self.replies("919800000013", "TASK, [Alice], 2030-01-01, Review")
+
+        task = Task.objects.get(description="Review")
+        self.assertEqual(task.workspace, self.blue)
+        self.assertEqual(list(task.assigned_to.all()), [self.blue_alice])
+
+    def test_tasks_for_does_not_find_people_in_other_workspaces(self):
+        self.assertEqual(self.replies("919800000011", "TASKS FOR Bob"), "No tasks found for Bob.")
+
+    def test_non_members_cannot_read_the_default_workspace(self):
+        carol = User.objects.create(name="Carol", phone_number="919800000014")
+        Task.objects.create(description="Default task", created_by=carol).assigned_to.set([carol])
+
+        for text in ["LIST", "TASKS FOR Carol"]:
+            reply = self.replies("919800000099", text)
+
+            self.assertIn("not a member of any workspace", reply)
+            self.assertNotIn("Default task", reply)
+        self.assertFalse(User.objects.filter(phone_number="919800000099").exists())
+
+
+class AsyncWebhookTests(WebhookTestCase):
+
+    async def test_concurrent_requests_on_one_event_loop(self):
+        await User.objects.acreate(name="Alice", phone_number="919800000001")
+
+        async def post(i):
+            payload = {"messages": [{"id": f"async-{i}", "from": "919800000002", "text": {"body": "TASK, [Alice], Async"}}]}
+            return await self.async_client.post('/webhooks/messages', json.dumps(payload), content_type='application/json')
+
+        responses = await asyncio.gather(*(post(i % 3) for i in range(6)))
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        # Three distinct message IDs, each sent twice
+        self.assertEqual(await Task.objects.acount(), 3)
+
+    def test_get_is_rejected(self):
+        self.assertEqual(self.client.get('/webhooks/messages').status_code, 405)
+
+
+class AsyncOutboundWorkerTests(TestCase):
+
+    async def test_async_enqueue_stores_the_tag(self):
+        await aenqueue_messages([("919800000001", "one"), ("919800000002", "two")], tag="job-1")
+
+        self.assertEqual(await OutboundMessage.objects.filter(tag="job-1").acount(), 2)
+
+    @override_settings(OUTBOUND_COALESCE_WINDOW=0)
+    async def test_batch_is_sent_concurrently_with_the_async_client(self):
+        await aenqueue_messages([("919800000001", "one"), ("919800000002", "two"), ("919800000001", "three")])
+        sent = []
+
+        def gateway(request):
+            body = json.loads(request.content)
+            sent.append(body["body"])
+            return httpx.Response(500 if body["body"] == "two" else 200, json={})
+
+        _async_clients[asyncio.get_running_loop()] = AsyncGatewayClient(
+            transport=httpx.MockTransport(gateway), limiter=RateLimiter(0, 0, 0, 0),
+        )
+        claimed, delivered = await OutboundWorker(batch_size=10).adrain()
+
+        self.assertEqual((claimed, delivered), (3, 2))
+        self.assertEqual(sent, ["one", "two", "three"])
+        statuses = {body: status async for body, status in OutboundMessage.objects.values_list('body', 'status')}
+        self.assertEqual(statuses, {"one": "sent", "two": "pending", "three": "sent"})
+
+
+class FailingResponder(SimulatedGateway):
+    """Answers 500 to the message bodies in ``failing``."""
+
+    def __init__(self, *failing):
+        super().__init__()
+        self.failing = set(failing)
+
+    def respond(self, payload):
+        if payload["body"] in self.failing:
+            return Reply(500, {"error": "Failed"})
+        return super().respond(payload)
+
+
+# Pool threads use their own database connections, so the rows they read and
+# write have to be committed
+@override_settings(OUTBOUND_COALESCE_WINDOW=0, GATEWAY_TRANSPORT='http')
+class OutboundWorkerTests(TransactionTestCase):
+
+    def use_gateway(self, responder):
+        gateway = FakeGateway(responder).start()
+        client = GatewayClient(limiter=RateLimiter(0, 0, 0, 0), base_url=gateway.url)
+        previous = set_client(client)
+        self.addCleanup(gateway.stop)
+        self.addCleanup(client.close)
+        self.addCleanup(set_client, previous)
+
+    def make_due(self):
+        OutboundMessage.objects.filter(status=OutboundMessage.STATUS_PENDING).update(next_attempt_at=timezone.now())
+
+    def test_later_message_waits_while_an_earlier_one_backs_off(self):
+        enqueue_messages([("919800000001", "one"), ("919800000001", "two"), ("919800000002", "three")])
+        responder = FailingResponder("one")
+        self.use_gateway(responder)
+
+        self.assertEqual(OutboundWorker(threads=2, batch_size=10).drain(), (2, 1))
+
+        messages = {message.body: message for message in OutboundMessage.objects.all()}
+        self.assertEqual(messages["one"].status, OutboundMessage.STATUS_PENDING)
+        self.assertEqual(messages["one"].attempts, 1)
+        self.assertGreater(messages["one"].next_attempt_at, timezone.now())
+        self.assertEqual((messages["two"].status, messages["two"].attempts), (OutboundMessage.STATUS_PENDING, 0))
+        self.assertEqual([payload["body"] for payload in responder.messages], ["three"])
+
+        # "two" is due, but stays behind "one" until it has gone out
+        self.assertEqual(OutboundWorker(batch_size=10).drain(), (0, 0))
+        responder.failing.clear()
+        self.make_due()
+        self.assertEqual(OutboundWorker(threads=2, batch_size=10).drain(), (2, 2))
+        self.assertEqual([payload["body"] for payload in responder.messages], ["three", "one", "two"])
+
+    @override_settings(OUTBOUND_MAX_ATTEMPTS=3)
+    def test_message_is_dead_lettered_after_max_attempts(self):
+        enqueue_messages([("919800000001", "one"), ("919800000001", "two")])
+        self.use_gateway(FailingResponder("one"))
+        worker = OutboundWorker(batch_size=10)
+
+        for _ in range(2):
+            self.assertEqual(worker.drain(), (1, 0))
+            self.make_due()
+        # The last attempt gives up on "one", which no longer holds up "two"
+        self.assertEqual(worker.drain(), (2, 1))
+
+        dead = OutboundMessage.objects.get(body="one")
+        self.assertEqual((dead.status, dead.attempts), (OutboundMessage.STATUS_DEAD, 3))
+        self.assertIn("500", dead.last_error)
+        self.assertEqual(OutboundMessage.objects.get(body="two").status, OutboundMessage.STATUS_SENT)
+        self.make_due()
+        self.assertEqual(worker.drain(), (0, 0))
+
+
+@override_settings(GATEWAY_TRANSPORT='http')
+class GatewayClientTests(TestCase):
+
+    def gateway_client(self, responder, **kwargs):
+        gateway = FakeGateway(responder).start()
+        client = GatewayClient(limiter=RateLimiter(0, 0, 0, 0), base_url=gateway.url, **kwargs)
+        self.addCleanup(gateway.stop)
+        self.addCleanup(client.close)
+        return client
+
+    def test_sends_reuse_one_keep_alive_connection(self):
+        client = self.gateway_client(SimulatedGateway())
+
+        for i in range(5):
+            client.send_text("919800000001", f"Message {i}")
+
+        stats = client.stats()
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertAlmostEqual(stats["connection_reuse_rate"], 0.8)
+
+    def test_status_codes_are_counted(self):
+        client = self.gateway_client(FailingResponder("bad"))
+
+        client.send_text("919800000001", "ok")
+        with self.assertRaises(MessageDeliveryError):
+            client.send_text("919800000001", "bad")
+        client.send_text("919800000001", "ok")
+
+        stats = client.stats()
+        self.assertEqual((stats["requests"], stats["errors"]), (3, 0))
+        self.assertEqual(stats["status_codes"], {200: 2, 500: 1})
+
+    def test_slow_gateway_times_out(self):
+        client = self.gateway_client(SimulatedGateway(latency=0.5), read_timeout=0.05)
+
+        with self.assertRaises(requests.Timeout):
+            client.send_text("919800000001", "hello")
+
+        stats = client.stats()
+        self.assertEqual((stats["requests"], stats["errors"], stats["status_codes"]), (1, 1, {}))
+
+
+class OutboundRetryTests(TestCase):
+
+    @override_settings(OUTBOUND_RETRY_BACKOFF=30, OUTBOUND_RETRY_BACKOFF_MAX=3600)
+    def test_retry_delay_doubles_up_to_the_maximum_with_jitter(self):
+        for attempts, delay in [(1, 30), (2, 60), (5, 480), (8, 3600), (20, 3600)]:
+            for _ in range(20):
+                self.assertTrue(0.8 * delay <= retry_delay(attempts) <= 1.2 * delay, attempts)
+
+    @override_settings(OUTBOUND_CLAIM_TIMEOUT=300)
+    def test_stale_claims_are_released(self):
+        now = timezone.now()
+        stale, fresh = enqueue_messages([("919800000001", "stale"), ("919800000002", "fresh")])
+        OutboundMessage.objects.filter(id=stale.id).update(
+            status=OutboundMessage.STATUS_SENDING, claimed_by="crashed", claimed_at=now - datetime.timedelta(seconds=301),
+        )
+        OutboundMessage.objects.filter(id=fresh.id).update(
+            status=OutboundMessage.STATUS_SENDING, claimed_by="busy", claimed_at=now - datetime.timedelta(seconds=60),
+        )
+
+        self.assertEqual(release_stale_claims(now), 1)
+
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, stale.claimed_by, stale.claimed_at), (OutboundMessage.STATUS_PENDING, '', None))
+        self.assertEqual((fresh.status, fresh.claimed_by), (OutboundMessage.STATUS_SENDING, "busy"))
+        self.assertEqual([message.body for message in claim_batch("worker", 10)], ["stale"])
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimiterTests(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_global_bucket_allows_a_burst_then_refills(self):
+        limiter = RateLimiter(2, 3, 0, 0, clock=self.clock)
+
+        self.assertEqual([limiter.acquire(f"91980000000{i}") for i in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.acquire("919800000009"), 0.5)
+
+        self.clock.now = 0.5
+        self.assertEqual(limiter.acquire("919800000009"), 0)
+
+    def test_recipient_bucket_does_not_hold_up_others(self):
+        limiter = RateLimiter(0, 0, 0.5, 1, clock=self.clock)
+
+        self.assertEqual(limiter.acquire("919800000001"), 0)
+        self.assertAlmostEqual(limiter.acquire("919800000001"), 2.0)
+        self.assertEqual(limiter.acquire("919800000002"), 0)
+
+    def test_refused_send_takes_no_global_token(self):
+        limiter = RateLimiter(1, 1, 0.1, 1, clock=self.clock)
+        limiter.acquire("919800000001")
+        self.clock.now = 1.0
+
+        # The global bucket has refilled but the recipient's hasn't; the global
+        # token stays available for someone else
+        self.assertAlmostEqual(limiter.acquire("919800000001"), 9.0)
+        self.assertEqual(limiter.acquire("919800000002"), 0)
+
+
+class OutboundRateLimitTests(TestCase):
+
+    def use_gateway(self, gateway, limiter=None):
+        _async_clients[asyncio.get_running_loop()] = AsyncGatewayClient(
+            transport=httpx.MockTransport(gateway), limiter=limiter or RateLimiter(0, 0, 0, 0),
+        )
+
+    async def test_messages_to_one_recipient_are_sent_as_a_digest(self):
+        await aenqueue_messages([
+            ("919800000001", "one"), ("919800000002", "two"), ("919800000001", "three"), ("919800000001", "four"),
+        ])
+        sent = []
+
+        def gateway(request):
+            body = json.loads(request.content)
+            sent.append((body["to"], body["body"]))
+            return httpx.Response(200, json={})
+
+        self.use_gateway(gateway)
+        await OutboundWorker(batch_size=10).adrain()
+
+        self.assertEqual(sorted(sent), [
+            ("919800000001", DIGEST_SEPARATOR.join(["one", "three", "four"])),
+            ("919800000002", "two"),
+        ])
+        self.assertEqual(await OutboundMessage.objects.filter(status=OutboundMessage.STATUS_SENT).acount(), 4)
+
+    @override_settings(WHATSAPP_MESSAGE_LIMIT=10)
+    async def test_digest_stays_within_the_message_limit(self):
+        await aenqueue_messages([("919800000001", "aaaa"), ("919800000001", "bbbbbbbb")])
+        sent = []
+
+        def gateway(request):
+            sent.append(json.loads(request.content)["body"])
+            return httpx.Response(200, json={})
+
+        self.use_gateway(gateway)
+        await OutboundWorker(batch_size=10).adrain()
+
+        self.assertEqual(sent, ["aaaa", "bbbbbbbb"])
+
+    @override_settings(OUTBOUND_COALESCE_WINDOW=0)
+    async def test_rate_limited_message_is_deferred_without_using_an_attempt(self):
+        await aenqueue_messages([("919800000001", "one"), ("919800000001", "two"), ("919800000002", "three")])
+        sent = []
+
+        def gateway(request):
+            sent.append(json.loads(request.content)["body"])
+            return httpx.Response(200, json={})
+
+        self.use_gateway(gateway, limiter=RateLimiter(0, 0, 0.01, 1))
+        await OutboundWorker(batch_size=10).adrain()
+
+        self.assertEqual(sent, ["one", "three"])
+        deferred = await OutboundMessage.objects.aget(body="two")
+        self.assertEqual(deferred.status, OutboundMessage.STATUS_PENDING)
+        self.assertEqual(deferred.attempts, 0)
+        self.assertGreater(deferred.next_attempt_at, timezone.now() + datetime.timedelta(seconds=90))
+
+    async def test_gateway_429_waits_for_retry_after(self):
+        await aenqueue_messages([("919800000001", "one"), ("919800000001", "two")])
+
+        self.use_gateway(lambda request: httpx.Response(429, headers={"Retry-After": "30"}, json={}))
+        claimed, delivered = await OutboundWorker(batch_size=10).adrain()
+
+        self.assertEqual((claimed, delivered), (1, 0))
+        messages = [message async for message in OutboundMessage.objects.order_by('id')]
+        self.assertEqual([message.status for message in messages], ["pending", "pending"])
+        self.assertEqual([message.attempts for message in messages], [0, 0])
+        self.assertGreater(messages[0].next_attempt_at, timezone.now() + datetime.timedelta(seconds=25))
+
+
+@override_settings(GATEWAY_SIMULATED_LATENCY=0, GATEWAY_SIMULATED_ERROR_RATE=0, GATEWAY_SIMULATED_RATE_LIMIT=0)
+class GatewayTransportTests(TestCase):
+
+    def gateway_client(self):
+        return GatewayClient(limiter=RateLimiter(0, 0, 0, 0))
+
+    @override_settings(GATEWAY_TRANSPORT='memory')
+    def test_memory_transport_keeps_messages_without_sending(self):
+        sink = get_responder()
+        sink.clear()
+
+        self.gateway_client().send_text("919800000001", "hello")
+
+        self.assertEqual(sink.messages, [{"to": "919800000001", "body": "hello"}])
+
+    @override_settings(GATEWAY_TRANSPORT='simulated', GATEWAY_SIMULATED_RATE_LIMIT=1)
+    def test_simulated_gateway_answers_429_beyond_its_rate_limit(self):
+        get_responder().clear()
+        client = self.gateway_client()
+        client.send_text("919800000001", "one")
+
+        with self.assertRaises(RateLimited) as caught:
+            client.send_text("919800000002", "two")
+        self.assertGreater(caught.exception.retry_after, 0.5)
+        self.assertEqual(client.stats()["status_codes"], {200: 1, 429: 1})
+
+    async def test_recorded_traffic_is_replayed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            recording = os.path.join(directory, 'gateway.jsonl')
+            with override_settings(
+                GATEWAY_TRANSPORT='simulated', GATEWAY_SIMULATED_RATE_LIMIT=1, GATEWAY_RECORDING=recording,
+            ):
+                get_responder().clear()
+                client = self.gateway_client()
+                for to in ["919800000001", "919800000002"]:
+                    try:
+                        client.send_text(to, "hello")
+                    except RateLimited:
+                        pass
+
+            with override_settings(GATEWAY_TRANSPORT='replay', GATEWAY_RECORDING=recording):
+                client = AsyncGatewayClient(limiter=RateLimiter(0, 0, 0, 0))
+                await client.send_text("919800000003", "hello")
+                with self.assertRaises(RateLimited):
+                    await client.send_text("919800000004", "hello")
+                await client.aclose()
+
+        self.assertEqual(client.stats()["status_codes"], {200: 1, 429: 1})
+
+    @override_settings(GATEWAY_TRANSPORT='carrier-pigeon')
+    def test_unknown_transport_is_rejected(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.gateway_client()
@@ -0,0 +1,305 @@
+"""
+Pluggable transports for the gateway clients.
+
+``GATEWAY_TRANSPORT`` picks what a send reaches:
+
+- ``http`` - the gateway at ``GATEWAY_URL`` over the network (the default;
+  point ``GATEWAY_URL`` at ``manage.py run_fake_gateway`` for a local
+  stand-in),
+- ``memory`` - an in-memory sink that accepts everything and keeps it,
+- ``simulated`` - an in-process gateway with the latency, error rate and
+  rate limit of ``GATEWAY_SIMULATED_*``, answering 429 when throttled,
+- ``replay`` - plays back the status codes and latencies recorded in
+  ``GATEWAY_RECORDING``, in order.
+
+With any other transport, setting ``GATEWAY_RECORDING`` appends each
+exchange's status, latency and Retry-After (never the message) to that file
+as a JSON line, ready to be replayed.
+
+The non-HTTP transports are requests adapters and httpx transports around a
+"responder", so both clients, their stats and the outbound worker behave
+exactly as they do against the network.
+"""
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+
+import httpx
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+from .ratelimit import RateLimiter
+
+
+@dataclass
+class Reply:
+    """What a responder answers; a ``status_code`` of None drops the connection."""
+    status_code: int
+    body: dict = field(default_factory=dict)
+    retry_after: float = None
+    # Seconds to wait before answering
+    delay: float = 0.0
+
+    @property
+    def headers(self):
+        headers = {'Content-Type': 'application/json'}
+        if self.retry_after is not None:
+            headers['Retry-After'] = str(round(self.retry_after, 3))
+        return headers
+
+
+class SimulatedGateway:
+    """
+    A gateway that answers after ``latency`` seconds, fails ``error_rate`` of
+    the sends with a 500 and throttles beyond ``rate_limit`` sends per second
+    with a 429. With the defaults it is an in-memory sink.
+
+    Accepted messages are kept in ``messages``.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, rate_limit=0.0, seed=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.limiter = RateLimiter(rate_limit, max(int(rate_limit), 1), 0, 0) if rate_limit else None
+        self.random = random.Random(seed)
+        self.messages = []
+        self.failures = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def respond(self, payload):
+        if self.limiter is not None:
+            wait = self.limiter.acquire(payload.get('to', ''))
+            if wait:
+                with self._lock:
+                    self.throttled += 1
+                return Reply(429, {"error": "Too many requests"}, retry_after=wait)
+
+        with self._lock:
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.failures += 1
+                return Reply(500, {"error": "Simulated failure"}, delay=self.latency)
+            self.messages.append(payload)
+        return Reply(200, {"sent": True}, delay=self.latency)
+
+    def clear(self):
+        with self._lock:
+            self.messages.clear()
+            self.failures = 0
+            self.throttled = 0
+        if self.limiter is not None:
+            self.limiter.clear()
+
+
+class Replayer:
+    """Answers with the recorded exchanges in ``path``, in order, starting over at the end."""
+
+    def __init__(self, path):
+        try:
+            with open(path) as f:
+                self.exchanges = [json.loads(line) for line in f if line.strip()]
+        except OSError as e:
+            raise ImproperlyConfigured(f"Cannot read gateway recording {path!r}: {e}")
+        if not self.exchanges:
+            raise ImproperlyConfigured(f"Gateway recording {path!r} is empty")
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def respond(self, payload):
+        with self._lock:
+            exchange = self.exchanges[next(self._next) % len(self.exchanges)]
+        status_code = exchange['status']
+        body = {"sent": True} if status_code == 200 else {"error": "Replayed failure"}
+        return Reply(status_code, body, retry_after=exchange.get('retry_after'), delay=exchange['latency'])
+
+
+class Recorder:
+    """Appends one JSON line per exchange to ``path``."""
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.monotonic()
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def record(self, status_code, latency, retry_after=None):
+        line = json.dumps({
+            "at": round(time.monotonic() - self.started, 4),
+            "status": status_code,
+            "latency": round(latency, 4),
+            "retry_after": retry_after,
+        })
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+
+def response_retry_after(response):
+    value = response.headers.get('Retry-After')
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class ResponderAdapter(BaseAdapter):
+    """A requests adapter that hands every request to a responder."""
+
+    def __init__(self, responder):
+        super().__init__()
+        self.responder = responder
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        reply = self.responder.respond(json.loads(request.body or b'{}'))
+        if reply.delay:
+            time.sleep(reply.delay)
+        if reply.status_code is None:
+            raise requests.ConnectionError("Connection dropped by the gateway", request=request)
+
+        response = requests.Response()
+        response.status_code = reply.status_code
+        response.headers.update(reply.headers)
+        response._content = json.dumps(reply.body).encode()
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class RecordingAdapter(BaseAdapter):
+    """Wraps another requests adapter and records each exchange."""
+
+    def __init__(self, adapter, recorder):
+        super().__init__()
+        self.adapter = adapter
+        self.recorder = recorder
+
+    @property
+    def poolmanager(self):
+        return getattr(self.adapter, 'poolmanager', None)
+
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        try:
+            response = self.adapter.send(request, **kwargs)
+        except requests.RequestException:
+            self.recorder.record(None, time.monotonic() - started)
+            raise
+        self.recorder.record(response.status_code, time.monotonic() - started, response_retry_after(response))
+        return response
+
+    def close(self):
+        self.adapter.close()
+
+
+class ResponderTransport(httpx.AsyncBaseTransport):
+    """An httpx transport that hands every request to a responder."""
+
+    def __init__(self, responder):
+        self.responder = responder
+
+    async def handle_async_request(self, request):
+        reply = self.responder.respond(json.loads(await request.aread() or b'{}'))
+        if reply.delay:
+            await asyncio.sleep(reply.delay)
+        if reply.status_code is None:
+            raise httpx.ConnectError("Connection dropped by the gateway", request=request)
+        return httpx.Response(reply.status_code, json=reply.body, headers=reply.headers)
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Wraps another httpx transport and records each exchange."""
+
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+
+    async def handle_async_request(self, request):
+        started = time.monotonic()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.HTTPError:
+            self.recorder.record(None, time.monotonic() - started)
+            raise
+        self.recorder.record(response.status_code, time.monotonic() - started, response_retry_after(response))
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+TRANSPORTS = ('http', 'memory', 'simulated', 'replay')
+
+# One responder and recorder per process, shared by the sync and async clients
+_responders = {}
+_recorders = {}
+_lock = threading.Lock()
+
+
+def get_responder():
+    """The responder for ``GATEWAY_TRANSPORT``, or None for ``http``."""
+    name = settings.GATEWAY_TRANSPORT
+    if name not in TRANSPORTS:
+        raise ImproperlyConfigured(f"GATEWAY_TRANSPORT must be one of {', '.join(TRANSPORTS)}, not {name!r}")
+    if name == 'http':
+        return None
+    if name == 'simulated':
+        key = (name, settings.GATEWAY_SIMULATED_LATENCY, settings.GATEWAY_SIMULATED_ERROR_RATE,
+               settings.GATEWAY_SIMULATED_RATE_LIMIT)
+    elif name == 'replay':
+        key = (name, settings.GATEWAY_RECORDING)
+    else:
+        key = (name,)
+    with _lock:
+        if key not in _responders:
+            if name == 'memory':
+                _responders[key] = SimulatedGateway()
+            elif name == 'simulated':
+                _responders[key] = SimulatedGateway(latency=key[1], error_rate=key[2], rate_limit=key[3])
+            else:
+                _responders[key] = Replayer(settings.GATEWAY_RECORDING)
+        return _responders[key]
+
+
+def get_recorder():
+    """The recorder for ``GATEWAY_RECORDING``, or None when not recording."""
+    path = settings.GATEWAY_RECORDING
+    if not path or settings.GATEWAY_TRANSPORT == 'replay':
+        return None
+    with _lock:
+        if path not in _recorders:
+            _recorders[path] = Recorder(path)
+        return _recorders[path]
+
+
+def build_adapter(pool_size):
+    """The requests adapter ``GatewayClient`` mounts for the configured transport."""
+    responder = get_responder()
+    if responder is None:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    else:
+        adapter = ResponderAdapter(responder)
+    recorder = get_recorder()
+    return RecordingAdapter(adapter, recorder) if recorder else adapter
+
+
+def build_async_transport(pool_size):
+    """The httpx transport ``AsyncGatewayClient`` uses for the configured transport."""
+    responder = get_responder()
+    if responder is None:
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+    else:
+        transport = ResponderTransport(responder)
+    recorder = get_recorder()
+    return RecordingTransport(transport, recorder) if recorder else transport
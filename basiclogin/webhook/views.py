@@ -1,176 +1,177 @@
 import json
-import re
-import uuid
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from users.models import User
-from .services import send_message, get_contact_numbers, TaskService, mark_task_as_done
-from rest_framework.decorators import api_view
-tasks_storage = TaskService()
+from django.views.decorators.http import require_POST
+from basiclogin.log import log_request_body
+from users.directory import contact_directory
+from users.models import User, normalize_phone_number
+from .commands import commands, dispatch_message, CommandContext
+from .queue import enqueue_messages
+from .ingest import aclaim_new_messages, arelease_messages
+
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_senders(messages):
+    """
+    Look up the users who sent a batch of messages in the contact directory,
+    reading the ones it doesn't hold with a single query.
+
+    Senders of TASK commands who are not users yet are created, since they
+    become the task's creator.
+
+    Returns:
+        dict: Canonical phone number -> User
+    """
+    senders = contact_directory.users_for(message.get('from', '') for message in messages)
+
+    new_creators = {
+        normalize_phone_number(message.get('from', ''))
+        for message in messages
+        if commands.identify(message_text(message)) == 'TASK'
+    } - set(senders) - {''}
+    if new_creators:
+        User.objects.bulk_create([User(phone_number=number) for number in new_creators], ignore_conflicts=True)
+        contact_directory.forget_phones(new_creators)
+        senders.update(contact_directory.users_for(new_creators))
+    return senders
 
 
-def parse_task_completion(text):
+def message_text(message):
+    text = message.get('text') or {}
+    return (text.get('body') or '').strip() if isinstance(text, dict) else ''
+
+
+def process_message(message, sender, replies):
     """
-    Parse a task completion message to extract the task ID.
-    
+    Run the command in a single webhook message.
+
     Args:
-        text (str): The message text, e.g., "DONE task-id-here"
-        
+        message (dict): One entry of the payload's ``messages`` list.
+        sender (User): The resolved sender, or None if they are not a user.
+        replies (list): Outgoing (phone_number, text) pairs are appended here.
+
     Returns:
-        tuple: (task_id, error_message) - If successful, error_message will be None
+        dict: The outcome reported for this message in the webhook response.
+    """
+    received_text = message_text(message)
+    from_number = normalize_phone_number(message.get('from', ''))
+
+    if not received_text or not from_number:
+        logger.warning(
+            "Missing required fields in webhook message: text=%s, from_number=%s", bool(received_text), bool(from_number),
+        )
+        return {"status": "Missing required fields"}
+
+    return dispatch_message(received_text, CommandContext(from_number, sender, replies))
+
+
+def process_batch(messages):
+    """
+    Resolve the senders of ``messages`` and run each one's command.
+
+    A failing message gets an apology reply and does not stop the rest.
+
+    Returns:
+        tuple: (results, replies) - The outcome of each message and the
+        (phone_number, text) pairs to send.
+    """
+    senders = resolve_senders(messages)
+
+    replies = []
+    results = []
+    for message in messages:
+        from_number = normalize_phone_number(message.get('from', ''))
+        message_replies = []
+        try:
+            # A savepoint, so a failed command leaves the batch's transaction usable
+            with transaction.atomic():
+                result = process_message(message, senders.get(from_number), message_replies)
+        except Exception as e:
+            logger.exception("Error processing webhook message %s", message.get('id'))
+            message_replies = [(from_number, 'Sorry, there was an error processing your request.')] if from_number else []
+            result = {"status": "Error processed", "error": str(e)}
+        replies.extend(message_replies)
+        results.append({"id": message.get('id'), **result})
+    return results, replies
+
+
+def process_and_queue(messages):
+    """
+    Run ``process_batch`` and queue its replies in one transaction, so that
+    either both are saved or neither is.
+
+    Returns:
+        list: The outcome of each message.
     """
-    parts = text.strip().split()
-    if len(parts) < 2:
-        return None, "Please provide a task ID. Format: DONE task-id"
-    
-    task_id = parts[1].strip()
-    
-    # Validate UUID format
     try:
-        uuid_obj = uuid.UUID(task_id)
-        return str(uuid_obj), None
-    except ValueError:
-        return None, f"Invalid task ID format: {task_id}. Please provide a valid task ID."
+        with transaction.atomic():
+            results, replies = process_batch(messages)
+            enqueue_messages(replies)
+    except Exception:
+        # Senders created by the rolled back transaction may be cached
+        contact_directory.forget_phones({normalize_phone_number(message.get('from', '')) for message in messages})
+        raise
+    return results
 
 
 @csrf_exempt
-@api_view(['POST'])
-def whatsapp_webhook(request):
+@require_POST
+async def whatsapp_webhook(request):
+    """
+    Process every message in a gateway payload as one batch.
+
+    Senders are resolved with one query, each message's command runs on its
+    own (a failing message does not stop the rest), and all replies are queued
+    with a single bulk insert. The response lists the outcome of each message.
+
+    Messages the gateway redelivers are recognised by their ID and only
+    acknowledged, so a retried TASK never creates a second task. The commands
+    and their replies are saved in one transaction; if it fails, nothing is
+    kept and the messages are released, so the gateway's next redelivery is
+    processed.
+
+    The view is async: under ASGI the worker's event loop keeps serving other
+    requests while this one waits on the database. Command handlers are
+    synchronous and transactional, so the batch runs in a worker thread.
+    """
+    # Safely parse the request body
     try:
-        if request.method != 'POST':
-            return JsonResponse({"error": "Invalid request method"}, status=400)
+        data = json.loads(request.body)
+    except json.JSONDecodeError as e:
+        logger.warning("Invalid JSON in webhook request: %s", e)
+        return JsonResponse({"status": "Invalid request format"}, status=200)  # Return 200 to acknowledge receipt
+    log_request_body(logger, "Webhook", data)
+
+    # Safely extract message data with better error handling
+    messages = [message for message in data.get('messages') or [] if isinstance(message, dict)]
+    if not messages:
+        logger.info("No messages in webhook request")
+        return JsonResponse({"status": "No messages found"}, status=200)  # Return 200 to acknowledge receipt
 
-        # Safely parse the request body
-        try:
-            data = json.loads(request.body)
-        except json.JSONDecodeError as e:
-            print(f"Invalid JSON in webhook request: {str(e)}")
-            return JsonResponse({"status": "Invalid request format"}, status=200)  # Return 200 to acknowledge receipt
-            
-        # Safely extract message data with better error handling
-        messages = data.get('messages', [])
-        if not messages:
-            print("No messages in webhook request")
-            return JsonResponse({"status": "No messages found"}, status=200)  # Return 200 to acknowledge receipt
-            
-        message = messages[0]
-        text = message.get('text', {}).get('body', '')
-        from_number = message.get('from', '')
-
-        if not text or not from_number:
-            print(f"Missing required fields in webhook request: text={bool(text)}, from_number={bool(from_number)}")
-            return JsonResponse({"status": "Missing required fields"}, status=200)  # Return 200 to acknowledge receipt
-
-        received_text = text.strip()
-        valid_commands = ['task', 'list', 'tasks for', 'done']
-        is_valid_command = any(received_text.lower().startswith(cmd) for cmd in valid_commands)
-
-        if received_text.lower().startswith('done'):
-            # Handle task completion
-            task_id, error = parse_task_completion(received_text)
-            if error:
-                send_message(from_number, error)
-                return JsonResponse({"status": "Task completion error"}, status=200)
-            
-            # Attempt to mark task as done
-            success, message = mark_task_as_done(task_id, from_number)
-            
-            # Send appropriate message back to the user
-            send_message(from_number, message)
-            
-            return JsonResponse({"status": "Task completion processed", "success": success}, status=200)
-
-        if not is_valid_command:
-            # For unrecognized commands, just acknowledge receipt without error
-            print(f"Received unrecognized message: {received_text[:50]}...")
-            return JsonResponse({"status": "Message received (not a command)"}, status=200)
-
-        print(f"Processing command: {received_text}")
-
-        # TASK command
-        if received_text.upper().startswith("TASK"):
-            parts = [p.strip() for p in received_text.split(',')]
-            people_input = parts[1] if len(parts) > 1 else ''
-            people_match = re.match(r"\[(.*?)\]", people_input)
-
-            if not people_input or not people_match:
-                send_message(from_number, 'People must be enclosed in square brackets. Example: TASK, [John|Sarah], 2025-06-30, Project proposal')
-                return JsonResponse({"status": "People input error"}, status=200)
-            people = [p.strip() for p in people_match.group(1).split('|')]
-            contact_numbers = get_contact_numbers(people)
-
-            deadline = ''
-            notes = ''
-            if len(parts) >= 3:
-                potential_deadline = parts[2]
-                if re.match(r"\d{4}-\d{2}-\d{2}", potential_deadline):
-                    deadline = potential_deadline
-                    notes = ', '.join(parts[3:])
-                else:
-                    notes = ', '.join(parts[2:])
-
-            # Get or create the user for the sender
-            sender_user, _ = User.objects.get_or_create(phone_number=from_number)
-            # Get assigned users
-            assigned_users = [contact_numbers[p] for p in people]
-            task = tasks_storage.add_task(notes, created_by_id=from_number, assigned_to_ids=assigned_users, deadline=deadline)
-            task_message = f"New Task (ID: {task['id']}):\n"
-            task_message += f"👥 People: {', '.join(people)}\n"
-            if deadline:
-                task_message += f"📅 Deadline: {deadline}\n"
-            task_message += f"📝 Notes: {notes or 'No additional notes'}\n"
-            task_message += "📱 Contact Numbers:\n" + '\n'.join([f"{name}: {number}" for name, number in contact_numbers.items()])
-
-            send_message(from_number, task_message)
-
-            for name, number in contact_numbers.items():
-                if number != from_number:
-                    try:
-                        send_message(number, task_message)
-                    except Exception as send_error:
-                        print(f"Error sending message to {name} ({number}): {send_error}")
-
-        # LIST command
-        elif received_text.lower() == "list":
-            tasks = tasks_storage.list_tasks()
-            task_list_message = "\n\n".join([
-                f"ID: {task.id}\n👥 People: {', '.join(task.people)}\n📅 Deadline: {task.deadline}\n📝 Notes: {task.notes or 'No notes'}\n🔖 Status: {task.status}"
-                for task in tasks
-            ]) or 'No tasks found.'
-            send_message(from_number, f"Tasks:\n\n{task_list_message}")
-
-        # TASKS FOR command
-        elif received_text.lower().startswith("tasks for"):
-            person_name = received_text.split('tasks for', 1)[1].strip()
-            person_tasks = tasks_storage.get_tasks_for_person(person_name)
-            task_list_message = "\n\n".join([
-                f"ID: {task.id}\n👥 People: {', '.join(task.people)}\n📅 Deadline: {task.deadline}\n📝 Notes: {task.notes or 'No notes'}\n🔖 Status: {task.status}"
-                for task in person_tasks
-            ]) or f"No tasks found for {person_name}."
-            send_message(from_number, f"Tasks for {person_name}:\n\n{task_list_message}")
-
-        return JsonResponse({"status": "success"}, status=200)
+    try:
+        messages, duplicates = await aclaim_new_messages(messages)
+    except Exception as e:
+        logger.exception("Error recording webhook messages")
+        return JsonResponse({"status": "Error processed", "error": str(e)}, status=200)
+
+    # Redelivered messages were handled the first time, just acknowledge them
+    duplicate_results = [{"id": message_id, "status": "duplicate"} for message_id in duplicates]
+    if not messages:
+        return JsonResponse({"status": "success", "processed": 0, "results": duplicate_results}, status=200)
 
+    try:
+        results = await sync_to_async(process_and_queue)(messages)
     except Exception as e:
-        print(f"Error processing webhook: {str(e)}")
-        # Try to extract from_number if possible
-        try:
-            # Try to get the from_number from the request if it exists
-            try:
-                data = json.loads(request.body)
-                messages = data.get('messages', [])
-                if messages:
-                    from_number = messages[0].get('from', '')
-                else:
-                    from_number = ''
-            except Exception:
-                from_number = ''
-                
-            # Only try to send a message if we have a valid number
-            if from_number:
-                send_message(from_number, 'Sorry, there was an error processing your request.')
-        except Exception as send_error:
-            print(f"Error sending error message: {str(send_error)}")
-            
-        # Always return a 200 status to acknowledge receipt
+        logger.exception("Error processing webhook batch")
+        await arelease_messages(messages)
         return JsonResponse({"status": "Error processed", "error": str(e)}, status=200)
+    results.extend(duplicate_results)
+
+    # Always return a 200 status to acknowledge receipt
+    return JsonResponse({"status": "success", "processed": len(results) - len(duplicate_results), "results": results}, status=200)